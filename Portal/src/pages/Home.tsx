@@ -54,6 +54,25 @@ type AdminUser = {
   apps?: string[];
 };
 
+type ListingPage = {
+  next_cursor?: string | null;
+  total?: number | null;
+  total_estimated?: boolean;
+};
+
+type ListingTotal = {
+  total: number | null;
+  estimated: boolean;
+};
+
+const LISTING_PAGE_SIZE = 100;
+
+function describeTotal(shown: number, listingTotal: ListingTotal | null, noun: string) {
+  if (!listingTotal || listingTotal.total === null) return `Showing ${shown} ${noun}`;
+  const prefix = listingTotal.estimated ? "about " : "";
+  return `Showing ${shown} of ${prefix}${listingTotal.total} ${noun}`;
+}
+
 type HomeProps = {
   email: string;
   userType: string;
@@ -67,6 +86,13 @@ export default function Home({ email, userType, onLogout }: HomeProps) {
   const [isSubmitting, setIsSubmitting] = useState(false);
   const [requests, setRequests] = useState<AppRequest[]>([]);
   const [isLoadingRequests, setIsLoadingRequests] = useState(false);
+  const [requestsStatusFilter, setRequestsStatusFilter] = useState<"pending" | "approved" | "denied" | undefined>(
+    undefined,
+  );
+  const [requestsEmailPrefix, setRequestsEmailPrefix] = useState("");
+  const [requestsAppPrefix, setRequestsAppPrefix] = useState("");
+  const [requestsCursor, setRequestsCursor] = useState<string | null>(null);
+  const [requestsTotal, setRequestsTotal] = useState<ListingTotal | null>(null);
   const [apps, setApps] = useState<AdminApp[]>([]);
   const [isLoadingApps, setIsLoadingApps] = useState(false);
   const [ownedApps, setOwnedApps] = useState<OwnedApp[]>([]);
@@ -85,6 +111,10 @@ export default function Home({ email, userType, onLogout }: HomeProps) {
   const [deleteObjectUserId, setDeleteObjectUserId] = useState("");
   const [adminUsers, setAdminUsers] = useState<AdminUser[]>([]);
   const [adminUsersFilterApp, setAdminUsersFilterApp] = useState("");
+  const [adminUsersEmailPrefix, setAdminUsersEmailPrefix] = useState("");
+  const [adminUsersRole, setAdminUsersRole] = useState("");
+  const [adminUsersCursor, setAdminUsersCursor] = useState<string | null>(null);
+  const [adminUsersTotal, setAdminUsersTotal] = useState<ListingTotal | null>(null);
   const [isLoadingAdminUsers, setIsLoadingAdminUsers] = useState(false);
   const [newAdminAppName, setNewAdminAppName] = useState("");
   const [newOwnerEmail, setNewOwnerEmail] = useState("");
@@ -97,19 +127,28 @@ export default function Home({ email, userType, onLogout }: HomeProps) {
   const [reviewingIds, setReviewingIds] = useState<Record<string, boolean>>({});
   const { toast } = useToast();
 
-  const loadRequests = async (statusFilter?: "pending" | "approved" | "denied") => {
+  // Passing a cursor appends the next page to the requests already shown.
+  const loadRequests = async (statusFilter?: "pending" | "approved" | "denied", cursor?: string | null) => {
     setIsLoadingRequests(true);
     try {
-      const query = statusFilter ? `?status_filter=${statusFilter}` : "";
-      const response = await apiFetch(`/app_creation_requests${query}`, {
+      const params = new URLSearchParams({ limit: String(LISTING_PAGE_SIZE) });
+      if (statusFilter) params.set("status_filter", statusFilter);
+      if (requestsEmailPrefix.trim()) params.set("email_prefix", requestsEmailPrefix.trim());
+      if (requestsAppPrefix.trim()) params.set("app_prefix", requestsAppPrefix.trim());
+      if (cursor) params.set("cursor", cursor);
+      const response = await apiFetch(`/app_creation_requests?${params.toString()}`, {
         credentials: "include",
       });
       if (!response.ok) {
         const errorData = await response.json().catch(() => ({}));
         throw new Error(errorData.detail || "Failed to load requests");
       }
-      const data = (await response.json()) as { requests: AppRequest[] };
-      setRequests(data.requests ?? []);
+      const data = (await response.json()) as { requests: AppRequest[] } & ListingPage;
+      const page = data.requests ?? [];
+      setRequests((prev) => (cursor ? [...prev, ...page] : page));
+      setRequestsStatusFilter(statusFilter);
+      setRequestsCursor(data.next_cursor ?? null);
+      setRequestsTotal({ total: data.total ?? null, estimated: !!data.total_estimated });
     } catch (error) {
       toast({
         title: "Could not load requests",
@@ -202,17 +241,25 @@ export default function Home({ email, userType, onLogout }: HomeProps) {
     }
   };
 
-  const loadAdminUsers = async (appFilter?: string) => {
+  // Passing a cursor appends the next page to the users already shown.
+  const loadAdminUsers = async (appFilter?: string, cursor?: string | null) => {
     setIsLoadingAdminUsers(true);
     try {
-      const q = appFilter?.trim() ? `?app_name=${encodeURIComponent(appFilter.trim())}` : "";
-      const response = await apiFetch(`/admin/users${q}`, { credentials: "include" });
+      const params = new URLSearchParams({ limit: String(LISTING_PAGE_SIZE) });
+      if (appFilter?.trim()) params.set("app_name", appFilter.trim());
+      if (adminUsersEmailPrefix.trim()) params.set("email_prefix", adminUsersEmailPrefix.trim());
+      if (adminUsersRole) params.set("user_type", adminUsersRole);
+      if (cursor) params.set("cursor", cursor);
+      const response = await apiFetch(`/admin/users?${params.toString()}`, { credentials: "include" });
       if (!response.ok) {
         const errorData = await response.json().catch(() => ({}));
         throw new Error(errorData.detail || "Failed to load users");
       }
-      const data = (await response.json()) as { users: AdminUser[] };
-      setAdminUsers(data.users ?? []);
+      const data = (await response.json()) as { users: AdminUser[] } & ListingPage;
+      const page = data.users ?? [];
+      setAdminUsers((prev) => (cursor ? [...prev, ...page] : page));
+      setAdminUsersCursor(data.next_cursor ?? null);
+      setAdminUsersTotal({ total: data.total ?? null, estimated: !!data.total_estimated });
     } catch (error) {
       toast({
         title: "Could not load users",
@@ -903,16 +950,44 @@ export default function Home({ email, userType, onLogout }: HomeProps) {
               </form>
             ) : activeTab === "users" ? (
               <div className="space-y-3">
-                <div className="flex gap-2">
+                <form
+                  className="flex flex-wrap gap-2"
+                  onSubmit={(e) => {
+                    e.preventDefault();
+                    loadAdminUsers(adminUsersFilterApp);
+                  }}
+                >
                   <Input
+                    className="flex-1 min-w-40"
                     value={adminUsersFilterApp}
                     onChange={(e) => setAdminUsersFilterApp(e.target.value)}
                     placeholder="Filter by app name (optional)"
                   />
-                  <Button type="button" onClick={() => loadAdminUsers(adminUsersFilterApp)}>
+                  <Input
+                    className="flex-1 min-w-40"
+                    value={adminUsersEmailPrefix}
+                    onChange={(e) => setAdminUsersEmailPrefix(e.target.value)}
+                    placeholder="Email starts with (optional)"
+                  />
+                  <select
+                    value={adminUsersRole}
+                    onChange={(e) => setAdminUsersRole(e.target.value)}
+                    className="rounded-md border border-input bg-transparent px-3 py-2 text-sm shadow-sm"
+                  >
+                    <option value="">Any role</option>
+                    <option value="user">User</option>
+                    <option value="developer">Developer</option>
+                    <option value="admin">Admin</option>
+                  </select>
+                  <Button type="submit" disabled={isLoadingAdminUsers}>
                     Load
                   </Button>
-                </div>
+                </form>
+                {adminUsersTotal ? (
+                  <p className="text-sm text-muted-foreground">
+                    {describeTotal(adminUsers.length, adminUsersTotal, "users")}
+                  </p>
+                ) : null}
                 {adminUsers.map((u) => (
                   <div key={`${u.email}-${u.app_name ?? "na"}`} className="border rounded-md p-3 space-y-2">
                     <div className="font-medium">{u.email}</div>
@@ -939,9 +1014,47 @@ export default function Home({ email, userType, onLogout }: HomeProps) {
                 {!isLoadingAdminUsers && adminUsers.length === 0 ? (
                   <p className="text-sm text-muted-foreground">No users to show.</p>
                 ) : null}
+                {adminUsersCursor ? (
+                  <Button
+                    type="button"
+                    variant="outline"
+                    disabled={isLoadingAdminUsers}
+                    onClick={() => loadAdminUsers(adminUsersFilterApp, adminUsersCursor)}
+                  >
+                    {isLoadingAdminUsers ? "Loading..." : "Load more"}
+                  </Button>
+                ) : null}
               </div>
             ) : (
               <div className="space-y-3">
+                <form
+                  className="flex flex-wrap gap-2"
+                  onSubmit={(e) => {
+                    e.preventDefault();
+                    loadRequests(requestsStatusFilter);
+                  }}
+                >
+                  <Input
+                    className="flex-1 min-w-40"
+                    value={requestsAppPrefix}
+                    onChange={(e) => setRequestsAppPrefix(e.target.value)}
+                    placeholder="App name starts with (optional)"
+                  />
+                  <Input
+                    className="flex-1 min-w-40"
+                    value={requestsEmailPrefix}
+                    onChange={(e) => setRequestsEmailPrefix(e.target.value)}
+                    placeholder="Requester email starts with (optional)"
+                  />
+                  <Button type="submit" disabled={isLoadingRequests}>
+                    Search
+                  </Button>
+                </form>
+                {requestsTotal ? (
+                  <p className="text-sm text-muted-foreground">
+                    {describeTotal(requests.length, requestsTotal, "requests")}
+                  </p>
+                ) : null}
                 {(activeTab === "open" ? pendingRequests : reviewedRequests).map((request) => (
                   <div key={request.id} className="border rounded-md p-3 space-y-2">
                     <div className="font-semibold">{request.requested_app_name}</div>
@@ -976,6 +1089,16 @@ export default function Home({ email, userType, onLogout }: HomeProps) {
                 (activeTab === "open" ? pendingRequests.length === 0 : reviewedRequests.length === 0) ? (
                   <p className="text-sm text-muted-foreground">No requests to show.</p>
                 ) : null}
+                {requestsCursor ? (
+                  <Button
+                    type="button"
+                    variant="outline"
+                    disabled={isLoadingRequests}
+                    onClick={() => loadRequests(requestsStatusFilter, requestsCursor)}
+                  >
+                    {isLoadingRequests ? "Loading..." : "Load more"}
+                  </Button>
+                ) : null}
               </div>
             )}
           </div>
@@ -1269,6 +1392,16 @@ export default function Home({ email, userType, onLogout }: HomeProps) {
                 {!isLoadingRequests && requests.length === 0 ? (
                   <p className="text-sm text-muted-foreground">No requests yet.</p>
                 ) : null}
+                {requestsCursor ? (
+                  <Button
+                    type="button"
+                    variant="outline"
+                    disabled={isLoadingRequests}
+                    onClick={() => loadRequests(requestsStatusFilter, requestsCursor)}
+                  >
+                    {isLoadingRequests ? "Loading..." : "Load more"}
+                  </Button>
+                ) : null}
               </div>
             )}
           </div>
@@ -5,6 +5,11 @@ import path from "path";
 export default defineConfig({
   base: "/portal/",
   plugins: [react()],
+  build: {
+    // dist/.vite/manifest.json tells the API which files are content-hashed
+    // and can be cached as immutable.
+    manifest: true,
+  },
   resolve: {
     alias: {
       "@": path.resolve(__dirname, "./src"),
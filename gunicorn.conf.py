@@ -0,0 +1,165 @@
+"""gunicorn settings for main:app, sized from the machine it starts on.
+
+Every value can be overridden through the environment; see "Running in
+production" in the README. Start it with `python serve.py` or
+`gunicorn -c gunicorn.conf.py main:app`.
+"""
+import math
+import os
+import sys
+from pathlib import Path
+
+
+def env_int(name: str, default: int) -> int:
+    value = os.environ.get(name, "").strip()
+    return int(value) if value else default
+
+
+def env_float(name: str, default: float) -> float:
+    value = os.environ.get(name, "").strip()
+    return float(value) if value else default
+
+
+def read_cgroup(path: str) -> str | None:
+    try:
+        return Path(path).read_text().strip()
+    except OSError:
+        return None
+
+
+def available_cpus() -> float:
+    """CPUs this process may use: affinity mask, then any cgroup CPU quota."""
+    try:
+        cpus = float(len(os.sched_getaffinity(0)))
+    except AttributeError:
+        cpus = float(os.cpu_count() or 1)
+    quota = None
+    cpu_max = read_cgroup("/sys/fs/cgroup/cpu.max")  # cgroup v2: "<quota> <period>" or "max <period>"
+    if cpu_max and not cpu_max.startswith("max"):
+        limit, period = cpu_max.split()
+        quota = int(limit) / int(period)
+    else:
+        limit, period = read_cgroup("/sys/fs/cgroup/cpu/cpu.cfs_quota_us"), read_cgroup("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+        if limit and period and int(limit) > 0:
+            quota = int(limit) / int(period)
+    return min(cpus, quota) if quota else cpus
+
+
+def available_memory_mb() -> int:
+    """Memory this process may use: physical memory, then any cgroup limit."""
+    try:
+        memory = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        memory = 0
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        limit = read_cgroup(path)
+        if limit and limit.isdigit() and (not memory or int(limit) < memory):
+            memory = int(limit)
+            break
+    return memory // (1024 * 1024)
+
+
+def worker_count(cpus: float, memory_mb: int) -> int:
+    # Heroku and most PaaS set WEB_CONCURRENCY from the dyno size; trust it.
+    if os.environ.get("WEB_CONCURRENCY", "").strip():
+        return max(1, env_int("WEB_CONCURRENCY", 1))
+    # Handlers block the event loop on pymongo calls, so more than one worker
+    # per core keeps the CPU busy while another waits on the database.
+    by_cpu = math.ceil(cpus * env_float("WORKERS_PER_CORE", 2.0))
+    by_memory = by_cpu
+    if memory_mb:
+        usable_mb = memory_mb - env_int("RESERVED_MEMORY_MB", 256)
+        by_memory = usable_mb // env_int("WORKER_MEMORY_MB", 256)
+    return max(1, min(by_cpu, by_memory, env_int("MAX_WORKERS", 32)))
+
+
+def event_loop_implementations() -> tuple[str, str]:
+    """What uvicorn's "auto" loop and http settings resolve to in this install."""
+    try:
+        import uvloop  # noqa: F401
+
+        loop = "uvloop"
+    except ImportError:
+        loop = "asyncio"
+    try:
+        import httptools  # noqa: F401
+
+        http = "httptools"
+    except ImportError:
+        http = "h11"
+    return loop, http
+
+
+CPUS = available_cpus()
+MEMORY_MB = available_memory_mb()
+
+bind = os.environ.get("BIND") or f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+# Pending connections the kernel queues while every worker is busy; capped by
+# net.core.somaxconn.
+backlog = env_int("BACKLOG", 2048)
+
+workers = worker_count(CPUS, MEMORY_MB)
+# uvicorn picks uvloop and httptools on its own when they are installed (see
+# requirements.txt); when_ready logs which ones are in use.
+worker_class = "uvicorn.workers.UvicornWorker"
+# Heartbeat files on tmpfs, so a slow disk can't make healthy workers look hung.
+worker_tmp_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+# Recycle each worker after a randomized number of requests so slow memory
+# growth stays bounded and workers don't all restart at once.
+max_requests = env_int("MAX_REQUESTS", 10000)
+max_requests_jitter = env_int("MAX_REQUESTS_JITTER", max_requests // 10)
+
+# Longer than the usual 60s load balancer idle timeout, so the proxy closes
+# idle connections rather than racing us to it.
+keepalive = env_int("KEEPALIVE_SECONDS", 75)
+timeout = env_int("WORKER_TIMEOUT_SECONDS", 30)
+graceful_timeout = env_int("GRACEFUL_TIMEOUT_SECONDS", 30)
+
+# Same switch main.py uses to run startup tasks once in the master. A preloaded
+# app is not re-imported on SIGHUP, so code changes need a full restart.
+preload_app = os.environ.get("PRELOAD_STARTUP", "").strip().lower() in {"1", "true", "yes"}
+# Restart workers when source files change. Development only.
+reload = os.environ.get("GUNICORN_RELOAD", "").strip().lower() in {"1", "true", "yes"}
+
+accesslog = os.environ.get("ACCESS_LOG") or None
+errorlog = "-"
+loglevel = os.environ.get("LOG_LEVEL", "info")
+
+
+def when_ready(server):
+    loop, http = event_loop_implementations()
+    server.log.info(
+        f"Serving with {server.cfg.workers} workers ({CPUS:g} CPUs, {MEMORY_MB} MiB), "
+        f"loop={loop}, http={http}, max_requests={server.cfg.max_requests}"
+        f"+{server.cfg.max_requests_jitter}"
+    )
+
+
+def post_worker_init(worker):
+    """Fail fast if a preloaded worker inherited an unusable Mongo client.
+
+    A closed client raises InvalidOperation on every call, so the worker exits
+    with gunicorn's boot-error code and the master stops instead of serving
+    errors. An unreachable database only logs a warning; it may come back.
+    """
+    if not worker.cfg.preload_app:
+        return
+    import pymongo
+    from pymongo.errors import InvalidOperation, PyMongoError
+
+    main = sys.modules.get("main")
+    if main is None:
+        return
+    try:
+        with pymongo.timeout(2):
+            main.client.admin.command("ping")
+    except InvalidOperation as e:
+        worker.log.error(f"Preloaded worker cannot use its Mongo client: {e}")
+        sys.exit(3)  # gunicorn's WORKER_BOOT_ERROR
+    except PyMongoError as e:
+        worker.log.warning(f"Preloaded worker could not reach MongoDB yet: {e}")
+
+
+def on_reload(server):
+    server.log.info("SIGHUP: starting new workers and retiring the old ones gracefully")
@@ -1,22 +1,39 @@
+import asyncio
+import base64
+import csv
 import email
+import hashlib
+import io
 import os
+from contextlib import ExitStack, asynccontextmanager, contextmanager
 from typing import Annotated
 from uuid import UUID, uuid4
 import json
-from fastapi import FastAPI, Depends, HTTPException, status, Form, Response, Request
+from fastapi import FastAPI, BackgroundTasks, Depends, HTTPException, status, Form, Response, Request
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from pwdlib import PasswordHash
+from pwdlib.hashers.argon2 import Argon2Hasher
 from dotenv import load_dotenv
 from pymongo.mongo_client import MongoClient
 from pymongo.server_api import ServerApi
-from pymongo.errors import DuplicateKeyError, PyMongoError
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
+from pymongo import DeleteMany, ReturnDocument, UpdateOne
+from pymongo.results import InsertManyResult, InsertOneResult
+from pymongo.errors import BulkWriteError, CollectionInvalid, DuplicateKeyError, ExecutionTimeout, OperationFailure, PyMongoError
 from bson import ObjectId
+from bson import encode as bson_encode
+from bson import json_util
+from collections import OrderedDict, deque
 from bson.errors import InvalidId
 import certifi
 import smtplib, ssl
+import socket
+import threading
+import time
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+import math
 import random
 from datetime import datetime, timedelta, timezone
 import re
@@ -25,8 +42,28 @@ from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi_sessions.frontends.implementations import SessionCookie, CookieParameters
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from pathlib import Path
+from starlette.datastructures import Headers
+from starlette.staticfiles import NotModifiedResponse
+from email.utils import formatdate
+import gzip
+import mimetypes
+
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from starlette.datastructures import MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # optional; prebuilt .br files are served either way
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # optional; responses fall back to br/gzip
+    zstandard = None
 
 
 def utcnow() -> datetime:
@@ -84,8 +121,7 @@ def app_name_exists(app_name: str) -> bool:
     if apps.find_one({"app_name": normalized}):
         return True
 
-    db_names = {name.lower() for name in client.list_database_names()}
-    return normalized in db_names and normalized not in RESERVED_DB_NAMES
+    return normalized in cluster_database_names() and normalized not in RESERVED_DB_NAMES
 
 
 def normalize_domain_or_400(domain: str | None) -> str:
@@ -147,24 +183,30 @@ def normalize_existing_app_or_404(app_name: str) -> str:
 
 
 def require_app_owner_or_admin(app_name: str, session: "SessionData") -> tuple[str, dict]:
-    logged_in_user = get_logged_in_user(session)
-    if not logged_in_user or logged_in_user.get("type") not in {"developer", "admin"}:
+    normalized_app = app_name.strip().lower()
+    return check_app_management(normalized_app, resolve_capabilities(session, normalized_app))
+
+
+def check_app_management(normalized_app: str, capabilities: "Capabilities") -> tuple[str, dict]:
+    if CAP_DEVELOPER not in capabilities:
         raise HTTPException(status_code=403, detail="Developer access required")
 
-    normalized_app = normalize_existing_app_or_404(app_name)
-    app_doc = db.get_collection("apps").find_one({"app_name": normalized_app}, {"_id": 0})
-    if not app_doc:
+    if not re.match(r"^[a-z0-9][a-z0-9_-]{2,49}$", normalized_app):
+        raise HTTPException(status_code=400, detail="Invalid app name")
+    if normalized_app in RESERVED_DB_NAMES or normalized_app == PORTAL_APP or not capabilities.app_exists:
         raise HTTPException(status_code=404, detail="App not found")
 
-    is_admin = logged_in_user.get("type") == "admin"
-    is_owner = resolve_app_creator(app_doc) == session.email
-    if not is_admin and not is_owner:
+    if CAP_MANAGE not in capabilities:
         raise HTTPException(status_code=403, detail="Owner access required")
 
-    return normalized_app, logged_in_user
+    return normalized_app, capabilities.user
 
 
 def resolve_app_creator(app_doc: dict) -> str:
+    owner = app_doc.get("owner_email")
+    if isinstance(owner, str) and owner.strip():
+        return owner.strip()
+
     direct = app_doc.get("created_by")
     if isinstance(direct, str) and direct.strip():
         return direct.strip()
@@ -192,11 +234,13 @@ def user_has_any_non_portal_app(user: dict) -> bool:
 
 
 def remove_app_membership_and_demote(app_name: str) -> None:
-    affected_users = list(user_col.find(app_membership_filter(app_name)))
+    affected_users = list(iter_app_members(app_name))
 
     for user in affected_users:
         if user.get("type") == "admin":
             user_col.update_one({"_id": user["_id"]}, {"$pull": {"apps": app_name}})
+            sync_memberships(user.get("email"))
+            bump_membership_versions(user.get("email"), [app_name])
             continue
 
         memberships = user.get("apps", [])
@@ -224,6 +268,8 @@ def remove_app_membership_and_demote(app_name: str) -> None:
             update_doc["$set"]["type"] = "user"
 
         user_col.update_one({"_id": user["_id"]}, update_doc)
+        sync_memberships(user.get("email"))
+        bump_membership_versions(user.get("email"), [app_name])
 
 
 def delete_app_data_and_membership(app_name: str) -> None:
@@ -231,8 +277,10 @@ def delete_app_data_and_membership(app_name: str) -> None:
     apps = db.get_collection("apps")
     apps.delete_one({"app_name": normalized_app})
     db.get_collection("app_domains").delete_many({"app_name": normalized_app})
+    db.get_collection("app_index_builds").delete_many({"app_name": normalized_app})
     remove_app_membership_and_demote(normalized_app)
-    client.drop_database(normalized_app)
+    drop_app_storage(normalized_app)
+    drop_app_versions(normalized_app)
 
 
 def rollback_app_approval_side_effects(
@@ -243,8 +291,8 @@ def rollback_app_approval_side_effects(
     db.get_collection("apps").delete_one({"app_name": normalized_app})
     db.get_collection("app_domains").delete_many({"app_name": normalized_app})
 
-    if normalized_app in {name.strip().lower() for name in client.list_database_names()}:
-        client.drop_database(normalized_app)
+    drop_app_storage(normalized_app)
+    drop_app_versions(normalized_app)
 
     if requester_snapshot and requester_snapshot.get("_id") is not None:
         user_col.update_one(
@@ -256,6 +304,8 @@ def rollback_app_approval_side_effects(
                 }
             },
         )
+        sync_memberships(requester_snapshot.get("email"))
+        bump_membership_versions(requester_snapshot.get("email"), [normalized_app])
 
 
 def approval_duplicate_error_detail(exc: DuplicateKeyError) -> str:
@@ -269,7 +319,7 @@ def approval_duplicate_error_detail(exc: DuplicateKeyError) -> str:
 
 def database_exists(app_name: str) -> bool:
     normalized_app = app_name.strip().lower()
-    return normalized_app in {name.strip().lower() for name in client.list_database_names()}
+    return normalized_app in cluster_database_names()
 
 
 def can_reassign_domain_doc(domain_doc: dict, request_id: ObjectId) -> bool:
@@ -386,7 +436,9 @@ SESSION_SECRET_KEY = os.environ.get("SESSION_SECRET_KEY", "supersecret")
 templates = Jinja2Templates(directory="templates")
 
 # MongoDB setup
-client = MongoClient(MONGO_URI, tlsCAFile=certifi.where(), server_api=ServerApi("1"))
+# connect=False keeps import free of network I/O and background monitor threads,
+# so the module can be imported in a gunicorn master before workers fork.
+client = MongoClient(MONGO_URI, tlsCAFile=certifi.where(), server_api=ServerApi("1"), connect=False)
 db = client.FastAPI
 user_col = db.get_collection("User_Info")
 
@@ -394,306 +446,2636 @@ session_collection = db.get_collection("sessions")
 
 verification_col = db.get_collection("email_verification")
 app_request_col = db.get_collection("app_creation_requests")
+startup_lock_col = db.get_collection("startup_locks")
+version_col = db.get_collection("versions")
+membership_col = db.get_collection("memberships")
+
+# (collection, keys, options) for every index this service relies on. Built once per
+# spec version by whichever worker wins the lock document in startup_locks.
+INDEX_SPECS: list[tuple[str, list[tuple[str, int]], dict]] = [
+    ("email_verification", [("created_at", 1)], {"expireAfterSeconds": 600}),
+    ("sessions", [("expires_at", 1)], {"expireAfterSeconds": 0}),
+    ("app_creation_requests", [("created_at", 1)], {}),
+    ("app_creation_requests", [("status", 1), ("_id", -1)], {}),
+    ("app_creation_requests", [("requested_by", 1), ("_id", -1)], {}),
+    ("app_creation_requests", [("requested_app_name", 1), ("_id", -1)], {}),
+    ("rate_limits", [("expires_at", 1)], {"expireAfterSeconds": 0}),
+    ("User_Info", [("email", 1), ("app_name", 1)], {}),
+    ("User_Info", [("email", 1), ("_id", 1)], {}),
+    ("User_Info", [("type", 1), ("email", 1), ("_id", 1)], {}),
+    ("memberships", [("app_name", 1), ("user_id", 1)], {"unique": True}),
+    ("memberships", [("app_name", 1), ("email", 1), ("user_id", 1)], {}),
+    ("memberships", [("app_name", 1), ("role", 1), ("email", 1), ("user_id", 1)], {}),
+    ("memberships", [("user_id", 1)], {}),
+    ("memberships", [("email", 1)], {}),
+    ("apps", [("owner_email", 1)], {}),
+    ("app_objects", [("_app", 1), ("_col", 1), ("userId", 1)], {}),
+    ("app_collections", [("app_name", 1), ("collection_name", 1)], {"unique": True}),
+    ("app_index_builds", [("app_name", 1), ("collection", 1), ("name", 1)], {"unique": True}),
+]
+INDEX_LOCK_STALE_AFTER = timedelta(minutes=10)
+PRELOAD_STARTUP = os.environ.get("PRELOAD_STARTUP", "").strip().lower() in {"1", "true", "yes"}
 
-verification_col.create_index("created_at", expireAfterSeconds=600)
 
-session_collection.create_index("expires_at", expireAfterSeconds=0)
-app_request_col.create_index("created_at")
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
 
-try:
-    client.admin.command("ping")
-    print("Connected to MongoDB!")
-except Exception as e:
-    print("MongoDB connection error:", e)
 
-# FastAPI setup
-app = FastAPI()
-password_hash = PasswordHash.recommended()
+def index_specs_version() -> str:
+    payload = json.dumps(INDEX_SPECS, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:12]
 
 
-def get_allowed_origins():
-    collection = db.get_collection("app_domains")
-    docs = list(collection.find({}, {"_id": 0, "url": 1, "URLS": 1}))
+def run_once(lock_id: str, task) -> bool:
+    """Run task(heartbeat) in exactly one worker, coordinated through startup_locks.
 
-    origins = []
+    Returns True when this process ran it. Long tasks call heartbeat() so other
+    workers do not mistake them for a dead leader.
+    """
+    owner = worker_id()
+    now = utcnow()
+    try:
+        startup_lock_col.insert_one(
+            {"_id": lock_id, "status": "building", "owner": owner, "started_at": now}
+        )
+    except DuplicateKeyError:
+        # Take over only if the previous leader died mid-build.
+        stale = startup_lock_col.find_one_and_update(
+            {
+                "_id": lock_id,
+                "status": "building",
+                "started_at": {"$lt": now - INDEX_LOCK_STALE_AFTER},
+            },
+            {"$set": {"owner": owner, "started_at": now}},
+        )
+        if not stale:
+            return False
 
-    for doc in docs:
-        values = []
+    def heartbeat() -> None:
+        startup_lock_col.update_one({"_id": lock_id, "owner": owner}, {"$set": {"started_at": utcnow()}})
 
-        if "url" in doc and doc["url"]:
-            values.append(doc["url"])
+    try:
+        task(heartbeat)
+    except PyMongoError:
+        startup_lock_col.delete_one({"_id": lock_id, "owner": owner})
+        raise
 
-        if "URLS" in doc and isinstance(doc["URLS"], list):
-            values.extend(doc["URLS"])
+    startup_lock_col.update_one(
+        {"_id": lock_id, "owner": owner},
+        {"$set": {"status": "done", "finished_at": utcnow()}},
+    )
+    return True
+
+
+def ensure_indexes_once() -> bool:
+    """Build INDEX_SPECS if no other worker has done so for this spec version."""
+
+    def build(heartbeat) -> None:
+        for collection_name, keys, options in INDEX_SPECS:
+            db.get_collection(collection_name).create_index(keys, **options)
+
+    return run_once(f"indexes:{index_specs_version()}", build)
+
+
+APP_STORAGE_MODES = {"database", "shared"}
+DEFAULT_APP_STORAGE = os.environ.get("DEFAULT_APP_STORAGE", "database").strip().lower()
+if DEFAULT_APP_STORAGE not in APP_STORAGE_MODES:
+    DEFAULT_APP_STORAGE = "database"
+STORAGE_MODE_CACHE_SECONDS = 5
+SHARED_RESERVED_FIELDS = ("_app", "_col")
+SHARED_INDEX_INFORMATION = {"_id_": {"key": [("_id", 1)]}, "userId_1": {"key": [("userId", 1)]}}
+# Clusters apps can be placed on, besides "default" (MONGODB_URL), as a JSON
+# object of name -> connection URI, e.g. {"east": "mongodb://db-east:27017"}.
+MONGODB_CLUSTERS: dict[str, str] = json.loads(os.environ.get("MONGODB_CLUSTERS", "") or "{}")
+DEFAULT_APP_CLUSTER = os.environ.get("DEFAULT_APP_CLUSTER", "default").strip() or "default"
+if DEFAULT_APP_CLUSTER not in MONGODB_CLUSTERS:
+    DEFAULT_APP_CLUSTER = "default"
+cluster_clients: dict[str, MongoClient] = {"default": client}
+cluster_clients_lock = threading.Lock()
+shared_indexes_ready: set[str] = set()
+# app_name -> (cached at, storage mode, cluster, migrating)
+placement_cache: dict[str, tuple[float, str, str, bool]] = {}
+
+
+def mongo_client_for(uri: str) -> MongoClient:
+    options: dict = {"server_api": ServerApi("1"), "connect": False}
+    lowered = uri.lower()
+    if lowered.startswith("mongodb+srv://") or "tls=true" in lowered or "ssl=true" in lowered:
+        options["tlsCAFile"] = certifi.where()
+    return MongoClient(uri, **options)
+
+
+def cluster_names() -> list[str]:
+    return ["default", *sorted(name for name in MONGODB_CLUSTERS if name != "default")]
+
+
+def cluster_client(name: str) -> MongoClient:
+    """One pooled client per cluster, created on first use."""
+    existing = cluster_clients.get(name)
+    if existing is not None:
+        return existing
+    with cluster_clients_lock:
+        if name not in cluster_clients:
+            uri = MONGODB_CLUSTERS.get(name)
+            if not uri:
+                raise ValueError(f"Unknown cluster {name!r}")
+            cluster_clients[name] = mongo_client_for(uri)
+        return cluster_clients[name]
+
+
+def cluster_database_names() -> set[str]:
+    """Lower-cased database names on every cluster, not just the default one."""
+    return {
+        db_name.strip().lower()
+        for name in cluster_names()
+        for db_name in cluster_client(name).list_database_names()
+    }
 
-        for url in values:
-            if not isinstance(url, str):
-                continue
 
-            url = url.strip().rstrip("/")
-            if not url:
-                continue
+def close_cluster_clients() -> None:
+    with cluster_clients_lock:
+        for name, cluster in list(cluster_clients.items()):
+            if name != "default":
+                cluster.close()
+                del cluster_clients[name]
 
-            if not url.startswith(("http://", "https://")):
-                url = f"https://{url}"
 
-            origins.append(url)
+def shared_store(cluster: str, read_preference=None):
+    """The database holding app_objects/app_collections on a cluster."""
+    store = cluster_client(cluster).get_database(db.name, read_preference=read_preference)
+    if cluster != "default" and cluster not in shared_indexes_ready:
+        # INDEX_SPECS only covers the default cluster.
+        for collection_name, keys, options in INDEX_SPECS:
+            if collection_name in {"app_objects", "app_collections"}:
+                store[collection_name].create_index(keys, **options)
+        shared_indexes_ready.add(cluster)
+    return store
 
-    return list(dict.fromkeys(origins))
 
-origins = get_allowed_origins()
-print("CORS origins loaded:", origins)
+# Equality operators, which match the same documents against a whole shared _id.
+# Range operators go through "_id.id" to keep MongoDB's type bracketing.
+SHARED_KEY_OPERATORS = {"$eq", "$ne", "$in", "$nin"}
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=get_allowed_origins(),
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
 
+def shared_object_key(app_name: str, collection_name: str, object_id) -> dict:
+    """The _id a document gets in app_objects: unique per app and collection."""
+    return {"app": app_name, "col": collection_name, "id": object_id}
 
-# In Docker, WORKDIR is /app
-CANDIDATES = [
-    Path("/app/Portal/dist"),
-    Path(__file__).parent / "Portal" / "dist",
-]
 
-PORTAL_DIST = next((p for p in CANDIDATES if p.exists()), None)
+def shared_object(doc: dict | None) -> dict | None:
+    """Hand a document from app_objects back with the _id its app gave it."""
+    if doc is not None and isinstance(doc.get("_id"), dict) and doc["_id"].keys() == {"app", "col", "id"}:
+        doc["_id"] = doc["_id"]["id"]
+    return doc
 
-if PORTAL_DIST:
-    app.mount("/portal", StaticFiles(directory=str(PORTAL_DIST), html=True), name="portal")
 
-    @app.get("/portal")
-    def portal_root():
-        return FileResponse(str(PORTAL_DIST / "index.html"))
-else:
-    @app.get("/portal")
-    def portal_missing():
-        return {
-            "error": "Portal not built in this deployment",
-            "checked": [str(p) for p in CANDIDATES],
-            "cwd": os.getcwd(),
-            "files_here": os.listdir("."),
-        }
+class SharedCursor:
+    """Cursor over app_objects whose documents come back with their app-level _id."""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def __getattr__(self, name):
+        attr = getattr(self.cursor, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            # Keep chained calls (sort, limit, batch_size, ...) wrapped.
+            return self if result is self.cursor else result
+
+        return call
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return shared_object(next(self.cursor))
+
+    next = __next__
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cursor.close()
+
+
+class SharedCollection:
+    """One app collection stored as (_app, _col)-tagged documents in app_objects.
+
+    Mirrors the subset of pymongo's Collection API the endpoints use. Every
+    filter is pinned to this app and collection, and the tag fields are never
+    returned or writable. Each document's _id is stored as
+    {"app", "col", "id"}, so apps choose their own ids without colliding with
+    or probing other apps, and delete events still say which app they belong to.
+    """
+
+    def __init__(self, app_name: str, name: str, store):
+        self.app_name = app_name
+        self.name = name
+        self.scope = {"_app": app_name, "_col": name}
+        self.objects = store["app_objects"]
+        self.catalog = store["app_collections"]
+
+    def key(self, object_id) -> dict:
+        return shared_object_key(self.app_name, self.name, object_id)
+
+    def rekey_condition(self, condition):
+        """(field, condition) for a filter on _id, in terms of the stored key."""
+        if not isinstance(condition, dict) or not any(str(op).startswith("$") for op in condition):
+            return "_id", self.key(condition)
+        if not set(condition) <= SHARED_KEY_OPERATORS:
+            return "_id.id", condition
+        rekeyed = {}
+        for op, operand in condition.items():
+            if op in {"$in", "$nin"} and isinstance(operand, list):
+                rekeyed[op] = [self.key(v) for v in operand]
+            else:
+                rekeyed[op] = self.key(operand)
+        return "_id", rekeyed
+
+    def rekey_filter(self, filter_doc: dict) -> dict:
+        rekeyed = {}
+        for field, condition in filter_doc.items():
+            if field == "_id":
+                field, condition = self.rekey_condition(condition)
+            elif field.startswith("_id."):
+                field = "_id.id." + field[len("_id."):]
+            elif field in {"$and", "$or", "$nor"} and isinstance(condition, list):
+                condition = [self.rekey_filter(c) if isinstance(c, dict) else c for c in condition]
+            rekeyed[field] = condition
+        return rekeyed
+
+    def scoped(self, filter_doc: dict | None) -> dict:
+        return {**self.rekey_filter(filter_doc or {}), **self.scope}
+
+    @staticmethod
+    def projection(projection):
+        if projection is None:
+            return {field: 0 for field in SHARED_RESERVED_FIELDS}
+        if isinstance(projection, dict) and not any(v for k, v in projection.items() if k != "_id"):
+            return {**projection, **{field: 0 for field in SHARED_RESERVED_FIELDS}}
+        return projection
+
+    @staticmethod
+    def guard_update(update: dict) -> dict:
+        for operator, fields in update.items():
+            if isinstance(fields, dict) and any(
+                str(f).split(".")[0] in {"_id", *SHARED_RESERVED_FIELDS} for f in fields
+            ):
+                raise HTTPException(400, "Fields _id, _app and _col cannot be updated")
+        return update
+
+    def upsert_update(self, scoped_filter: dict, update: dict) -> dict:
+        """The update to send with upsert=True, so an inserted document gets a scoped _id."""
+        condition = scoped_filter.get("_id")
+        if isinstance(condition, dict) and ("$eq" in condition or condition.keys() == {"app", "col", "id"}):
+            # MongoDB copies an _id equality from the filter into the new document.
+            return update
+        return {**update, "$setOnInsert": {**update.get("$setOnInsert", {}), "_id": self.key(ObjectId())}}
+
+    def tagged(self, doc: dict) -> dict:
+        # Like pymongo, give the caller's document an _id if it has none.
+        doc.setdefault("_id", ObjectId())
+        return {**doc, **self.scope, "_id": self.key(doc["_id"])}
+
+    def find_one(self, filter_doc=None, projection=None, **kwargs):
+        return shared_object(self.objects.find_one(self.scoped(filter_doc), self.projection(projection), **kwargs))
+
+    def find(self, filter_doc=None, projection=None, **kwargs):
+        return SharedCursor(self.objects.find(self.scoped(filter_doc), self.projection(projection), **kwargs))
+
+    def count_documents(self, filter_doc=None, **kwargs):
+        return self.objects.count_documents(self.scoped(filter_doc), **kwargs)
+
+    def estimated_document_count(self, **kwargs):
+        return self.objects.count_documents(self.scope)
+
+    def insert_one(self, doc: dict, **kwargs):
+        result = self.objects.insert_one(self.tagged(doc), **kwargs)
+        return InsertOneResult(doc["_id"], result.acknowledged)
+
+    def insert_many(self, docs, **kwargs):
+        docs = list(docs)
+        result = self.objects.insert_many([self.tagged(doc) for doc in docs], **kwargs)
+        return InsertManyResult([doc["_id"] for doc in docs], result.acknowledged)
+
+    def update_request(self, filter_doc, update, upsert: bool) -> UpdateOne:
+        scoped = self.scoped(filter_doc)
+        update = self.guard_update(update)
+        return UpdateOne(scoped, self.upsert_update(scoped, update) if upsert else update, upsert=upsert)
+
+    def update_one(self, filter_doc, update, upsert: bool = False, **kwargs):
+        scoped = self.scoped(filter_doc)
+        update = self.guard_update(update)
+        if upsert:
+            update = self.upsert_update(scoped, update)
+        return self.objects.update_one(scoped, update, upsert=upsert, **kwargs)
+
+    def update_many(self, filter_doc, update, upsert: bool = False, **kwargs):
+        scoped = self.scoped(filter_doc)
+        update = self.guard_update(update)
+        if upsert:
+            update = self.upsert_update(scoped, update)
+        return self.objects.update_many(scoped, update, upsert=upsert, **kwargs)
+
+    def delete_one(self, filter_doc, **kwargs):
+        return self.objects.delete_one(self.scoped(filter_doc), **kwargs)
+
+    def delete_many(self, filter_doc, **kwargs):
+        return self.objects.delete_many(self.scoped(filter_doc), **kwargs)
+
+    def bulk_update(self, specs, **kwargs):
+        ops = [self.update_request(f, u, upsert) for f, u, upsert in specs]
+        return self.objects.bulk_write(ops, **kwargs)
+
+    def aggregate(self, pipeline, **kwargs):
+        prefix = [
+            {"$match": self.scope},
+            {"$addFields": {"_id": "$_id.id"}},
+            {"$project": {field: 0 for field in SHARED_RESERVED_FIELDS}},
+        ]
+        return self.objects.aggregate(prefix + list(pipeline), **kwargs)
+
+    def index_information(self) -> dict:
+        # Only the shared (_app, _col, userId) index applies to tenant data.
+        return dict(SHARED_INDEX_INFORMATION)
+
+    def list_indexes(self):
+        return [{"name": name, "key": dict(spec["key"])} for name, spec in SHARED_INDEX_INFORMATION.items()]
+
+    def create_index(self, keys, **kwargs):
+        raise OperationFailure("Custom indexes are not available in shared storage")
+
+    def drop_index(self, index_name, **kwargs):
+        raise OperationFailure("Custom indexes are not available in shared storage")
+
+    def drop(self) -> None:
+        self.objects.delete_many(self.scope)
+        self.catalog.delete_one({"app_name": self.app_name, "collection_name": self.name})
+
+
+def bulk_update(collection, specs: list[tuple[dict, dict, bool]], **kwargs):
+    """Run (filter, update, upsert) specs as one bulk_write on an app collection.
+
+    Callers pass plain specs rather than UpdateOne objects so shared storage can
+    scope each filter without reaching into pymongo's request internals.
+    """
+    if isinstance(collection, SharedCollection):
+        return collection.bulk_update(specs, **kwargs)
+    return collection.bulk_write([UpdateOne(f, u, upsert=upsert) for f, u, upsert in specs], **kwargs)
+
+
+class SharedAppDatabase:
+    """Database-like view of one app's collections in shared storage."""
+
+    def __init__(self, app_name: str, store):
+        self.name = app_name
+        self.store = store
+        self.objects = store["app_objects"]
+        self.catalog = store["app_collections"]
 
+    def __getitem__(self, collection_name: str) -> SharedCollection:
+        return SharedCollection(self.name, collection_name, self.store)
 
-class User(BaseModel):
-    email: str | None = None
-    disabled: bool | None = None
+    def list_collection_names(self, **kwargs) -> list[str]:
+        return [
+            doc["collection_name"]
+            for doc in self.catalog.find({"app_name": self.name}, {"collection_name": 1}, **kwargs)
+        ]
 
+    def create_collection(self, collection_name: str) -> SharedCollection:
+        try:
+            self.catalog.insert_one(
+                {"app_name": self.name, "collection_name": collection_name, "created_at": utcnow()}
+            )
+        except DuplicateKeyError:
+            raise CollectionInvalid(f"collection {collection_name} already exists")
+        return self[collection_name]
+
+    def command(self, name: str, command: dict, **kwargs):
+        if name != "explain" or "find" not in command:
+            raise OperationFailure(f"{name} is not available in shared storage")
+        collection = self[command["find"]]
+        rewritten = {**command, "find": self.objects.name, "filter": collection.scoped(command.get("filter"))}
+        return self.store.command("explain", rewritten, **kwargs)
+
+    def drop(self) -> None:
+        self.objects.delete_many({"_app": self.name})
+        self.catalog.delete_many({"app_name": self.name})
+
+
+def app_placement(app_name: str) -> tuple[str, str, bool]:
+    """(storage mode, cluster, migration in progress) for an app, cached briefly per worker.
+
+    The apps document is the placement table: its storage and cluster fields
+    say where the app's collections live.
+    """
+    now = utcnow().timestamp()
+    cached = placement_cache.get(app_name)
+    if cached and now - cached[0] < STORAGE_MODE_CACHE_SECONDS:
+        return cached[1], cached[2], cached[3]
+    doc = db.get_collection("apps").find_one(
+        {"app_name": app_name}, {"storage": 1, "cluster": 1, "storage_migration": 1}
+    )
+    if not doc:
+        # Not cached: the apps document may be about to be created.
+        return "database", "default", False
+    mode = doc.get("storage") if doc.get("storage") in APP_STORAGE_MODES else "database"
+    cluster = doc.get("cluster") or "default"
+    migrating = bool(doc.get("storage_migration"))
+    placement_cache[app_name] = (now, mode, cluster, migrating)
+    return mode, cluster, migrating
 
-class UserInDB(User):
-    hashed_password: str
 
-class SessionData(BaseModel):
-    email: str
-    app_name: str = PORTAL_APP
-    session_id: UUID
-    expires_at: datetime
+def app_db(
+    app_name: str,
+    write: bool = False,
+    mode: str | None = None,
+    cluster: str | None = None,
+    read_preference=None,
+):
+    """The app's collections, on whichever cluster and in whichever storage mode hold them.
+
+    Pass write=True from paths that change app data; they are refused while
+    the app is being moved. read_preference defaults to the primary.
+    """
+    migrating = False
+    if mode is None or cluster is None:
+        placed_mode, placed_cluster, migrating = app_placement(app_name)
+        mode = mode or placed_mode
+        cluster = cluster or placed_cluster
+    if write and migrating:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="App storage is being migrated, please retry",
+            headers={"Retry-After": "30"},
+        )
+    if mode == "shared":
+        return SharedAppDatabase(app_name, shared_store(cluster, read_preference))
+    return cluster_client(cluster).get_database(app_name, read_preference=read_preference)
+
+
+READ_PREFERENCE_MODES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+# Secondaries lagging more than this are skipped (MongoDB's minimum is 90); -1 disables the check.
+READ_MAX_STALENESS_SECONDS = int(os.environ.get("READ_MAX_STALENESS_SECONDS", "-1"))
+
+
+def read_preference_setting(env_name: str, default: str):
+    name = os.environ.get(env_name, default).strip()
+    mode = READ_PREFERENCE_MODES.get(name, READ_PREFERENCE_MODES[default])
+    if mode is Primary:
+        return Primary()
+    return mode(max_staleness=READ_MAX_STALENESS_SECONDS)
+
+
+# Where reads go, by endpoint class. Logins, session and permission checks,
+# and every read inside a write path stay on the primary.
+READ_PREFERENCES = {
+    # /fetch_object, /list_objects, /query_objects, /list_collections. These
+    # skip the object cache and ETags when not read from the primary.
+    "objects": read_preference_setting("READ_PREFERENCE_OBJECTS", "primary"),
+    # /admin/users, /admin/apps, /app_creation_requests
+    "listing": read_preference_setting("READ_PREFERENCE_LISTING", "secondaryPreferred"),
+    # /aggregate_objects, user and app exports
+    "analytics": read_preference_setting("READ_PREFERENCE_ANALYTICS", "secondaryPreferred"),
+}
+CAUSAL_READS = any(not isinstance(pref, Primary) for pref in READ_PREFERENCES.values())
+
+
+def listing_collection(name: str):
+    """A portal collection read with the listing read preference."""
+    return db.get_collection(name, read_preference=READ_PREFERENCES["listing"])
+
+
+@contextmanager
+def app_reads(app_name: str, read_class: str, session: "SessionData | None" = None):
+    """Yield (database, client session) for reading app data with the class's read preference.
+
+    Reads that may hit a secondary run in a causally consistent session that
+    starts after the user's last recorded write (see app_writes), so users
+    always see their own updates.
+    """
+    mode, cluster, _ = app_placement(app_name)
+    preference = READ_PREFERENCES[read_class]
+    target = app_db(app_name, mode=mode, cluster=cluster, read_preference=preference)
+    if isinstance(preference, Primary):
+        yield target, None
+        return
+    with cluster_client(cluster).start_session(causal_consistency=True) as client_session:
+        token = ((session.causal if session else None) or {}).get(cluster)
+        if token:
+            client_session.advance_cluster_time(token["cluster_time"])
+            client_session.advance_operation_time(token["operation_time"])
+        yield target, client_session
+
+
+@contextmanager
+def app_writes(app_name: str, session: "SessionData | None" = None):
+    """Yield (database, client session) for changing app data.
+
+    When any reads are routed off the primary, the operation time of the
+    writes is stored on the user's login session for app_reads to wait on.
+    """
+    if not CAUSAL_READS or session is None:
+        yield app_db(app_name, write=True), None
+        return
+    _, cluster, _ = app_placement(app_name)
+    target = app_db(app_name, write=True)
+    with cluster_client(cluster).start_session(causal_consistency=True) as client_session:
+        yield target, client_session
+        if client_session.operation_time is not None and client_session.cluster_time is not None:
+            token = {"operation_time": client_session.operation_time, "cluster_time": client_session.cluster_time}
+            session_collection.update_one({"_id": str(session.session_id)}, {"$set": {f"causal.{cluster}": token}})
+
+
+def drop_app_storage(app_name: str, mode: str | None = None, cluster: str | None = None) -> None:
+    """Remove the app's data from one placement, or from every cluster and mode when not given."""
+    placement_cache.pop(app_name, None)
+    for name in [cluster] if cluster else cluster_names():
+        if mode in (None, "database"):
+            cluster_client(name).drop_database(app_name)
+        if mode in (None, "shared"):
+            SharedAppDatabase(app_name, shared_store(name)).drop()
+
+
+def migrate_app_storage(
+    app_name: str,
+    target_mode: str | None = None,
+    target_cluster: str | None = None,
+    batch_size: int = 1000,
+    log=print,
+) -> None:
+    """Move an app's collections to another storage mode and/or cluster.
 
-# Cookie frontend
-cookie_do = SessionCookie(
-    cookie_name="fastapi_session",
-    identifier="basic-cookie",
-    secret_key=SESSION_SECRET_KEY,
-    cookie_params=CookieParameters(
-        path="/",
-        secure=True,
-        httponly=True,
-        samesite="none",
-        max_age=3600,
-    ),
-)
+    Writes are refused while the copy runs; reads keep using the old placement
+    until the switch. Custom indexes are recreated when the target is database
+    mode only, since shared storage has just the (_app, _col, userId) index.
+    """
+    apps_col = db.get_collection("apps")
+    app_doc = apps_col.find_one({"app_name": app_name})
+    if not app_doc:
+        raise ValueError(f"App {app_name!r} not found")
+    current_mode = app_doc.get("storage") if app_doc.get("storage") in APP_STORAGE_MODES else "database"
+    current_cluster = app_doc.get("cluster") or "default"
+    target_mode = target_mode or current_mode
+    target_cluster = target_cluster or current_cluster
+    if target_mode not in APP_STORAGE_MODES:
+        raise ValueError(f"Unknown storage mode {target_mode!r}")
+    cluster_client(target_cluster)
+    if (current_mode, current_cluster) == (target_mode, target_cluster):
+        log(f"{app_name} already uses {target_mode} storage on {target_cluster}")
+        return
 
+    apps_col.update_one(
+        {"_id": app_doc["_id"]},
+        {"$set": {"storage_migration": {"to": target_mode, "cluster": target_cluster, "started_at": utcnow()}}},
+    )
+    # Give every worker's placement_cache time to see the write freeze.
+    time.sleep(STORAGE_MODE_CACHE_SECONDS + 1)
 
-def get_password_hash(password: str) -> str:
-    return password_hash.hash(password)
+    source = app_db(app_name, mode=current_mode, cluster=current_cluster)
+    target = app_db(app_name, mode=target_mode, cluster=target_cluster)
+    try:
+        for col in source.list_collection_names():
+            if col.startswith("system."):
+                continue
+            if col not in target.list_collection_names():
+                target.create_collection(col)
+            copied = 0
+            batch = []
+            for doc in source[col].find({}):
+                batch.append(doc)
+                if len(batch) >= batch_size:
+                    target[col].insert_many(batch, ordered=False)
+                    copied += len(batch)
+                    batch = []
+            if batch:
+                target[col].insert_many(batch, ordered=False)
+                copied += len(batch)
+            if target_mode == "database":
+                for index in source[col].list_indexes():
+                    if index["name"] != "_id_":
+                        options = {k: v for k, v in index.items() if k in APP_ARCHIVE_INDEX_OPTIONS}
+                        target[col].create_index(list(index["key"].items()), **options)
+            log(f"{app_name}.{col}: copied {copied} documents")
+    except Exception:
+        drop_app_storage(app_name, target_mode, target_cluster)
+        apps_col.update_one({"_id": app_doc["_id"]}, {"$unset": {"storage_migration": ""}})
+        raise
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return password_hash.verify(plain_password, hashed_password)
+    apps_col.update_one(
+        {"_id": app_doc["_id"]},
+        {"$set": {"storage": target_mode, "cluster": target_cluster}, "$unset": {"storage_migration": ""}},
+    )
+    bump_versions(app_version_key(app_name), collections_version_key(app_name))
+    # Let in-flight reads on the old storage finish before removing it.
+    time.sleep(STORAGE_MODE_CACHE_SECONDS + 1)
+    drop_app_storage(app_name, current_mode, current_cluster)
+    log(f"{app_name} now uses {target_mode} storage on {target_cluster}")
 
 
-def create_session(email: str, app_name: str) -> UUID:
-    session_id = uuid4()
-    expires_at = utcnow() + timedelta(hours=1)
+# Changes with every deploy of this file, so derived tokens from an older
+# release never match.
+VERSION_SEED = hashlib.sha1(Path(__file__).read_bytes()).hexdigest()[:16]
 
-    session_collection.insert_one(
-        {
-            "_id": str(session_id),   # store UUID as string for consistency
-            "email": email,
-            "app_name": app_name,
-            "expires_at": expires_at,  # datetime (timezone-aware)
-        }
-    )
-    return session_id
 
-def read_session(session_id: UUID) -> SessionData | None:
-    doc = session_collection.find_one({"_id": str(session_id)})
-    if not doc:
-        return None
+def object_version_key(app_name: str, collection_name: str, user_id: str) -> str:
+    return f"obj:{app_name}:{collection_name}:{user_id}"
 
-    expires_at = coerce_utc_datetime(doc.get("expires_at"))
-    if not expires_at:
-        return None
 
-    # If expired, clean up and treat as missing.
-    # Defensive fallback for any legacy/odd datetime representation.
-    try:
-        is_expired = expires_at < utcnow()
-    except TypeError:
-        normalized = coerce_utc_datetime(expires_at)
-        if not normalized:
-            session_collection.delete_one({"_id": str(session_id)})
-            return None
-        expires_at = normalized
-        is_expired = expires_at < utcnow()
+def collection_version_key(app_name: str, collection_name: str) -> str:
+    # Bumped with every object write in the collection; keys aggregate results.
+    return f"col:{app_name}:{collection_name}"
 
-    if is_expired:
-        session_collection.delete_one({"_id": str(session_id)})
-        return None
 
-    return SessionData(
-        email=doc["email"],
-        app_name=doc.get("app_name", PORTAL_APP),
-        session_id=session_id,
-        expires_at=expires_at,
-    )
+def collections_version_key(app_name: str) -> str:
+    return f"collections:{app_name}"
 
-def delete_session(session_id: UUID) -> None:
-    session_collection.delete_one({"_id": str(session_id)})
 
-async def get_session_id(request: Request) -> UUID:
-    raw = request.cookies.get("fastapi_session")
-    if not raw:
-        raise HTTPException(status_code=401, detail="Not authenticated")
-    try:
-        return UUID(raw)
-    except ValueError:
-        raise HTTPException(status_code=401, detail="Invalid session cookie")
+def app_version_key(app_name: str) -> str:
+    return f"app:{app_name}"
 
-async def require_session(session_id: UUID = Depends(get_session_id)) -> SessionData:
-    session = read_session(session_id)
-    if not session:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid or expired session",
-        )
-    return session
 
+def user_version_key(email: str) -> str:
+    return f"user:{email}"
 
-def get_logged_in_user(session: SessionData):
-    user = user_col.find_one(user_scope_query(session.email, session.app_name))
-    if user:
-        return user
-    # Backward compatibility for legacy accounts without app_name.
-    return user_col.find_one({"email": session.email})
 
-@app.get("/")
-async def root():
-    routes = [
-        {"path": route.path, "methods": sorted(list(getattr(route, "methods", []) or []))}
-        for route in app.routes
-    ]
-    return {"message": "API is running", "routes": routes}
+OBJECT_CACHE_MAX_BYTES = int(os.environ.get("OBJECT_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+OBJECT_CACHE_RETRY_SECONDS = 2
 
 
-@app.post("/login")
-async def login(
-    email: Annotated[str, Form()],
-    password: Annotated[str, Form()],
-    response: Response,
-    app_name: Annotated[str | None, Form()] = None,
-):
-    scoped_app = normalize_app_name(app_name)
+class InvalidationClock:
+    """Tells a cache fill whether what it read was invalidated meanwhile.
 
-    if email == "admin":
-        candidates = list(user_col.find({"email": email}))
-    elif app_name is not None and app_name.strip() != "":
-        candidates = list(
-            user_col.find(
-                {
-                    "email": email,
-                    "$or": [
-                        {"app_name": scoped_app},
-                        {"apps": scoped_app},
-                    ],
-                }
-            )
-        )
-    else:
-        candidates = list(user_col.find({"email": email}))
+    A fill takes now() before reading and passes it to stale() with the scopes
+    its result depends on (version keys, or "app:<name>"). Only invalidations
+    of those scopes since then make it stale, so busy apps don't starve the
+    rest. Callers hold their cache's lock around mark() and stale().
+    """
 
-    user = next(
-        (u for u in candidates if verify_password(password, u["hashed_password"])),
-        None,
-    )
-    if not user:
-        raise HTTPException(status_code=401, detail="Incorrect email or password")
+    def __init__(self, max_scopes: int = 100_000):
+        self.max_scopes = max_scopes
+        self.tick = 0
+        self.cleared_at = 0
+        self.invalidated_at: dict[str, int] = {}
 
-    user_app = user.get("app_name") or user.get("apps", [scoped_app])[0] or scoped_app
-    session_id = create_session(email, normalize_app_name(user_app))
+    def now(self) -> int:
+        return self.tick
 
-    response.set_cookie(
-        key="fastapi_session",
-        value=str(session_id),
-        max_age=3600,
-        path="/",
-        secure=True,
-        httponly=True,
-        samesite="none",
-    )
+    def mark(self, *scopes: str) -> None:
+        self.tick += 1
+        for scope in scopes:
+            self.invalidated_at[scope] = self.tick
+        if len(self.invalidated_at) > self.max_scopes:
+            self.mark_all()
 
-    return {"message": "Login successful"}
+    def mark_all(self) -> None:
+        self.tick += 1
+        self.cleared_at = self.tick
+        self.invalidated_at.clear()
 
-@app.post("/register")
-async def register_user(
-    password: Annotated[str, Form()],
-    email: Annotated[str, Form()] = None,
-    app_name: Annotated[str | None, Form()] = None,
-):
-    scoped_app = normalize_app_name(app_name)
+    def stale(self, stamp: int, *scopes: str) -> bool:
+        if self.cleared_at > stamp:
+            return True
+        return any(self.invalidated_at.get(scope, 0) > stamp for scope in scopes)
 
-    if user_col.find_one(user_scope_query(email, scoped_app)):
-        raise HTTPException(400, "Email already exists")
 
-    match = re.match(r"^[_a-z0-9-]+(\.[_a-z0-9-]+)*@[a-z0-9-]+(\.[a-z0-9-]+)*(\.[a-z]{2,4})$", email)
-    if not match:
-        raise HTTPException(400, "Invalid email format")
+class ObjectCache:
+    """Per-worker LRU of fetched objects, keyed by their object version key.
 
-    if scoped_app != PORTAL_APP:
-        apps = db.get_collection("apps")
-        if not apps.find_one({"app_name": scoped_app}):
-            raise HTTPException(404, "App not found")
+    Entries are dropped on every bump_versions() in this worker and, through
+    the versions change stream, on bumps made by other workers. While that
+    stream is down the cache is bypassed, since other workers' writes would
+    go unnoticed.
+    """
 
-    hashed_password = get_password_hash(password)
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries: OrderedDict[str, tuple[str, str, dict, int]] = OrderedDict()
+        self.keys_by_app: dict[str, set[str]] = {}
+        self.bytes = 0
+        # A read only fills the cache if its key (or its app) was not
+        # invalidated while it was talking to Mongo.
+        self.clock = InvalidationClock()
+        self.lock = threading.Lock()
+        self.channel_ready = threading.Event()
+        self.unsupported = False
+        self.stopped = threading.Event()
+        self.thread: threading.Thread | None = None
+        self.stats = {"hits": 0, "misses": 0, "bypassed": 0, "evictions": 0, "invalidations": 0}
+        # Other per-worker caches keyed by version keys, invalidated alongside.
+        self.subscribers: list = []
 
-    # Generate 6-digit email code
-    auth_code = random.randint(100000, 999999)
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0 and self.channel_ready.is_set()
 
-    sender_email = os.environ.get("SMTP_EMAIL")
-    smtp_password = os.environ.get("SMTP_PASSWORD")
-    receiver_email = email
+    def get(self, key: str) -> tuple[str, dict] | None:
+        if not self.enabled:
+            self.stats["bypassed"] += 1
+            return None
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats["hits"] += 1
+            _, etag, doc, _ = entry
+            return etag, doc
+
+    def put(self, key: str, app_name: str, etag: str, doc: dict, stamp: int) -> None:
+        if not self.enabled:
+            return
+        size = len(bson_encode(doc))
+        if size > self.max_bytes // 8:
+            return
+        with self.lock:
+            if self.clock.stale(stamp, key, app_version_key(app_name)):
+                return
+            self.discard(key)
+            self.entries[key] = (app_name, etag, doc, size)
+            self.keys_by_app.setdefault(app_name, set()).add(key)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                self.discard(next(iter(self.entries)))
+                self.stats["evictions"] += 1
+
+    def discard(self, key: str) -> None:
+        # Caller holds self.lock.
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        app_name, _, _, size = entry
+        self.bytes -= size
+        app_keys = self.keys_by_app.get(app_name)
+        if app_keys is not None:
+            app_keys.discard(key)
+            if not app_keys:
+                del self.keys_by_app[app_name]
+
+    def invalidate(self, version_keys) -> None:
+        with self.lock:
+            for version_key in version_keys:
+                if version_key.startswith("collections:") or version_key.startswith("app:"):
+                    app_name = version_key.split(":", 1)[1]
+                    self.clock.mark(app_version_key(app_name))
+                    for key in list(self.keys_by_app.get(app_name, ())):
+                        self.discard(key)
+                        self.stats["invalidations"] += 1
+                else:
+                    self.clock.mark(version_key)
+                    if version_key in self.entries:
+                        self.discard(version_key)
+                        self.stats["invalidations"] += 1
+        for subscriber in self.subscribers:
+            subscriber.invalidate(version_keys)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.clock.mark_all()
+            self.entries.clear()
+            self.keys_by_app.clear()
+            self.bytes = 0
+        for subscriber in self.subscribers:
+            subscriber.clear()
+
+    def start(self) -> None:
+        if (self.max_bytes <= 0 and not self.subscribers) or self.thread is not None:
+            return
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.listen, name="object-cache-invalidation", daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.channel_ready.clear()
+        self.thread = None
+
+    def listen(self) -> None:
+        # Every bump_versions() in any worker is an insert or update on the
+        # versions collection, so its change stream is the invalidation channel.
+        pipeline = [{"$match": {"operationType": {"$in": ["insert", "update", "replace", "delete"]}}}]
+        while not self.stopped.is_set():
+            try:
+                if not change_streams_supported():
+                    self.unsupported = True
+                    print(
+                        "Object and capability caches disabled: change streams need a replica set "
+                        "or sharded cluster, and MongoDB is a standalone server."
+                    )
+                    return
+                with version_col.watch(pipeline, max_await_time_ms=1000) as stream:
+                    # Anything cached before the stream opened may have missed a bump.
+                    self.clear()
+                    self.channel_ready.set()
+                    while not self.stopped.is_set() and stream.alive:
+                        change = stream.try_next()
+                        if change is not None:
+                            self.invalidate([change["documentKey"]["_id"]])
+            except PyMongoError as e:
+                print("Object cache invalidation channel interrupted:", e)
+            self.channel_ready.clear()
+            self.clear()
+            self.stopped.wait(OBJECT_CACHE_RETRY_SECONDS)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "channel_ready": self.channel_ready.is_set(),
+                "change_streams_unsupported": self.unsupported,
+            }
 
-    with open("email_template.html") as f:
-        html_template = f.read()
 
-    html_content = html_template.replace("{{code}}", str(auth_code))
-    html_content = html_content.replace("{{app_name}}", scoped_app)
-    text_content = f"Your authentication code is: {auth_code}"
+def change_streams_supported() -> bool:
+    """False on a standalone mongod, where watch() always fails."""
+    hello = client.admin.command("hello")
+    return bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
 
-    msg = MIMEMultipart("alternative")
-    msg["Subject"] = "Authentication Code"
-    msg["From"] = sender_email
-    msg["To"] = receiver_email
-    msg.attach(MIMEText(text_content, "plain"))
-    msg.attach(MIMEText(html_content, "html"))
 
-    context = ssl.create_default_context()
+object_cache = ObjectCache(OBJECT_CACHE_MAX_BYTES)
+
+
+class SingleFlight:
+    """Coalesce concurrent identical reads into one database call.
+
+    The first caller for a key runs the read in a worker thread, which keeps
+    the event loop free to accept the duplicates that then join it. Everyone
+    gets the same result or exception. Dicts and lists are handed out as
+    shallow copies; nested values are shared and must not be mutated.
+    Keys must include everything the result depends on, including version
+    tokens where an ETag is paired with the result.
+    """
+
+    def __init__(self):
+        self.calls: dict[tuple, asyncio.Future] = {}
+        self.started = 0
+        self.joined = 0
+
+    async def do(self, key: tuple, fn, *args):
+        call = self.calls.get(key)
+        if call is None:
+            call = asyncio.ensure_future(asyncio.to_thread(fn, *args))
+            self.calls[key] = call
+            call.add_done_callback(lambda done: self.finished(key, done))
+            self.started += 1
+        else:
+            self.joined += 1
+        result = await asyncio.shield(call)
+        if isinstance(result, dict):
+            return dict(result)
+        if isinstance(result, list):
+            return list(result)
+        return result
+
+    def finished(self, key: tuple, call: asyncio.Future) -> None:
+        if self.calls.get(key) is call:
+            del self.calls[key]
+        if not call.cancelled():
+            call.exception()  # retrieved even if every caller went away
+
+    def snapshot(self) -> dict:
+        return {"in_flight": len(self.calls), "started": self.started, "joined": self.joined}
+
+
+single_flight = SingleFlight()
+
+
+def bump_versions(*keys: str) -> None:
+    """Give each key a fresh opaque token so ETags derived from it stop matching.
+
+    The only place version documents are created.
+    """
+    keys = list(dict.fromkeys(k for k in keys if k))
+    if not keys:
+        return
+    now = utcnow()
+    version_col.bulk_write(
+        [
+            UpdateOne({"_id": key}, {"$set": {"token": uuid4().hex, "updated_at": now}}, upsert=True)
+            for key in keys
+        ],
+        ordered=False,
+    )
+    object_cache.invalidate(keys)
+
+
+def drop_collection_versions(app_name: str, collection_name: str) -> None:
+    """Forget a dropped collection's object versions and move its app's token on."""
+    version_col.delete_many({"_id": {"$regex": f"^{re.escape(object_version_key(app_name, collection_name, ''))}"}})
+    version_col.delete_many({"_id": collection_version_key(app_name, collection_name)})
+    bump_versions(collections_version_key(app_name))
+
+
+def drop_app_versions(app_name: str) -> None:
+    """Forget every version key of a deleted app."""
+    keys = [app_version_key(app_name), collections_version_key(app_name)]
+    version_col.delete_many({"_id": {"$in": keys}})
+    version_col.delete_many({"_id": {"$regex": f"^(obj|col):{re.escape(app_name)}:"}})
+    object_cache.invalidate(keys)
+
+
+def user_app_names(user: dict) -> list[str]:
+    memberships = user.get("apps", [])
+    if not isinstance(memberships, list):
+        memberships = []
+    return [a for a in [user.get("app_name"), *memberships] if isinstance(a, str) and a]
+
+
+def bump_membership_versions(email: str | None, apps) -> None:
+    app_keys = [app_version_key(a) for a in apps if a]
+    bump_versions(user_version_key(email) if email else "", *app_keys)
+
+
+MEMBERSHIP_BACKFILL_LOCK = "memberships:backfill:v1"
+OWNER_EMAIL_BACKFILL_LOCK = "apps:owner_email:v1"
+SHARED_OBJECT_KEYS_LOCK = "app_objects:keys:v1"
+MEMBERSHIP_BACKFILL_BATCH_SIZE = 1000
+MIGRATION_RECHECK_SECONDS = 30
+# lock id -> (done, last checked). Readers keep the legacy query path until done.
+migration_state: dict[str, tuple[bool, float]] = {}
+
+
+def membership_ops(user: dict) -> list:
+    """Bulk ops that make memberships mirror one User_Info document."""
+    app_names = sorted(set(user_app_names(user)))
+    now = utcnow()
+    ops: list = [DeleteMany({"user_id": user["_id"], "app_name": {"$nin": app_names}})]
+    for app_name in app_names:
+        ops.append(
+            UpdateOne(
+                {"user_id": user["_id"], "app_name": app_name},
+                {
+                    "$set": {"email": user.get("email"), "role": user.get("type", "user")},
+                    "$setOnInsert": {"created_at": now},
+                },
+                upsert=True,
+            )
+        )
+    return ops
+
+
+def sync_memberships(*emails: str | None) -> None:
+    """Dual-write: re-derive memberships for every account with these emails.
+
+    Called after each User_Info write that changes app_name, apps or type, and
+    after deletes, which drop the memberships of accounts that no longer exist.
+    """
+    emails = list(dict.fromkeys(e for e in emails if e))
+    if not emails:
+        return
+    users = list(user_col.find({"email": {"$in": emails}}, {"email": 1, "app_name": 1, "apps": 1, "type": 1}))
+    ops: list = [DeleteMany({"email": {"$in": emails}, "user_id": {"$nin": [u["_id"] for u in users]}})]
+    for user in users:
+        ops.extend(membership_ops(user))
+    membership_col.bulk_write(ops, ordered=False)
+
+
+def backfill_memberships(heartbeat) -> None:
+    last_id = None
+    while True:
+        query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        users = list(
+            user_col.find(query, {"email": 1, "app_name": 1, "apps": 1, "type": 1})
+            .sort("_id", 1)
+            .limit(MEMBERSHIP_BACKFILL_BATCH_SIZE)
+        )
+        if not users:
+            return
+        ops: list = []
+        for user in users:
+            ops.extend(membership_ops(user))
+        membership_col.bulk_write(ops, ordered=False)
+        last_id = users[-1]["_id"]
+        heartbeat()
+
+
+def backfill_owner_emails(heartbeat) -> None:
+    apps_col = db.get_collection("apps")
+    ops = []
+    for doc in apps_col.find({"owner_email": {"$exists": False}}, {"created_by": 1, "created_by_request": 1}):
+        owner = resolve_app_creator(doc)
+        if owner != "unknown":
+            ops.append(UpdateOne({"_id": doc["_id"], "owner_email": {"$exists": False}}, {"$set": {"owner_email": owner}}))
+        if len(ops) >= MEMBERSHIP_BACKFILL_BATCH_SIZE:
+            apps_col.bulk_write(ops, ordered=False)
+            ops = []
+            heartbeat()
+    if ops:
+        apps_col.bulk_write(ops, ordered=False)
+
+
+def rekey_shared_objects(heartbeat) -> None:
+    """Move shared-storage documents written before per-app keys to a scoped _id."""
+    for cluster in cluster_names():
+        objects = shared_store(cluster)["app_objects"]
+        while True:
+            docs = list(
+                objects.find({"_id": {"$not": {"$type": "object"}}}).limit(MEMBERSHIP_BACKFILL_BATCH_SIZE)
+            )
+            if not docs:
+                break
+            rekeyed = [{**doc, "_id": shared_object_key(doc["_app"], doc["_col"], doc["_id"])} for doc in docs]
+            try:
+                objects.insert_many(rekeyed, ordered=False)
+            except BulkWriteError as e:
+                # Documents copied by an earlier, interrupted run are already there.
+                if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                    raise
+            objects.delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}})
+            heartbeat()
+
+
+# (lock id, task) run once per deployment, in order, after startup.
+MIGRATIONS = [
+    (MEMBERSHIP_BACKFILL_LOCK, backfill_memberships),
+    (OWNER_EMAIL_BACKFILL_LOCK, backfill_owner_emails),
+    (SHARED_OBJECT_KEYS_LOCK, rekey_shared_objects),
+]
+
+
+def run_migrations() -> None:
+    for lock_id, task in MIGRATIONS:
+        try:
+            if run_once(lock_id, task):
+                print(f"Migration {lock_id} finished.")
+        except PyMongoError as e:
+            print(f"Migration {lock_id} failed:", e)
+
+
+def migration_done(lock_id: str) -> bool:
+    done, checked_at = migration_state.get(lock_id, (False, 0.0))
+    now = utcnow().timestamp()
+    if done or now - checked_at < MIGRATION_RECHECK_SECONDS:
+        return done
+    try:
+        done = startup_lock_col.find_one({"_id": lock_id, "status": "done"}, {"_id": 1}) is not None
+    except PyMongoError:
+        done = False
+    migration_state[lock_id] = (done, now)
+    return done
+
+
+def memberships_ready() -> bool:
+    return migration_done(MEMBERSHIP_BACKFILL_LOCK)
+
+
+def find_app_member(email: str, app_name: str, projection: dict | None = None) -> dict | None:
+    if not memberships_ready():
+        return user_col.find_one({"email": email, **app_membership_filter(app_name)}, projection)
+    membership = membership_col.find_one(
+        {"app_name": app_name, "email": email}, {"user_id": 1}, sort=[("user_id", 1)]
+    )
+    if not membership:
+        return None
+    return user_col.find_one({"_id": membership["user_id"]}, projection)
+
+
+def iter_app_members(
+    app_name: str, projection: dict | None = None, batch_size: int = 1000, read_preference=None
+):
+    users = user_col.with_options(read_preference=read_preference)
+    if not memberships_ready():
+        yield from users.find(app_membership_filter(app_name), projection).batch_size(batch_size)
+        return
+    memberships = membership_col.with_options(read_preference=read_preference)
+    user_ids = (m["user_id"] for m in memberships.find({"app_name": app_name}, {"user_id": 1}).batch_size(batch_size))
+    while batch := list(islice(user_ids, batch_size)):
+        yield from users.find({"_id": {"$in": batch}}, projection)
+
+
+def count_app_members(app_name: str, read_preference=None) -> int:
+    if memberships_ready():
+        return membership_col.with_options(read_preference=read_preference).count_documents({"app_name": app_name})
+    return user_col.with_options(read_preference=read_preference).count_documents(app_membership_filter(app_name))
+
+
+def version_parent_key(key: str) -> str | None:
+    """The key whose bumps also change an unversioned object's token."""
+    if key.startswith(("obj:", "col:")):
+        return collections_version_key(key.split(":", 2)[1])
+    return None
+
+
+def read_versions(keys: list[str]) -> list[str]:
+    """Current token for each key. Reads never write.
+
+    Keys nobody has bumped get a token derived from VERSION_SEED and the
+    parent key's token, so data written before versioning existed (or before
+    this deploy) is never mistaken for an unchanged resource, and dropping a
+    collection or app changes it.
+    """
+    parents = {key: version_parent_key(key) for key in keys}
+    lookup = list(dict.fromkeys([*keys, *(parent for parent in parents.values() if parent)]))
+    found = {
+        doc["_id"]: doc["token"]
+        for doc in version_col.find({"_id": {"$in": lookup}}, {"token": 1})
+    }
+    tokens = []
+    for key in keys:
+        token = found.get(key)
+        if token is None:
+            parent = parents[key]
+            seed = f"{VERSION_SEED}|{key}|{found.get(parent, '') if parent else ''}"
+            token = hashlib.sha1(seed.encode("utf-8")).hexdigest()
+        tokens.append(token)
+    return tokens
+
+
+def compute_etag(keys: list[str], *extra) -> str:
+    parts = [*read_versions(keys), *(str(item) for item in extra)]
+    digest = hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:24]
+    # Weak: the compression middleware may re-encode the bytes.
+    return f'W/"{digest}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag.removeprefix("W/") in candidates
+
+
+def set_etag_headers(response: Response, etag: str) -> None:
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+
+
+def ping_mongo() -> None:
+    client.admin.command("ping")
+    print("Connected to MongoDB!")
+
+
+# FastAPI setup
+# Argon2 cost profiles: time_cost (iterations), memory_cost (KiB), parallelism.
+# Use tune_argon2.py to measure what a profile costs on the deployment hardware.
+ARGON2_PROFILES: dict[str, dict[str, int]] = {
+    "recommended": {"time_cost": 3, "memory_cost": 64 * 1024, "parallelism": 4},
+    "low_memory": {"time_cost": 2, "memory_cost": 19 * 1024, "parallelism": 1},
+    "high": {"time_cost": 4, "memory_cost": 128 * 1024, "parallelism": 4},
+}
+# Memory all concurrent hashes in one worker may use together (see PASSWORD_CONCURRENCY).
+ARGON2_MEMORY_BUDGET_MB = int(os.environ.get("ARGON2_MEMORY_BUDGET_MB", "512"))
+PASSWORD_CONCURRENCY = max(1, int(os.environ.get("PASSWORD_CONCURRENCY", "8")))
+
+
+def argon2_parameters() -> dict[str, int]:
+    profile_name = os.environ.get("ARGON2_PROFILE", "recommended").strip().lower()
+    if profile_name not in ARGON2_PROFILES:
+        print(f"Unknown ARGON2_PROFILE '{profile_name}', using 'recommended'")
+        profile_name = "recommended"
+    params = dict(ARGON2_PROFILES[profile_name])
+    for key in params:
+        override = os.environ.get(f"ARGON2_{key.upper()}")
+        if override:
+            params[key] = int(override)
+
+    # Keep PASSWORD_CONCURRENCY simultaneous hashes inside the worker's budget,
+    # paying for lost memory hardness with extra passes.
+    max_memory_cost = max(8 * params["parallelism"], ARGON2_MEMORY_BUDGET_MB * 1024 // PASSWORD_CONCURRENCY)
+    if params["memory_cost"] > max_memory_cost:
+        params["time_cost"] = math.ceil(params["time_cost"] * params["memory_cost"] / max_memory_cost)
+        params["memory_cost"] = max_memory_cost
+    return params
+
+
+ARGON2_PARAMETERS = argon2_parameters()
+password_hasher = Argon2Hasher(**ARGON2_PARAMETERS)
+password_hash = PasswordHash((password_hasher,))
+
+
+def get_allowed_origins():
+    collection = db.get_collection("app_domains")
+    docs = list(collection.find({}, {"_id": 0, "url": 1, "URLS": 1}))
+
+    origins = []
+
+    for doc in docs:
+        values = []
+
+        if "url" in doc and doc["url"]:
+            values.append(doc["url"])
+
+        if "URLS" in doc and isinstance(doc["URLS"], list):
+            values.extend(doc["URLS"])
+
+        for url in values:
+            if not isinstance(url, str):
+                continue
+
+            url = url.strip().rstrip("/")
+            if not url:
+                continue
+
+            if not url.startswith(("http://", "https://")):
+                url = f"https://{url}"
+
+            origins.append(url)
+
+    return list(dict.fromkeys(origins))
+
+
+# CORSMiddleware only does membership checks on allow_origins, so handing it this
+# set lets startup fill it in after the middleware stack has been built.
+cors_origins: set[str] = set()
+
+
+def reload_allowed_origins() -> list[str]:
+    origins = get_allowed_origins()
+    cors_origins.clear()
+    cors_origins.update(origins)
+    print("CORS origins loaded:", origins)
+    return origins
+
+
+# In Docker, WORKDIR is /app
+CANDIDATES = [
+    Path("/app/Portal/dist"),
+    Path(__file__).parent / "Portal" / "dist",
+]
+
+PORTAL_DIST: Path | None = None
+portal_static: "PortalStaticFiles | None" = None
+# Content-hashed files listed in the build's Vite manifest, relative to dist/.
+portal_hashed_assets: set[str] | None = None
+
+PORTAL_MEMORY_MAX_BYTES = int(os.environ.get("PORTAL_MEMORY_MAX_BYTES", str(512 * 1024)))
+PORTAL_COMPRESSIBLE_SUFFIXES = {".html", ".js", ".css", ".svg", ".json", ".txt", ".map"}
+PRECOMPRESSED_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+# Vite emits content-hashed names like assets/index-CRNPcvx5.js. Only used for
+# bundles built without a manifest: exactly eight hash characters, at least one
+# a digit, so names like app-settings.json are not mistaken for hashed ones.
+HASHED_ASSET_RE = re.compile(r"-(?=[A-Za-z_-]{0,7}[0-9])[A-Za-z0-9_-]{8}\.[A-Za-z0-9]+$")
+PORTAL_MANIFEST = Path(".vite") / "manifest.json"
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+
+def parse_accept_encoding(header: str | None) -> dict[str, float]:
+    weights: dict[str, float] = {}
+    for part in (header or "").split(","):
+        token, _, params = part.partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        weight = 1.0
+        params = params.strip().lower()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[token] = weight
+    return weights
+
+
+def choose_encoding(header: str | None, available: list[str]) -> str | None:
+    """Pick the first of `available` (in server preference order) the client accepts."""
+    weights = parse_accept_encoding(header)
+    wildcard = weights.get("*", 0.0)
+    for encoding in available:
+        if weights.get(encoding, wildcard) > 0:
+            return encoding
+    return None
+
+
+def load_portal_manifest(dist: Path) -> set[str] | None:
+    """Every output file the Vite manifest lists; all of them carry a content hash."""
+    try:
+        manifest = json.loads((dist / PORTAL_MANIFEST).read_text())
+    except (OSError, ValueError):
+        return None
+    files = set()
+    for chunk in manifest.values():
+        files.add(chunk.get("file"))
+        files.update(chunk.get("css", []))
+        files.update(chunk.get("assets", []))
+    files.discard(None)
+    return files
+
+
+def portal_cache_control(relative_path: str) -> str:
+    normalized = relative_path.replace(os.sep, "/")
+    if portal_hashed_assets is not None:
+        hashed = normalized in portal_hashed_assets
+    else:
+        hashed = normalized.startswith("assets/") and bool(HASHED_ASSET_RE.search(normalized))
+    return IMMUTABLE_CACHE_CONTROL if hashed else REVALIDATE_CACHE_CONTROL
+
+
+class PortalStaticFiles(StaticFiles):
+    """StaticFiles for the Vite bundle.
+
+    Serves .br/.gz siblings produced by the Portal build, marks hashed assets
+    immutable, revalidates everything else by ETag, and keeps files up to
+    PORTAL_MEMORY_MAX_BYTES (with their compressed variants) in memory.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.memory: dict[str, dict] = {}
+
+    def warm(self) -> None:
+        for path in Path(self.directory).rglob("*"):
+            if path.is_file() and path.suffix not in {".br", ".gz"}:
+                self.load_into_memory(str(path), path.stat())
+
+    def load_into_memory(self, full_path: str, stat_result: os.stat_result) -> dict | None:
+        if stat_result.st_size > PORTAL_MEMORY_MAX_BYTES:
+            return None
+
+        raw = Path(full_path).read_bytes()
+        variants = {"identity": raw}
+        for encoding, suffix in PRECOMPRESSED_SUFFIXES.items():
+            sibling = Path(full_path + suffix)
+            if sibling.is_file():
+                variants[encoding] = sibling.read_bytes()
+        if Path(full_path).suffix in PORTAL_COMPRESSIBLE_SUFFIXES:
+            if "gzip" not in variants:
+                variants["gzip"] = gzip.compress(raw, compresslevel=9)
+            if "br" not in variants and brotli is not None:
+                variants["br"] = brotli.compress(raw)
+        variants = {k: v for k, v in variants.items() if k == "identity" or len(v) < len(raw)}
+
+        entry = {
+            "mtime_ns": stat_result.st_mtime_ns,
+            "size": stat_result.st_size,
+            "media_type": mimetypes.guess_type(full_path)[0] or "application/octet-stream",
+            "etag": hashlib.md5(raw).hexdigest(),
+            "last_modified": formatdate(stat_result.st_mtime, usegmt=True),
+            "variants": variants,
+        }
+        self.memory[full_path] = entry
+        return entry
+
+    def file_response(
+        self,
+        full_path,
+        stat_result: os.stat_result,
+        scope,
+        status_code: int = 200,
+    ) -> Response:
+        full_path = str(full_path)
+        request_headers = Headers(scope=scope)
+        accept_encoding = request_headers.get("accept-encoding")
+        headers = {
+            "Cache-Control": portal_cache_control(os.path.relpath(full_path, str(self.directory))),
+            "Vary": "Accept-Encoding",
+        }
+
+        entry = self.memory.get(full_path)
+        if entry and (entry["mtime_ns"], entry["size"]) != (stat_result.st_mtime_ns, stat_result.st_size):
+            entry = None
+        if entry is None:
+            entry = self.load_into_memory(full_path, stat_result)
+
+        if entry:
+            encoding = choose_encoding(accept_encoding, [e for e in ("br", "gzip") if e in entry["variants"]])
+            headers["ETag"] = f'"{entry["etag"]}-{encoding}"' if encoding else f'"{entry["etag"]}"'
+            headers["Last-Modified"] = entry["last_modified"]
+            if encoding:
+                headers["Content-Encoding"] = encoding
+            if self.is_not_modified(Headers(headers=headers), request_headers):
+                return NotModifiedResponse(Headers(headers=headers))
+            return Response(
+                entry["variants"][encoding or "identity"],
+                status_code=status_code,
+                media_type=entry["media_type"],
+                headers=headers,
+            )
+
+        # Too large to pin in memory: stream from disk, preferring a prebuilt sibling.
+        available = [e for e, suffix in PRECOMPRESSED_SUFFIXES.items() if os.path.isfile(full_path + suffix)]
+        encoding = choose_encoding(accept_encoding, available)
+        response = FileResponse(full_path, status_code=status_code, stat_result=stat_result, headers=headers)
+        if encoding:
+            variant_path = full_path + PRECOMPRESSED_SUFFIXES[encoding]
+            response = FileResponse(
+                variant_path,
+                status_code=status_code,
+                media_type=response.media_type,
+                headers={
+                    **headers,
+                    "Content-Encoding": encoding,
+                    "ETag": response.headers["etag"][:-1] + f'-{encoding}"',
+                    "Last-Modified": response.headers["last-modified"],
+                },
+            )
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+def locate_portal_dist() -> Path | None:
+    global PORTAL_DIST, portal_static, portal_hashed_assets
+    PORTAL_DIST = next((p for p in CANDIDATES if p.exists()), None)
+    if PORTAL_DIST:
+        portal_hashed_assets = load_portal_manifest(PORTAL_DIST)
+        portal_static = PortalStaticFiles(directory=str(PORTAL_DIST), html=True)
+        portal_static.warm()
+    return PORTAL_DIST
+
+
+def mount_portal(target_app: FastAPI) -> None:
+    if not portal_static:
+        return
+    if any(getattr(route, "name", None) == "portal" for route in target_app.routes):
+        return
+    target_app.mount("/portal", portal_static, name="portal")
+
+
+STARTUP_STEPS = [
+    ("mongo ping", ping_mongo),
+    ("index build", ensure_indexes_once),
+    ("cors origins", reload_allowed_origins),
+    ("portal bundle", locate_portal_dist),
+    ("dummy password hash", lambda: dummy_password_hash()),
+]
+
+
+startup_state = {"ready": False}
+
+
+def run_startup_step(label: str, func) -> None:
+    try:
+        func()
+    except Exception as e:
+        print(f"Startup step '{label}' failed:", e)
+
+
+def run_startup_tasks_sync() -> None:
+    for label, func in STARTUP_STEPS:
+        run_startup_step(label, func)
+    startup_state["ready"] = True
+
+
+async def run_startup_tasks() -> None:
+    # pymongo is blocking, so each step gets its own thread and they overlap.
+    await asyncio.gather(
+        *(asyncio.to_thread(run_startup_step, label, func) for label, func in STARTUP_STEPS)
+    )
+    startup_state["ready"] = True
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if not startup_state["ready"]:
+        await run_startup_tasks()
+    mount_portal(app)
+    object_cache.start()
+    threading.Thread(target=run_migrations, name="migrations", daemon=True).start()
+    print("FastAPI app has started.")
+    yield
+    print("FastAPI app is shutting down.")
+    object_cache.stop()
+    change_feeds.close_all()
+    close_cluster_clients()
+    client.close()
+
+
+app = FastAPI(lifespan=lifespan)
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=cors_origins,
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", "1024"))
+# Bodies at least this large are compressed off the event loop.
+COMPRESSION_THREAD_MIN_SIZE = int(os.environ.get("COMPRESSION_THREAD_MIN_SIZE", str(128 * 1024)))
+COMPRESSIBLE_CONTENT_TYPES = (
+    "text/",
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+)
+compression_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("COMPRESSION_THREADS", "2")),
+    thread_name_prefix="compression",
+)
+
+
+def available_compression_encodings() -> list[str]:
+    # Server preference order; zstd and br need their optional packages.
+    encodings = []
+    if zstandard is not None:
+        encodings.append("zstd")
+    if brotli is not None:
+        encodings.append("br")
+    encodings.append("gzip")
+    return encodings
+
+
+class StreamCompressor:
+    """Incremental compressor that flushes after every chunk so streamed
+    responses reach the client as they are produced."""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "zstd":
+            self._obj = zstandard.ZstdCompressor(level=3).compressobj()
+        elif encoding == "br":
+            self._obj = brotli.Compressor(quality=5)
+        else:
+            self._obj = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        if self.encoding == "zstd":
+            out = self._obj.compress(data)
+            return out + (self._obj.flush() if final else self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK))
+        if self.encoding == "br":
+            out = self._obj.process(data)
+            return out + (self._obj.finish() if final else self._obj.flush())
+        out = self._obj.compress(data)
+        return out + self._obj.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class CompressionMiddleware:
+    """Negotiates zstd/br/gzip for compressible responses of at least
+    `minimum_size` bytes, including streaming responses."""
+
+    def __init__(
+        self,
+        app,
+        minimum_size: int = COMPRESSION_MIN_SIZE,
+        thread_min_size: int = COMPRESSION_THREAD_MIN_SIZE,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.thread_min_size = thread_min_size
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(
+            Headers(scope=scope).get("accept-encoding"),
+            available_compression_encodings(),
+        )
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = CompressionResponder(send, encoding, self.minimum_size, self.thread_min_size)
+        await self.app(scope, receive, responder.send)
+
+
+class CompressionResponder:
+    def __init__(self, send, encoding: str, minimum_size: int, thread_min_size: int):
+        self.downstream = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.thread_min_size = thread_min_size
+        self.start_message: dict | None = None
+        self.compressor: StreamCompressor | None = None
+        self.passthrough = False
+        self.buffer = b""
+
+    def should_compress(self, headers: MutableHeaders) -> bool:
+        status_code = self.start_message.get("status", 200)
+        if status_code < 200 or status_code in {204, 304}:
+            return False
+        if "content-encoding" in headers:
+            return False
+        if status_code == 206 or "content-range" in headers:
+            # Byte ranges refer to the identity body; compressing would break them.
+            return False
+        if "no-transform" in headers.get("cache-control", "").lower():
+            return False
+        content_type = headers.get("content-type", "").lower()
+        if content_type.startswith("text/event-stream"):
+            # Buffering up to minimum_size would hold back live events.
+            return False
+        return content_type.startswith(COMPRESSIBLE_CONTENT_TYPES)
+
+    async def compress(self, data: bytes, final: bool) -> bytes:
+        if len(data) >= self.thread_min_size:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(compression_executor, self.compressor.compress, data, final)
+        return self.compressor.compress(data, final)
+
+    async def flush_uncompressed(self, body: bytes, more_body: bool) -> None:
+        self.passthrough = True
+        await self.downstream(self.start_message)
+        await self.downstream({"type": "http.response.body", "body": body, "more_body": more_body})
+
+    async def send(self, message) -> None:
+        if message["type"] == "http.response.start":
+            self.start_message = message
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            if self.start_message is not None and not self.passthrough:
+                self.passthrough = True
+                await self.downstream(self.start_message)
+            await self.downstream(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.compressor is None:
+            headers = MutableHeaders(scope=self.start_message)
+            if not self.should_compress(headers):
+                await self.flush_uncompressed(body, more_body)
+                return
+
+            # Hold back small leading chunks until we know the body is worth compressing.
+            self.buffer += body
+            if len(self.buffer) < self.minimum_size:
+                if more_body:
+                    return
+                await self.flush_uncompressed(self.buffer, False)
+                return
+
+            self.compressor = StreamCompressor(self.encoding)
+            data = await self.compress(self.buffer, final=not more_body)
+            self.buffer = b""
+
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            if more_body:
+                del headers["Content-Length"]
+            else:
+                headers["Content-Length"] = str(len(data))
+            await self.downstream(self.start_message)
+            await self.downstream({"type": "http.response.body", "body": data, "more_body": more_body})
+            return
+
+        data = await self.compress(body, final=not more_body)
+        await self.downstream({"type": "http.response.body", "body": data, "more_body": more_body})
+
+
+app.add_middleware(CompressionMiddleware)
+
+
+@app.get("/portal")
+def portal_root(request: Request):
+    if PORTAL_DIST and portal_static:
+        index_path = PORTAL_DIST / "index.html"
+        return portal_static.file_response(index_path, index_path.stat(), request.scope)
+    return {
+        "error": "Portal not built in this deployment",
+        "checked": [str(p) for p in CANDIDATES],
+        "cwd": os.getcwd(),
+        "files_here": os.listdir("."),
+    }
+
+
+if PRELOAD_STARTUP:
+    # gunicorn --preload: do the one-off work in the master so every forked worker
+    # inherits origins and the portal path. The default client stays open: a closed
+    # MongoClient can't be reused, and pymongo resets its pools in each forked child.
+    # Extra cluster clients are dropped and rebuilt lazily by cluster_client().
+    run_startup_tasks_sync()
+    mount_portal(app)
+    close_cluster_clients()
+
+
+class User(BaseModel):
+    email: str | None = None
+    disabled: bool | None = None
+
+
+class UserInDB(User):
+    hashed_password: str
+
+class SessionData(BaseModel):
+    email: str
+    app_name: str = PORTAL_APP
+    session_id: UUID
+    expires_at: datetime
+    elevated_until: datetime | None = None
+    # cluster -> operation/cluster time of the user's last write, for causal reads.
+    causal: dict | None = None
+
+# Cookie frontend
+cookie_do = SessionCookie(
+    cookie_name="fastapi_session",
+    identifier="basic-cookie",
+    secret_key=SESSION_SECRET_KEY,
+    cookie_params=CookieParameters(
+        path="/",
+        secure=True,
+        httponly=True,
+        samesite="none",
+        max_age=3600,
+    ),
+)
+
+
+def get_password_hash(password: str) -> str:
+    return password_hash.hash(password)
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return password_hash.verify(plain_password, hashed_password)
+
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    return password_hasher.check_needs_rehash(hashed_password)
+
+
+def store_rehashed_password(user_id, plain_password: str, old_hash: str) -> None:
+    try:
+        user_col.update_one(
+            {"_id": user_id, "hashed_password": old_hash},
+            {"$set": {"hashed_password": get_password_hash(plain_password)}},
+        )
+    except PyMongoError as e:
+        print("Password rehash failed:", e)
+
+
+async def rehash_user_password(user_id, plain_password: str, old_hash: str) -> None:
+    """Re-hash with the current profile; skipped if the password changed meanwhile.
+
+    Runs in a password slot like any other hash, so it stays inside the argon2
+    memory budget. When every slot is busy it is skipped; the next login retries.
+    """
+    slots = endpoint_slots["password"]
+    if slots.locked():
+        return
+    async with slots:
+        await asyncio.to_thread(store_rehashed_password, user_id, plain_password, old_hash)
+
+
+_dummy_password_hash: str | None = None
+
+
+def dummy_password_hash() -> str:
+    # Verified against when no account matches, so unknown emails cost the same hash.
+    global _dummy_password_hash
+    if _dummy_password_hash is None:
+        _dummy_password_hash = get_password_hash(uuid4().hex)
+    return _dummy_password_hash
+
+
+def resolve_login_candidate(email: str, app_name: str | None) -> dict | None:
+    """Pick the single account a login attempt is checked against.
+
+    Order: the account scoped to the requested app, then one listing it in the
+    legacy apps array. Without an app: the portal account, then the oldest one.
+    """
+    oldest_first = [("_id", 1)]
+    if email == "admin":
+        return user_col.find_one({"email": email}, sort=oldest_first)
+
+    if app_name is not None and app_name.strip() != "":
+        scoped_app = normalize_app_name(app_name)
+        return user_col.find_one(
+            {"email": email, "app_name": scoped_app}, sort=oldest_first
+        ) or find_app_member(email, scoped_app)
+
+    return user_col.find_one(
+        {"email": email, "app_name": PORTAL_APP}, sort=oldest_first
+    ) or user_col.find_one({"email": email}, sort=oldest_first)
+
+
+def verify_login(email: str, password: str, app_name: str | None) -> dict | None:
+    user = resolve_login_candidate(email, app_name)
+    stored_hash = (user or {}).get("hashed_password") or dummy_password_hash()
+    if not verify_password(password, stored_hash) or not user:
+        return None
+    return user
+
+
+def create_session(email: str, app_name: str) -> UUID:
+    session_id = uuid4()
+    expires_at = utcnow() + timedelta(hours=1)
+
+    session_collection.insert_one(
+        {
+            "_id": str(session_id),   # store UUID as string for consistency
+            "email": email,
+            "app_name": app_name,
+            "expires_at": expires_at,  # datetime (timezone-aware)
+        }
+    )
+    return session_id
+
+def read_session(session_id: UUID) -> SessionData | None:
+    doc = session_collection.find_one({"_id": str(session_id)})
+    if not doc:
+        return None
+
+    expires_at = coerce_utc_datetime(doc.get("expires_at"))
+    if not expires_at:
+        return None
+
+    # If expired, clean up and treat as missing.
+    # Defensive fallback for any legacy/odd datetime representation.
+    try:
+        is_expired = expires_at < utcnow()
+    except TypeError:
+        normalized = coerce_utc_datetime(expires_at)
+        if not normalized:
+            session_collection.delete_one({"_id": str(session_id)})
+            return None
+        expires_at = normalized
+        is_expired = expires_at < utcnow()
+
+    if is_expired:
+        session_collection.delete_one({"_id": str(session_id)})
+        return None
+
+    return SessionData(
+        email=doc["email"],
+        app_name=doc.get("app_name", PORTAL_APP),
+        session_id=session_id,
+        expires_at=expires_at,
+        elevated_until=coerce_utc_datetime(doc.get("elevated_until")),
+        causal=doc.get("causal"),
+    )
+
+def delete_session(session_id: UUID) -> None:
+    session_collection.delete_one({"_id": str(session_id)})
+    elevation_cache.pop(str(session_id), None)
+
+async def get_session_id(request: Request) -> UUID:
+    raw = request.cookies.get("fastapi_session")
+    if not raw:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    try:
+        return UUID(raw)
+    except ValueError:
+        raise HTTPException(status_code=401, detail="Invalid session cookie")
+
+async def require_session(session_id: UUID = Depends(get_session_id)) -> SessionData:
+    session = await single_flight.do(("session", str(session_id)), read_session, session_id)
+    if not session:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired session",
+        )
+    return session
+
+
+def get_logged_in_user(session: SessionData):
+    user = user_col.find_one(user_scope_query(session.email, session.app_name))
+    if user:
+        return user
+    # Backward compatibility for legacy accounts without app_name.
+    return user_col.find_one({"email": session.email})
+
+
+async def load_logged_in_user(session: SessionData):
+    """get_logged_in_user, shared between concurrent requests of the same login."""
+    return await single_flight.do(("user", session.email, session.app_name), get_logged_in_user, session)
+
+
+async def load_app_doc(app_name: str, projection: dict | None = None) -> dict | None:
+    """The app's apps document, shared between concurrent lookups."""
+    key = ("app", app_name, json.dumps(projection, sort_keys=True))
+    return await single_flight.do(key, db.get_collection("apps").find_one, {"app_name": app_name}, projection)
+
+
+CAP_USER = "user"  # logged in with an existing account
+CAP_DEVELOPER = "developer"  # developer or admin account
+CAP_ADMIN = "admin"
+CAP_MEMBER = "member"  # may use the app; admins always may
+CAP_OWNER = "owner"  # owns the app
+CAP_MANAGE = "manage"  # developer account that owns the app, or admin
+APP_CAPABILITIES = {CAP_MEMBER, CAP_OWNER, CAP_MANAGE}
+CAPABILITY_ERRORS = {
+    CAP_USER: "You must be logged in",
+    CAP_DEVELOPER: "Developer access required",
+    CAP_ADMIN: "Admin access required",
+    CAP_MEMBER: "You must be a member of this app",
+    CAP_OWNER: "Owner access required",
+    CAP_MANAGE: "Owner access required",
+}
+CAPABILITY_CACHE_SECONDS = 60
+CAPABILITY_CACHE_MAX_ENTRIES = 10_000
+
+
+class Capabilities:
+    """What one login may do, overall and within one app."""
+
+    def __init__(self, user: dict | None, app_name: str | None, app_exists: bool, granted: frozenset[str]):
+        self.user = user
+        self.app_name = app_name
+        self.app_exists = app_exists
+        self.granted = granted
+
+    def __contains__(self, capability: str) -> bool:
+        return capability in self.granted
+
+
+def compute_capabilities(session: SessionData, app_name: str | None) -> Capabilities:
+    user = get_logged_in_user(session)
+    if user is not None:
+        user = {k: v for k, v in user.items() if k != "hashed_password"}
+    granted: set[str] = set()
+    if user:
+        granted.add(CAP_USER)
+        if user.get("type") in {"developer", "admin"}:
+            granted.add(CAP_DEVELOPER)
+        if user.get("type") == "admin":
+            granted.add(CAP_ADMIN)
+
+    normalized_app = app_name.strip().lower() if app_name else None
+    app_doc = None
+    if normalized_app:
+        app_doc = db.get_collection("apps").find_one(
+            {"app_name": normalized_app}, {"_id": 0, "owner_email": 1, "created_by": 1, "created_by_request": 1}
+        )
+        if user and user_has_app_access(user, app_name):
+            granted.add(CAP_MEMBER)
+        if user and app_doc is not None and resolve_app_creator(app_doc) == session.email:
+            granted.add(CAP_OWNER)
+        if CAP_ADMIN in granted or (CAP_DEVELOPER in granted and CAP_OWNER in granted):
+            granted.add(CAP_MANAGE)
+    return Capabilities(user, normalized_app, app_doc is not None, frozenset(granted))
+
+
+class CapabilityCache:
+    """Per-worker cache of Capabilities by (email, session app, app).
+
+    Entries for an email are dropped when its user version key is bumped, and
+    entries for an app when its app version key is, which every role,
+    membership and ownership change does. Bumps from other workers arrive
+    through the object cache's versions change stream; while that is down the
+    cache is bypassed.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries: OrderedDict[tuple, tuple[float, Capabilities]] = OrderedDict()
+        self.keys_by_email: dict[str, set[tuple]] = {}
+        self.keys_by_app: dict[str, set[tuple]] = {}
+        self.clock = InvalidationClock()
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and object_cache.channel_ready.is_set()
+
+    def get(self, key: tuple) -> Capabilities | None:
+        if not self.enabled:
+            return None
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self.stats["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[1]
+
+    def put(self, key: tuple, capabilities: Capabilities, stamp: int) -> None:
+        if not self.enabled or capabilities.user is None:
+            return
+        scopes = [user_version_key(key[0])]
+        if capabilities.app_name:
+            scopes.append(app_version_key(capabilities.app_name))
+        with self.lock:
+            if self.clock.stale(stamp, *scopes):
+                return
+            self.discard(key)
+            self.entries[key] = (time.monotonic() + self.ttl_seconds, capabilities)
+            self.keys_by_email.setdefault(key[0], set()).add(key)
+            if capabilities.app_name:
+                self.keys_by_app.setdefault(capabilities.app_name, set()).add(key)
+            while len(self.entries) > self.max_entries:
+                self.discard(next(iter(self.entries)))
+
+    def discard(self, key: tuple) -> None:
+        # Caller holds self.lock.
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        for index, value in ((self.keys_by_email, key[0]), (self.keys_by_app, entry[1].app_name)):
+            keys = index.get(value)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del index[value]
+
+    def invalidate(self, version_keys) -> None:
+        with self.lock:
+            for version_key in version_keys:
+                kind, _, value = version_key.partition(":")
+                index = {"user": self.keys_by_email, "app": self.keys_by_app}.get(kind)
+                if index is None:
+                    continue
+                self.clock.mark(version_key)
+                for key in list(index.get(value, ())):
+                    self.discard(key)
+                    self.stats["invalidations"] += 1
+
+    def clear(self) -> None:
+        with self.lock:
+            self.clock.mark_all()
+            self.entries.clear()
+            self.keys_by_email.clear()
+            self.keys_by_app.clear()
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {**self.stats, "entries": len(self.entries), "enabled": self.enabled}
+
+
+capability_cache = CapabilityCache(
+    int(os.environ.get("CAPABILITY_CACHE_MAX_ENTRIES", str(CAPABILITY_CACHE_MAX_ENTRIES))),
+    CAPABILITY_CACHE_SECONDS,
+)
+object_cache.subscribers.append(capability_cache)
+
+
+def capability_key(session: SessionData, app_name: str | None) -> tuple:
+    return (session.email, session.app_name, app_name or "")
+
+
+def refresh_capabilities(session: SessionData, app_name: str | None) -> Capabilities:
+    stamp = capability_cache.clock.now()
+    capabilities = compute_capabilities(session, app_name)
+    capability_cache.put(capability_key(session, app_name), capabilities, stamp)
+    return capabilities
+
+
+def resolve_capabilities(session: SessionData, app_name: str | None = None) -> Capabilities:
+    cached = capability_cache.get(capability_key(session, app_name))
+    return cached if cached is not None else refresh_capabilities(session, app_name)
+
+
+async def load_capabilities(session: SessionData, app_name: str | None = None) -> Capabilities:
+    """resolve_capabilities without blocking the event loop on a cache miss."""
+    cached = capability_cache.get(capability_key(session, app_name))
+    if cached is not None:
+        return cached
+    key = ("capabilities", *capability_key(session, app_name))
+    return await single_flight.do(key, refresh_capabilities, session, app_name)
+
+
+async def request_app_name(request: Request) -> str | None:
+    """The app a request is about: path parameter, query string or form field."""
+    app_name = request.path_params.get("app_name") or request.query_params.get("app_name")
+    content_type = request.headers.get("content-type", "")
+    if not app_name and content_type.startswith(("application/x-www-form-urlencoded", "multipart/form-data")):
+        app_name = (await request.form()).get("app_name")
+    return app_name if isinstance(app_name, str) else None
+
+
+def require_capabilities(*needed: str, detail: dict[str, str] | None = None):
+    """Route dependency returning the caller's Capabilities, or 403 on the first missing one."""
+    app_scoped = any(capability in APP_CAPABILITIES for capability in needed)
+
+    async def dependency(request: Request, session: SessionData = Depends(require_session)) -> Capabilities:
+        capabilities = await load_capabilities(session, await request_app_name(request) if app_scoped else None)
+        for capability in needed:
+            if capability not in capabilities:
+                raise HTTPException(403, (detail or {}).get(capability) or CAPABILITY_ERRORS[capability])
+        return capabilities
+
+    return dependency
+
+
+admin_access = require_capabilities(CAP_ADMIN)
+app_member_access = require_capabilities(
+    CAP_USER,
+    CAP_MEMBER,
+    detail={CAP_MEMBER: "You must be a developer or user of this app"},
+)
+developer_app_access = require_capabilities(
+    CAP_DEVELOPER,
+    CAP_MEMBER,
+    detail={
+        CAP_DEVELOPER: "You must be logged in as an developer",
+        CAP_MEMBER: "You must be a developer of this app",
+    },
+)
+
+
+async def app_manager_access(request: Request, session: SessionData = Depends(require_session)) -> Capabilities:
+    """Route dependency with require_app_owner_or_admin's checks, for owner routes."""
+    normalized_app = str(await request_app_name(request) or "").strip().lower()
+    capabilities = await load_capabilities(session, normalized_app)
+    check_app_management(normalized_app, capabilities)
+    return capabilities
+
+RATE_LIMIT_STORE = os.environ.get("RATE_LIMIT_STORE", "mongo").strip().lower()
+TRUST_PROXY_HEADERS = os.environ.get("TRUST_PROXY_HEADERS", "").strip().lower() in {"1", "true", "yes"}
+# endpoint -> dimension -> (burst capacity, tokens refilled per minute)
+RATE_LIMITS: dict[str, dict[str, tuple[int, float]]] = {
+    "login": {"ip": (20, 10), "email": (10, 5)},
+    "register": {"ip": (5, 2), "email": (3, 1), "app": (60, 30)},
+    "reset_password": {"ip": (5, 2), "email": (3, 1), "app": (60, 30)},
+}
+# Logins per minute across a whole app, off by default: one busy app's users
+# would otherwise lock each other out. The bucket allows bursts of twice this.
+LOGIN_APP_RATE_LIMIT = int(os.environ.get("LOGIN_APP_RATE_LIMIT", "0") or 0)
+if LOGIN_APP_RATE_LIMIT > 0:
+    RATE_LIMITS["login"]["app"] = (2 * LOGIN_APP_RATE_LIMIT, LOGIN_APP_RATE_LIMIT)
+# Per-worker caps on in-flight expensive work, by endpoint class.
+ENDPOINT_CONCURRENCY = {
+    "password": PASSWORD_CONCURRENCY,
+    "smtp": int(os.environ.get("SMTP_CONCURRENCY", "4")),
+    "bulk": int(os.environ.get("BULK_CONCURRENCY", "1")),
+}
+RATE_LIMIT_MEMORY_MAX_KEYS = 100_000
+
+
+class MemoryRateLimitStore:
+    """Token buckets in this worker's memory."""
+
+    def __init__(self):
+        self.buckets: dict[str, tuple[float, float]] = {}
+
+    def take(self, key: str, capacity: int, per_minute: float) -> float:
+        """Consume one token; return 0 when allowed, else seconds until one is available."""
+        rate = per_minute / 60
+        now = utcnow().timestamp()
+        tokens, updated = self.buckets.get(key, (float(capacity), now))
+        tokens = min(float(capacity), tokens + (now - updated) * rate)
+        if tokens < 1:
+            self.buckets[key] = (tokens, now)
+            return (1 - tokens) / rate
+        self.buckets[key] = (tokens - 1, now)
+        if len(self.buckets) > RATE_LIMIT_MEMORY_MAX_KEYS:
+            self.buckets.clear()
+        return 0.0
+
+
+class MongoRateLimitStore:
+    """Token buckets shared by every worker, updated atomically in rate_limits."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def take(self, key: str, capacity: int, per_minute: float) -> float:
+        rate = per_minute / 60
+        now = utcnow()
+        refilled = {
+            "$min": [
+                capacity,
+                {
+                    "$add": [
+                        {"$ifNull": ["$tokens", capacity]},
+                        {
+                            "$multiply": [
+                                {"$divide": [{"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}, 1000]},
+                                rate,
+                            ]
+                        },
+                    ]
+                },
+            ]
+        }
+        doc = self.collection.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {"tokens": refilled, "updated_at": now}},
+                {
+                    "$set": {
+                        "allowed": {"$gte": ["$tokens", 1]},
+                        "tokens": {"$cond": [{"$gte": ["$tokens", 1]}, {"$subtract": ["$tokens", 1]}, "$tokens"]},
+                        "expires_at": now + timedelta(seconds=capacity / rate),
+                    }
+                },
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        if doc.get("allowed"):
+            return 0.0
+        return (1 - doc.get("tokens", 0)) / rate
+
+
+class RateLimiter:
+    def __init__(self, shared=None):
+        self.local = MemoryRateLimitStore()
+        self.shared = shared
+
+    async def check(self, endpoint: str, **values: str | None) -> float:
+        for dimension, value in values.items():
+            if not value or dimension not in RATE_LIMITS[endpoint]:
+                continue
+            capacity, per_minute = RATE_LIMITS[endpoint][dimension]
+            key = f"{endpoint}:{dimension}:{value.strip().lower()}"
+            # The local bucket can only be looser than the shared one, so a local
+            # refusal is final and costs no round trip.
+            retry_after = self.local.take(key, capacity, per_minute)
+            if retry_after:
+                return retry_after
+            if self.shared is None:
+                continue
+            try:
+                retry_after = await asyncio.to_thread(self.shared.take, key, capacity, per_minute)
+            except PyMongoError as e:
+                # Fail open: a rate-limit store outage shouldn't take logins down with it.
+                print("Rate limit store error:", e)
+                continue
+            if retry_after:
+                return retry_after
+        return 0.0
+
+
+rate_limiter = RateLimiter(
+    shared=MongoRateLimitStore(db.get_collection("rate_limits")) if RATE_LIMIT_STORE == "mongo" else None
+)
+endpoint_slots = {name: asyncio.Semaphore(limit) for name, limit in ENDPOINT_CONCURRENCY.items()}
+
+
+def client_ip(request: Request) -> str:
+    if TRUST_PROXY_HEADERS:
+        forwarded = request.headers.get("x-forwarded-for", "")
+        if forwarded.strip():
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+async def enforce_rate_limit(
+    endpoint: str,
+    request: Request,
+    email: str | None = None,
+    app_name: str | None = None,
+) -> None:
+    retry_after = await rate_limiter.check(endpoint, ip=client_ip(request), email=email, app=app_name)
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+
+@asynccontextmanager
+async def admission(endpoint_class: str):
+    """Shed load instead of queueing once a worker is at its cap for this class."""
+    slots = endpoint_slots[endpoint_class]
+    if slots.locked():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server busy, please retry",
+            headers={"Retry-After": "1"},
+        )
+    async with slots:
+        yield
+
+
+# Per-worker admission for app data endpoints. Limits can be overridden per
+# app with the "limits" field of its apps document.
+APP_SCHEDULER_SLOTS = int(os.environ.get("APP_SCHEDULER_SLOTS", "16"))
+APP_QUEUE_TIMEOUT_SECONDS = float(os.environ.get("APP_QUEUE_TIMEOUT_SECONDS", "5"))
+APP_LIMITS_CACHE_SECONDS = 30
+DEFAULT_APP_LIMITS = {
+    # Requests of one app running at once in this worker.
+    "max_concurrency": int(os.environ.get("APP_MAX_CONCURRENCY", "4")),
+    # Requests of one app waiting for a slot; beyond this they get 429.
+    "max_queue": int(os.environ.get("APP_MAX_QUEUE", "32")),
+    # Share of contended slots relative to other apps.
+    "weight": 1,
+}
+APP_LIMITS_CEILING = {"max_concurrency": APP_SCHEDULER_SLOTS, "max_queue": 1000, "weight": 100}
+# app_name -> (cached at, limits)
+app_limits_cache: dict[str, tuple[float, dict]] = {}
+
+
+def app_limits(app_name: str) -> dict:
+    now = time.monotonic()
+    cached = app_limits_cache.get(app_name)
+    if cached and now - cached[0] < APP_LIMITS_CACHE_SECONDS:
+        return cached[1]
+    limits = dict(DEFAULT_APP_LIMITS)
+    doc = db.get_collection("apps").find_one({"app_name": app_name}, {"limits": 1}) or {}
+    stored = doc.get("limits")
+    if isinstance(stored, dict):
+        for key, ceiling in APP_LIMITS_CEILING.items():
+            if isinstance(stored.get(key), int) and stored[key] >= 1:
+                limits[key] = min(stored[key], ceiling)
+    if len(app_limits_cache) > 10_000:
+        app_limits_cache.clear()
+    app_limits_cache[app_name] = (now, limits)
+    return limits
+
+
+class AppLane:
+    def __init__(self):
+        self.limits = dict(DEFAULT_APP_LIMITS)
+        self.in_flight = 0
+        self.waiters: deque = deque()  # (virtual start tag, future)
+        self.last_tag = 0.0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def snapshot(self) -> dict:
+        return {
+            "limits": self.limits,
+            "in_flight": self.in_flight,
+            "waiting": len(self.waiters),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "avg_wait_ms": round(self.wait_seconds / self.queued * 1000, 1) if self.queued else 0.0,
+            "max_wait_ms": round(self.max_wait_seconds * 1000, 1),
+        }
+
+
+class AppScheduler:
+    """Weighted fair queuing of app requests over this worker's slots.
+
+    An app runs at most max_concurrency requests at once. When slots are
+    contended, waiting requests are served in order of virtual start tag:
+    each queued request advances its app's tag by 1/weight, so apps get slots
+    in proportion to their weight however many requests they send. Requests
+    beyond max_queue, or waiting longer than APP_QUEUE_TIMEOUT_SECONDS, get 429.
+    """
+
+    def __init__(self, slots: int):
+        self.slots = slots
+        self.busy = 0
+        self.waiting = 0
+        self.virtual_time = 0.0
+        self.lanes: dict[str, AppLane] = {}
+
+    def lane(self, app_name: str) -> AppLane:
+        lane = self.lanes.get(app_name)
+        if lane is None:
+            if len(self.lanes) >= 10_000:
+                for name in [n for n, item in self.lanes.items() if not item.in_flight and not item.waiters]:
+                    del self.lanes[name]
+            lane = self.lanes[app_name] = AppLane()
+        return lane
+
+    def grant(self, lane: AppLane) -> None:
+        lane.in_flight += 1
+        lane.admitted += 1
+        self.busy += 1
+
+    def reject(self, lane: AppLane, detail: str) -> None:
+        lane.rejected += 1
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=detail,
+            headers={"Retry-After": "1"},
+        )
+
+    async def acquire(self, app_name: str, limits: dict) -> None:
+        lane = self.lane(app_name)
+        lane.limits = limits
+        if lane.in_flight < limits["max_concurrency"] and self.busy < self.slots and not self.waiting:
+            self.grant(lane)
+            return
+        if len(lane.waiters) >= limits["max_queue"]:
+            self.reject(lane, "Too many requests for this app")
+
+        tag = max(self.virtual_time, lane.last_tag)
+        lane.last_tag = tag + 1 / limits["weight"]
+        future = asyncio.get_running_loop().create_future()
+        entry = (tag, future)
+        lane.waiters.append(entry)
+        lane.queued += 1
+        self.waiting += 1
+        # Others may be queued only because their app is at its own cap.
+        self.dispatch()
+        started = time.monotonic()
+        try:
+            await asyncio.wait({future}, timeout=APP_QUEUE_TIMEOUT_SECONDS)
+        except asyncio.CancelledError:
+            if future.done():
+                self.release(app_name)
+            else:
+                lane.waiters.remove(entry)
+                self.waiting -= 1
+            raise
+        waited = time.monotonic() - started
+        lane.wait_seconds += waited
+        lane.max_wait_seconds = max(lane.max_wait_seconds, waited)
+        if not future.done():
+            lane.waiters.remove(entry)
+            self.waiting -= 1
+            future.cancel()
+            lane.timed_out += 1
+            self.reject(lane, "Timed out waiting for a slot for this app")
+
+    def release(self, app_name: str) -> None:
+        self.lanes[app_name].in_flight -= 1
+        self.busy -= 1
+        self.dispatch()
+
+    def dispatch(self) -> None:
+        while self.busy < self.slots:
+            ready = [
+                lane
+                for lane in self.lanes.values()
+                if lane.waiters and lane.in_flight < lane.limits["max_concurrency"]
+            ]
+            if not ready:
+                return
+            lane = min(ready, key=lambda item: item.waiters[0][0])
+            tag, future = lane.waiters.popleft()
+            self.waiting -= 1
+            self.virtual_time = max(self.virtual_time, tag)
+            self.grant(lane)
+            future.set_result(True)
+
+    def snapshot(self) -> dict:
+        return {
+            "slots": self.slots,
+            "busy": self.busy,
+            "waiting": self.waiting,
+            "apps": {name: lane.snapshot() for name, lane in sorted(self.lanes.items())},
+        }
+
+
+app_scheduler = AppScheduler(APP_SCHEDULER_SLOTS)
+
+
+def app_admission(access):
+    """Route dependency: authorize with `access`, then hold one of the app's scheduler slots.
+
+    Authorization runs first, so only callers allowed into an app can take
+    or queue for its slots.
+    """
+
+    async def dependency(capabilities: Capabilities = Depends(access)):
+        normalized_app = capabilities.app_name
+        await app_scheduler.acquire(normalized_app, app_limits(normalized_app))
+        try:
+            yield
+        finally:
+            app_scheduler.release(normalized_app)
+
+    return dependency
+
+
+member_admission = app_admission(app_member_access)
+developer_admission = app_admission(developer_app_access)
+manager_admission = app_admission(app_manager_access)
+
+
+def send_smtp_message(sender_email: str, smtp_password: str, receiver_email: str, msg: MIMEMultipart) -> None:
+    context = ssl.create_default_context()
     with smtplib.SMTP_SSL("smtp.gmail.com", 465, context=context) as server:
         server.login(sender_email, smtp_password)
         server.sendmail(sender_email, receiver_email, msg.as_string())
 
+
+ADMIN_ELEVATION_MINUTES = int(os.environ.get("ADMIN_ELEVATION_MINUTES", "10"))
+# session_id -> elevated_until; the session document is the source of truth across workers.
+elevation_cache: dict[str, datetime] = {}
+
+
+def session_is_elevated(session: SessionData) -> bool:
+    until = elevation_cache.get(str(session.session_id)) or session.elevated_until
+    return until is not None and until > utcnow()
+
+
+def grant_elevation(session: SessionData) -> None:
+    now = utcnow()
+    until = min(now + timedelta(minutes=ADMIN_ELEVATION_MINUTES), session.expires_at)
+    session_collection.update_one({"_id": str(session.session_id)}, {"$set": {"elevated_until": until}})
+    if len(elevation_cache) > 10_000:
+        for key in [k for k, v in elevation_cache.items() if v <= now]:
+            del elevation_cache[key]
+    elevation_cache[str(session.session_id)] = until
+
+
+async def require_admin_password(session: SessionData, admin_password: str | None) -> None:
+    """Check the admin password once, then trust the session for ADMIN_ELEVATION_MINUTES."""
+    if session_is_elevated(session):
+        return
+    if not admin_password:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Admin password required")
+
+    admin_user = user_col.find_one({"email": "admin"}, {"hashed_password": 1})
+    stored_hash = (admin_user or {}).get("hashed_password") or dummy_password_hash()
+    async with admission("password"):
+        valid = await asyncio.to_thread(verify_password, admin_password, stored_hash)
+    if not valid or not admin_user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Incorrect admin password",
+        )
+    grant_elevation(session)
+
+
+@app.get("/")
+async def root():
+    routes = [
+        {"path": route.path, "methods": sorted(list(getattr(route, "methods", []) or []))}
+        for route in app.routes
+    ]
+    return {"message": "API is running", "routes": routes}
+
+
+@app.post("/login")
+async def login(
+    email: Annotated[str, Form()],
+    password: Annotated[str, Form()],
+    request: Request,
+    response: Response,
+    background_tasks: BackgroundTasks,
+    app_name: Annotated[str | None, Form()] = None,
+):
+    scoped_app = normalize_app_name(app_name)
+    await enforce_rate_limit("login", request, email=email, app_name=scoped_app)
+
+    async with admission("password"):
+        user = await asyncio.to_thread(verify_login, email, password, app_name)
+    if not user:
+        raise HTTPException(status_code=401, detail="Incorrect email or password")
+
+    if password_needs_rehash(user["hashed_password"]):
+        background_tasks.add_task(rehash_user_password, user["_id"], password, user["hashed_password"])
+
+    user_app = user.get("app_name") or user.get("apps", [scoped_app])[0] or scoped_app
+    session_id = create_session(email, normalize_app_name(user_app))
+
+    response.set_cookie(
+        key="fastapi_session",
+        value=str(session_id),
+        max_age=3600,
+        path="/",
+        secure=True,
+        httponly=True,
+        samesite="none",
+    )
+
+    return {"message": "Login successful"}
+
+@app.post("/register")
+async def register_user(
+    password: Annotated[str, Form()],
+    request: Request,
+    email: Annotated[str, Form()] = None,
+    app_name: Annotated[str | None, Form()] = None,
+):
+    scoped_app = normalize_app_name(app_name)
+    await enforce_rate_limit("register", request, email=email, app_name=scoped_app)
+
+    if user_col.find_one(user_scope_query(email, scoped_app)):
+        raise HTTPException(400, "Email already exists")
+
+    match = re.match(r"^[_a-z0-9-]+(\.[_a-z0-9-]+)*@[a-z0-9-]+(\.[a-z0-9-]+)*(\.[a-z]{2,4})$", email)
+    if not match:
+        raise HTTPException(400, "Invalid email format")
+
+    if scoped_app != PORTAL_APP:
+        apps = db.get_collection("apps")
+        if not apps.find_one({"app_name": scoped_app}):
+            raise HTTPException(404, "App not found")
+
+    async with admission("password"):
+        hashed_password = await asyncio.to_thread(get_password_hash, password)
+
+    # Generate 6-digit email code
+    auth_code = random.randint(100000, 999999)
+
+    sender_email = os.environ.get("SMTP_EMAIL")
+    smtp_password = os.environ.get("SMTP_PASSWORD")
+    receiver_email = email
+
+    with open("email_template.html") as f:
+        html_template = f.read()
+
+    html_content = html_template.replace("{{code}}", str(auth_code))
+    html_content = html_content.replace("{{app_name}}", scoped_app)
+    text_content = f"Your authentication code is: {auth_code}"
+
+    msg = MIMEMultipart("alternative")
+    msg["Subject"] = "Authentication Code"
+    msg["From"] = sender_email
+    msg["To"] = receiver_email
+    msg.attach(MIMEText(text_content, "plain"))
+    msg.attach(MIMEText(html_content, "html"))
+
+    async with admission("smtp"):
+        await asyncio.to_thread(send_smtp_message, sender_email, smtp_password, receiver_email, msg)
+
     verification_col.insert_one(
         {
             "email": email,
@@ -738,23 +3120,38 @@ async def verify_email(
         }
     )
 
+    object_keys = []
     if scoped_app != PORTAL_APP:
-        target_db = client[scoped_app]
+        target_db = app_db(scoped_app, write=True)
         for col in target_db.list_collection_names():
             if col == "User_Info":
                 continue
             target_db[col].insert_one({"userId": email})
+            object_keys.append(object_version_key(scoped_app, col, email))
+            object_keys.append(collection_version_key(scoped_app, col))
 
+    sync_memberships(email)
+    bump_membership_versions(email, [scoped_app])
+    bump_versions(*object_keys)
     verification_col.delete_one({"email": email})
     return {"message": "User registered successfully"}
 
 
 @app.get("/me")
-async def me(session: SessionData = Depends(require_session)):
-    logged_in_user = get_logged_in_user(session)
+async def me(
+    request: Request,
+    response: Response,
+    session: SessionData = Depends(require_session),
+):
+    etag = compute_etag([user_version_key(session.email)], session.email, session.app_name)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    logged_in_user = await load_logged_in_user(session)
 
     if not logged_in_user:
         raise HTTPException(status_code=401, detail="problem retieving user data")
+    set_etag_headers(response, etag)
     return {
         "email": session.email,
         "app_name": session.app_name,
@@ -780,9 +3177,9 @@ async def logout(
 
 @app.post("/create_app")
 async def create_app(
-    admin_password: Annotated[str, Form()],
     app_name: Annotated[str, Form()],
     response: Response,
+    admin_password: Annotated[str | None, Form()] = None,
     session: SessionData = Depends(require_session),
 ):
     normalized_app = app_name.strip().lower()
@@ -800,12 +3197,7 @@ async def create_app(
     if not logged_in_user or logged_in_user.get("type") not in ["developer", "admin"]:
         raise HTTPException(403, "You must be logged in as an developer")
 
-    admin_user = user_col.find_one({"email": "admin"})
-    if not verify_password(admin_password, admin_user["hashed_password"]):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Incorrect admin password",
-        )
+    await require_admin_password(session, admin_password)
 
     if app_name_exists(normalized_app):
         raise HTTPException(
@@ -818,16 +3210,28 @@ async def create_app(
             user_scope_query(session.email, session.app_name),
             {"$set": {"app_name": normalized_app}, "$addToSet": {"apps": normalized_app}},
         )
+        sync_memberships(session.email)
+        bump_membership_versions(session.email, [normalized_app])
 
-    new_db = client[normalized_app]
+    new_db = app_db(normalized_app, mode=DEFAULT_APP_STORAGE, cluster=DEFAULT_APP_CLUSTER)
     if "default_collection" not in new_db.list_collection_names():
         new_db.create_collection("default_collection")
 
     apps.update_one(
         {"app_name": normalized_app},
-        {"$setOnInsert": {"app_name": normalized_app, "created_at": utcnow(), "created_by": session.email}},
+        {
+            "$setOnInsert": {
+                "app_name": normalized_app,
+                "created_at": utcnow(),
+                "created_by": session.email,
+                "owner_email": session.email,
+                "storage": DEFAULT_APP_STORAGE,
+                "cluster": DEFAULT_APP_CLUSTER,
+            }
+        },
         upsert=True,
     )
+    bump_versions(app_version_key(normalized_app))
 
     return {"message": "App created successfully"}
 
@@ -882,6 +3286,77 @@ async def request_app_creation(
     return {"message": "App creation request submitted"}
 
 
+# Admin listings page with keyset cursors over indexed sort keys rather than
+# skip/limit, so every page costs the same no matter how deep it is.
+# Without a limit, listings return as many rows as they did before pagination,
+# so clients that don't follow next_cursor don't lose rows.
+ADMIN_USERS_DEFAULT_LIMIT = 1000
+APP_REQUESTS_DEFAULT_LIMIT = 500
+LISTING_MAX_PAGE_SIZE = 1000
+LISTING_COUNT_CACHE_SECONDS = 60
+LISTING_COUNT_MAX_TIME_MS = int(os.environ.get("LISTING_COUNT_MAX_TIME_MS", "1000"))
+# (collection, filter) -> (cached at, count)
+listing_count_cache: dict[tuple[str, str], tuple[float, int]] = {}
+
+
+def listing_page_size(limit: int) -> int:
+    if limit < 1 or limit > LISTING_MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be 1-{LISTING_MAX_PAGE_SIZE}")
+    return limit
+
+
+def prefix_filter(prefix: str) -> dict:
+    """Anchored, case-sensitive regex, which MongoDB answers with an index range scan."""
+    return {"$regex": "^" + re.escape(prefix.strip())}
+
+
+def encode_cursor(values: list) -> str:
+    return base64.urlsafe_b64encode(json_util.dumps(values).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str, types: tuple[type, ...]) -> list:
+    """Decode a cursor from encode_cursor, checking each value's type.
+
+    The type check keeps a hand-crafted cursor from smuggling query operators
+    into the keyset filter.
+    """
+    try:
+        values = json_util.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, TypeError, InvalidId):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if (
+        not isinstance(values, list)
+        or len(values) != len(types)
+        or not all(isinstance(v, t) for v, t in zip(values, types))
+    ):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+def listing_total(collection, query: dict) -> tuple[int | None, bool]:
+    """(total, estimated) for a listing.
+
+    Unfiltered totals come from collection metadata. Filtered counts are cached
+    per worker and capped at LISTING_COUNT_MAX_TIME_MS; a count that runs out of
+    time is reported as None rather than holding up the page.
+    """
+    if not query:
+        return collection.estimated_document_count(), True
+    key = (collection.name, json_util.dumps(query, sort_keys=True))
+    now = time.monotonic()
+    cached = listing_count_cache.get(key)
+    if cached and now - cached[0] < LISTING_COUNT_CACHE_SECONDS:
+        return cached[1], False
+    try:
+        total = collection.count_documents(query, maxTimeMS=LISTING_COUNT_MAX_TIME_MS)
+    except ExecutionTimeout:
+        return None, False
+    if len(listing_count_cache) > 10_000:
+        listing_count_cache.clear()
+    listing_count_cache[key] = (now, total)
+    return total, False
+
+
 def serialize_app_request(doc: dict) -> dict:
     created_at = coerce_utc_datetime(doc.get("created_at"))
     reviewed_at = coerce_utc_datetime(doc.get("reviewed_at"))
@@ -902,11 +3377,16 @@ def serialize_app_request(doc: dict) -> dict:
 @app.get("/app_creation_requests")
 async def list_app_creation_requests(
     status_filter: str | None = None,
+    email_prefix: str | None = None,
+    app_prefix: str | None = None,
+    limit: int = APP_REQUESTS_DEFAULT_LIMIT,
+    cursor: str | None = None,
     session: SessionData = Depends(require_session),
 ):
     logged_in_user = get_logged_in_user(session)
     user_type = (logged_in_user or {}).get("type", "user")
     is_admin = user_type == "admin"
+    limit = listing_page_size(limit)
 
     query: dict = {}
     if status_filter:
@@ -916,15 +3396,36 @@ async def list_app_creation_requests(
 
     if not is_admin:
         query["requested_by"] = session.email
-
+    elif email_prefix:
+        query["requested_by"] = prefix_filter(email_prefix)
+    if app_prefix:
+        query["requested_app_name"] = prefix_filter(app_prefix.lower())
+
+    # Newest first by _id: it is always an ObjectId, while created_at is a
+    # string on requests written by older versions.
+    page_query = dict(query)
+    if cursor:
+        (last_id,) = decode_cursor(cursor, (ObjectId,))
+        page_query["_id"] = {"$lt": last_id}
+
+    requests_col = listing_collection("app_creation_requests")
     try:
-        docs = list(app_request_col.find(query).sort("created_at", -1).limit(500))
+        docs = list(requests_col.find(page_query).sort("_id", -1).limit(limit + 1))
+        total, total_estimated = listing_total(requests_col, query)
     except PyMongoError:
         raise HTTPException(status_code=503, detail="Database error while fetching requests")
 
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor([docs[-1]["_id"]])
+
     return {
         "is_admin": is_admin,
         "requests": [serialize_app_request(doc) for doc in docs],
+        "next_cursor": next_cursor,
+        "total": total,
+        "total_estimated": total_estimated,
     }
 
 
@@ -932,12 +3433,9 @@ async def list_app_creation_requests(
 async def update_app_creation_request_status(
     request_id: str,
     status_value: Annotated[str, Form(alias="status")],
+    capabilities: Capabilities = Depends(admin_access),
     session: SessionData = Depends(require_session),
 ):
-    logged_in_user = get_logged_in_user(session)
-    if not logged_in_user or logged_in_user.get("type") != "admin":
-        raise HTTPException(status_code=403, detail="Admin access required")
-
     if status_value not in {"approved", "denied"}:
         raise HTTPException(status_code=400, detail="Status must be approved or denied")
 
@@ -979,6 +3477,7 @@ async def update_app_creation_request_status(
             if requester:
                 requester_snapshot = {
                     "_id": requester["_id"],
+                    "email": requester.get("email"),
                     "apps": list(requester.get("apps", [])) if isinstance(requester.get("apps"), list) else [],
                     "type": requester.get("type", "user"),
                 }
@@ -990,6 +3489,9 @@ async def update_app_creation_request_status(
                         "app_name": requested_app,
                         "created_at": now,
                         "created_by_request": str(oid),
+                        "owner_email": existing.get("requested_by"),
+                        "storage": DEFAULT_APP_STORAGE,
+                        "cluster": DEFAULT_APP_CLUSTER,
                     },
                     "$set": {"current_domain": requested_domain},
                 },
@@ -1004,10 +3506,13 @@ async def update_app_creation_request_status(
                 if requester.get("type") not in {"developer", "admin"}:
                     updates["$set"] = {"type": "developer"}
                 user_col.update_one({"_id": requester["_id"]}, updates)
+                sync_memberships(requester.get("email"))
+                bump_membership_versions(requester.get("email"), [requested_app])
 
-            target_db = client[requested_app]
+            target_db = app_db(requested_app, write=True)
             if "default_collection" not in target_db.list_collection_names():
                 target_db.create_collection("default_collection")
+            bump_versions(app_version_key(requested_app), collections_version_key(requested_app))
 
         app_request_col.update_one(
             {"_id": oid},
@@ -1038,19 +3543,12 @@ async def update_app_creation_request_status(
     return {"message": "Request updated", "request": serialize_app_request(updated or existing)}
 
 
-@app.get("/admin/apps")
-async def admin_list_apps(session: SessionData = Depends(require_session)):
-    logged_in_user = get_logged_in_user(session)
-    if not logged_in_user or logged_in_user.get("type") != "admin":
-        raise HTTPException(status_code=403, detail="Admin access required")
-
-    apps_col = db.get_collection("apps")
-    app_docs = list(apps_col.find({}, {"_id": 0}))
+def admin_app_rows() -> list[dict]:
+    app_docs = list(listing_collection("apps").find({}, {"_id": 0}))
     known = {str(doc.get("app_name", "")).strip().lower() for doc in app_docs if doc.get("app_name")}
 
     # Include legacy databases missing metadata rows.
-    for db_name in client.list_database_names():
-        normalized = db_name.strip().lower()
+    for normalized in sorted(cluster_database_names()):
         if normalized in RESERVED_DB_NAMES or normalized in known:
             continue
         app_docs.append({"app_name": normalized})
@@ -1060,7 +3558,7 @@ async def admin_list_apps(session: SessionData = Depends(require_session)):
         name = str(doc.get("app_name", "")).strip().lower()
         if not name or name in RESERVED_DB_NAMES:
             continue
-        users_count = user_col.count_documents(app_membership_filter(name))
+        users_count = count_app_members(name, READ_PREFERENCES["listing"])
         items.append(
             {
                 "app_name": name,
@@ -1073,18 +3571,23 @@ async def admin_list_apps(session: SessionData = Depends(require_session)):
         )
 
     items.sort(key=lambda x: x["app_name"])
-    return {"apps": items}
+    return items
+
+
+@app.get("/admin/apps")
+async def admin_list_apps(capabilities: Capabilities = Depends(admin_access)):
+    # Every admin sees the same list; concurrent page loads share one scan.
+    return {"apps": await single_flight.do(("admin_apps",), admin_app_rows)}
 
 
 @app.post("/admin/create_app")
 async def admin_create_app(
     app_name: Annotated[str, Form()],
+    storage: Annotated[str | None, Form()] = None,
+    cluster: Annotated[str | None, Form()] = None,
+    capabilities: Capabilities = Depends(admin_access),
     session: SessionData = Depends(require_session),
 ):
-    logged_in_user = get_logged_in_user(session)
-    if not logged_in_user or logged_in_user.get("type") != "admin":
-        raise HTTPException(status_code=403, detail="Admin access required")
-
     normalized_app = app_name.strip().lower()
     if not re.match(r"^[a-z0-9][a-z0-9_-]{2,49}$", normalized_app):
         raise HTTPException(
@@ -1095,35 +3598,117 @@ async def admin_create_app(
         raise HTTPException(status_code=400, detail="App name is reserved")
     if app_name_exists(normalized_app):
         raise HTTPException(status_code=409, detail="App name already exists")
-
-    target_db = client[normalized_app]
+    storage_mode = (storage or DEFAULT_APP_STORAGE).strip().lower()
+    if storage_mode not in APP_STORAGE_MODES:
+        raise HTTPException(status_code=400, detail="storage must be database or shared")
+    cluster_name = (cluster or DEFAULT_APP_CLUSTER).strip()
+    if cluster_name not in cluster_names():
+        raise HTTPException(status_code=400, detail=f"cluster must be one of: {', '.join(cluster_names())}")
+
+    target_db = app_db(normalized_app, mode=storage_mode, cluster=cluster_name)
     if "default_collection" not in target_db.list_collection_names():
         target_db.create_collection("default_collection")
 
     db.get_collection("apps").update_one(
         {"app_name": normalized_app},
-        {"$setOnInsert": {"app_name": normalized_app, "created_at": utcnow(), "created_by": session.email}},
+        {
+            "$setOnInsert": {
+                "app_name": normalized_app,
+                "created_at": utcnow(),
+                "created_by": session.email,
+                "owner_email": session.email,
+                "storage": storage_mode,
+                "cluster": cluster_name,
+            }
+        },
         upsert=True,
     )
     user_col.update_one({"email": session.email}, {"$addToSet": {"apps": normalized_app}})
+    sync_memberships(session.email)
+    bump_membership_versions(session.email, [normalized_app])
+    bump_versions(app_version_key(normalized_app), collections_version_key(normalized_app))
     return {"message": "App created successfully", "app_name": normalized_app}
 
 
 @app.get("/admin/users")
 async def admin_list_users(
     app_name: str | None = None,
+    email_prefix: str | None = None,
+    user_type: str | None = None,
+    limit: int = ADMIN_USERS_DEFAULT_LIMIT,
+    cursor: str | None = None,
+    capabilities: Capabilities = Depends(admin_access),
     session: SessionData = Depends(require_session),
 ):
-    logged_in_user = get_logged_in_user(session)
-    if not logged_in_user or logged_in_user.get("type") != "admin":
-        raise HTTPException(status_code=403, detail="Admin access required")
+    limit = listing_page_size(limit)
+    if user_type and user_type not in {"user", "developer", "admin"}:
+        raise HTTPException(status_code=400, detail="Invalid user type")
 
+    # Users are listed by (email, _id). Membership documents carry the same
+    # pair as (email, user_id), so one cursor works for both paths.
     query: dict = {}
-    if app_name:
-        normalized = app_name.strip().lower()
-        query = app_membership_filter(normalized)
+    if email_prefix:
+        query["email"] = prefix_filter(email_prefix)
+    keyset: dict = {}
+    if cursor:
+        last_email, last_id = decode_cursor(cursor, (str, ObjectId))
+        keyset = {"email": last_email, "id": last_id}
+
+    projection = {"email": 1, "type": 1, "app_name": 1, "apps": 1}
+    try:
+        if app_name and memberships_ready():
+            query["app_name"] = app_name.strip().lower()
+            if user_type:
+                query["role"] = user_type
+            members_col = listing_collection("memberships")
+            page_query = dict(query)
+            if keyset:
+                page_query["$or"] = [
+                    {"email": {"$gt": keyset["email"]}},
+                    {"email": keyset["email"], "user_id": {"$gt": keyset["id"]}},
+                ]
+            members = list(
+                members_col.find(page_query, {"email": 1, "user_id": 1})
+                .sort([("email", 1), ("user_id", 1)])
+                .limit(limit + 1)
+            )
+            user_ids = [m["user_id"] for m in members]
+            users = {
+                d["_id"]: d
+                for d in listing_collection("User_Info").find({"_id": {"$in": user_ids}}, projection)
+            }
+            # A membership may briefly outlive its user; keep the page's keys anyway.
+            docs = [users.get(m["user_id"], {"_id": m["user_id"], "email": m.get("email")}) for m in members]
+            total, total_estimated = listing_total(members_col, query)
+        else:
+            if app_name:
+                query.update(app_membership_filter(app_name.strip().lower()))
+            if user_type:
+                query["type"] = user_type
+            users_col = listing_collection("User_Info")
+            page_query = dict(query)
+            if keyset:
+                page_query = {
+                    "$and": [
+                        query,
+                        {
+                            "$or": [
+                                {"email": {"$gt": keyset["email"]}},
+                                {"email": keyset["email"], "_id": {"$gt": keyset["id"]}},
+                            ]
+                        },
+                    ]
+                }
+            docs = list(users_col.find(page_query, projection).sort([("email", 1), ("_id", 1)]).limit(limit + 1))
+            total, total_estimated = listing_total(users_col, query)
+    except PyMongoError:
+        raise HTTPException(status_code=503, detail="Database error while fetching users")
+
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor([str(docs[-1].get("email", "")), docs[-1]["_id"]])
 
-    docs = list(user_col.find(query, {"_id": 0, "email": 1, "type": 1, "app_name": 1, "apps": 1}).limit(1000))
     rows = []
     for d in docs:
         apps_value = d.get("apps", [])
@@ -1137,8 +3722,7 @@ async def admin_list_users(
                 "apps": [str(a) for a in apps_value],
             }
         )
-    rows.sort(key=lambda x: x.get("email", ""))
-    return {"users": rows}
+    return {"users": rows, "next_cursor": next_cursor, "total": total, "total_estimated": total_estimated}
 
 
 @app.post("/admin/users/role")
@@ -1146,24 +3730,22 @@ async def admin_change_user_role(
     target_email: Annotated[str, Form()],
     new_type: Annotated[str, Form()],
     app_name: Annotated[str | None, Form()] = None,
+    capabilities: Capabilities = Depends(admin_access),
     session: SessionData = Depends(require_session),
 ):
-    logged_in_user = get_logged_in_user(session)
-    if not logged_in_user or logged_in_user.get("type") != "admin":
-        raise HTTPException(status_code=403, detail="Admin access required")
     if new_type not in {"user", "developer", "admin"}:
         raise HTTPException(status_code=400, detail="Invalid user type")
 
-    query: dict = {"email": target_email}
     if app_name:
-        normalized = app_name.strip().lower()
-        query = {"email": target_email, **app_membership_filter(normalized)}
-
-    target = user_col.find_one(query)
+        target = find_app_member(target_email, app_name.strip().lower())
+    else:
+        target = user_col.find_one({"email": target_email})
     if not target:
         raise HTTPException(status_code=404, detail="Target user not found")
 
     user_col.update_one({"_id": target["_id"]}, {"$set": {"type": new_type}})
+    sync_memberships(target_email)
+    bump_membership_versions(target_email, user_app_names(target))
     return {"message": "User role updated"}
 
 
@@ -1174,15 +3756,16 @@ async def my_owned_apps(session: SessionData = Depends(require_session)):
         raise HTTPException(status_code=403, detail="Developer access required")
 
     apps_col = db.get_collection("apps")
-    app_docs = list(apps_col.find({}, {"_id": 0}))
+    if migration_done(OWNER_EMAIL_BACKFILL_LOCK):
+        app_docs = list(apps_col.find({"owner_email": session.email}, {"_id": 0, "app_name": 1, "created_at": 1}))
+    else:
+        app_docs = [doc for doc in apps_col.find({}, {"_id": 0}) if resolve_app_creator(doc) == session.email]
     owned = []
 
     for doc in app_docs:
         app_name = str(doc.get("app_name", "")).strip().lower()
         if not app_name or app_name in RESERVED_DB_NAMES:
             continue
-        if resolve_app_creator(doc) != session.email:
-            continue
         owned.append(
             {
                 "app_name": app_name,
@@ -1199,33 +3782,32 @@ async def my_owned_apps(session: SessionData = Depends(require_session)):
 @app.get("/my_owned_apps/{app_name}/details")
 async def my_owned_app_details(
     app_name: str,
+    request: Request,
+    response: Response,
     session: SessionData = Depends(require_session),
 ):
-    logged_in_user = get_logged_in_user(session)
-    if not logged_in_user or logged_in_user.get("type") not in {"developer", "admin"}:
+    normalized_app = app_name.strip().lower()
+    capabilities = await load_capabilities(session, normalized_app)
+    if CAP_DEVELOPER not in capabilities:
         raise HTTPException(status_code=403, detail="Developer access required")
 
-    normalized_app = app_name.strip().lower()
     if not re.match(r"^[a-z0-9][a-z0-9_-]{2,49}$", normalized_app):
-        raise HTTPException(status_code=400, detail="Invalid app name")
-    if normalized_app in RESERVED_DB_NAMES or normalized_app == PORTAL_APP:
-        raise HTTPException(status_code=404, detail="App not found")
-
-    app_doc = db.get_collection("apps").find_one({"app_name": normalized_app}, {"_id": 0})
-    if not app_doc:
+        raise HTTPException(status_code=400, detail="Invalid app name")
+    if normalized_app in RESERVED_DB_NAMES or normalized_app == PORTAL_APP or not capabilities.app_exists:
         raise HTTPException(status_code=404, detail="App not found")
 
-    if logged_in_user.get("type") != "admin" and resolve_app_creator(app_doc) != session.email:
+    if CAP_MANAGE not in capabilities:
         raise HTTPException(status_code=403, detail="You do not own this app")
 
-    target_db = client[normalized_app]
+    etag = compute_etag([app_version_key(normalized_app), collections_version_key(normalized_app)])
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    app_doc = db.get_collection("apps").find_one({"app_name": normalized_app}, {"_id": 0}) or {}
+
+    target_db = app_db(normalized_app)
     collections = [c for c in target_db.list_collection_names() if not c.startswith("system.")]
-    members = list(
-        user_col.find(
-            app_membership_filter(normalized_app),
-            {"_id": 0, "email": 1, "type": 1, "app_name": 1},
-        )
-    )
+    members = list(iter_app_members(normalized_app, {"_id": 0, "email": 1, "type": 1, "app_name": 1}))
     member_rows = [
         {
             "email": m.get("email", ""),
@@ -1236,6 +3818,7 @@ async def my_owned_app_details(
     ]
     member_rows.sort(key=lambda x: x["email"])
 
+    set_etag_headers(response, etag)
     return {
         "app": {
             "app_name": normalized_app,
@@ -1252,40 +3835,42 @@ async def my_owned_app_details(
     }
 
 
-@app.post("/my_owned_apps/{app_name}/collections")
+@app.post("/my_owned_apps/{app_name}/collections", dependencies=[Depends(manager_admission)])
 async def owned_app_add_collection(
     app_name: str,
     collection_name: Annotated[str, Form()],
     session: SessionData = Depends(require_session),
 ):
     normalized_app, _ = require_app_owner_or_admin(app_name, session)
-    target_db = client[normalized_app]
+    target_db = app_db(normalized_app, write=True)
     if collection_name in target_db.list_collection_names():
         raise HTTPException(status_code=400, detail="Collection already exists")
 
     target_db.create_collection(collection_name)
-    members = list(user_col.find(app_membership_filter(normalized_app), {"_id": 0, "email": 1}))
+    members = list(iter_app_members(normalized_app, {"_id": 0, "email": 1}))
     objs = [{"userId": m.get("email")} for m in members if m.get("email")]
     if objs:
         target_db[collection_name].insert_many(objs)
+    bump_versions(collections_version_key(normalized_app))
     return {"message": "Collection created", "objects_created": len(objs)}
 
 
-@app.delete("/my_owned_apps/{app_name}/collections/{collection_name}")
+@app.delete("/my_owned_apps/{app_name}/collections/{collection_name}", dependencies=[Depends(manager_admission)])
 async def owned_app_delete_collection(
     app_name: str,
     collection_name: str,
     session: SessionData = Depends(require_session),
 ):
     normalized_app, _ = require_app_owner_or_admin(app_name, session)
-    target_db = client[normalized_app]
+    target_db = app_db(normalized_app, write=True)
     if collection_name not in target_db.list_collection_names():
         raise HTTPException(status_code=404, detail="Collection does not exist")
     target_db[collection_name].drop()
+    drop_collection_versions(normalized_app, collection_name)
     return {"message": "Collection deleted"}
 
 
-@app.post("/my_owned_apps/{app_name}/objects/upsert")
+@app.post("/my_owned_apps/{app_name}/objects/upsert", dependencies=[Depends(manager_admission)])
 async def owned_app_upsert_object(
     app_name: str,
     collection_name: Annotated[str, Form()],
@@ -1294,7 +3879,7 @@ async def owned_app_upsert_object(
     session: SessionData = Depends(require_session),
 ):
     normalized_app, _ = require_app_owner_or_admin(app_name, session)
-    target_db = client[normalized_app]
+    target_db = app_db(normalized_app, write=True)
     if collection_name not in target_db.list_collection_names():
         raise HTTPException(status_code=404, detail="Collection does not exist")
     try:
@@ -1308,10 +3893,14 @@ async def owned_app_upsert_object(
         col.insert_one({"userId": userId, **obj_dict})
     else:
         col.update_one({"userId": userId}, {"$set": obj_dict})
+    bump_versions(
+        object_version_key(normalized_app, collection_name, userId),
+        collection_version_key(normalized_app, collection_name),
+    )
     return {"message": "Object upserted"}
 
 
-@app.delete("/my_owned_apps/{app_name}/objects")
+@app.delete("/my_owned_apps/{app_name}/objects", dependencies=[Depends(manager_admission)])
 async def owned_app_delete_object(
     app_name: str,
     collection_name: str,
@@ -1319,12 +3908,16 @@ async def owned_app_delete_object(
     session: SessionData = Depends(require_session),
 ):
     normalized_app, _ = require_app_owner_or_admin(app_name, session)
-    target_db = client[normalized_app]
+    target_db = app_db(normalized_app, write=True)
     if collection_name not in target_db.list_collection_names():
         raise HTTPException(status_code=404, detail="Collection does not exist")
     result = target_db[collection_name].delete_one({"userId": user_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Object not found")
+    bump_versions(
+        object_version_key(normalized_app, collection_name, user_id),
+        collection_version_key(normalized_app, collection_name),
+    )
     return {"message": "Object deleted"}
 
 
@@ -1341,13 +3934,15 @@ async def owned_app_change_user_role(
     if new_type == "developer" and actor.get("type") != "admin":
         raise HTTPException(status_code=403, detail="Only admins can promote users to developer")
 
-    target = user_col.find_one({"email": target_email, **app_membership_filter(normalized_app)})
+    target = find_app_member(target_email, normalized_app)
     if not target:
         raise HTTPException(status_code=404, detail="User not found in app")
     if target.get("type") == "admin":
         raise HTTPException(status_code=400, detail="Cannot modify admin via this endpoint")
 
     user_col.update_one({"_id": target["_id"]}, {"$set": {"type": new_type}})
+    sync_memberships(target_email)
+    bump_membership_versions(target_email, user_app_names(target))
     return {"message": "User role updated"}
 
 
@@ -1362,7 +3957,7 @@ async def owned_app_transfer_ownership(
     if not app_doc:
         raise HTTPException(status_code=404, detail="App not found")
 
-    target_user = user_col.find_one({"email": new_owner_email, **app_membership_filter(normalized_app)})
+    target_user = find_app_member(new_owner_email, normalized_app)
     if not target_user:
         raise HTTPException(status_code=404, detail="New owner not found in app")
 
@@ -1371,13 +3966,21 @@ async def owned_app_transfer_ownership(
 
     db.get_collection("apps").update_one(
         {"_id": app_doc["_id"]},
-        {"$set": {"created_by": new_owner_email, "ownership_transferred_at": utcnow()}},
+        {
+            "$set": {
+                "created_by": new_owner_email,
+                "owner_email": new_owner_email,
+                "ownership_transferred_at": utcnow(),
+            }
+        },
     )
 
     user_updates: dict = {"$addToSet": {"apps": normalized_app}}
     if target_user.get("type") not in {"developer", "admin"}:
         user_updates["$set"] = {"type": "developer"}
     user_col.update_one({"_id": target_user["_id"]}, user_updates)
+    sync_memberships(new_owner_email)
+    bump_membership_versions(new_owner_email, [normalized_app, *user_app_names(target_user)])
 
     return {"message": "Ownership transferred successfully", "app_name": normalized_app, "new_owner": new_owner_email}
 
@@ -1389,7 +3992,7 @@ async def owned_app_remove_user(
     session: SessionData = Depends(require_session),
 ):
     normalized_app, _ = require_app_owner_or_admin(app_name, session)
-    target = user_col.find_one({"email": target_email, **app_membership_filter(normalized_app)})
+    target = find_app_member(target_email, normalized_app)
     if not target:
         raise HTTPException(status_code=404, detail="User not found in app")
     if target.get("type") == "admin":
@@ -1407,25 +4010,28 @@ async def owned_app_remove_user(
     if target.get("type") == "developer" and not user_has_any_non_portal_app(shadow):
         update_doc["$set"]["type"] = "user"
     user_col.update_one({"_id": target["_id"]}, update_doc)
+    sync_memberships(target_email)
 
-    target_db = client[normalized_app]
+    object_keys = []
+    target_db = app_db(normalized_app, write=True)
     for col in target_db.list_collection_names():
         if col.startswith("system."):
             continue
         target_db[col].delete_many({"userId": target_email})
+        object_keys.append(object_version_key(normalized_app, col, target_email))
+        object_keys.append(collection_version_key(normalized_app, col))
 
+    bump_membership_versions(target_email, user_app_names(target))
+    bump_versions(*object_keys)
     return {"message": "User removed from app"}
 
 
 @app.delete("/admin/apps/{app_name}")
 async def admin_delete_app(
     app_name: str,
+    capabilities: Capabilities = Depends(admin_access),
     session: SessionData = Depends(require_session),
 ):
-    logged_in_user = get_logged_in_user(session)
-    if not logged_in_user or logged_in_user.get("type") != "admin":
-        raise HTTPException(status_code=403, detail="Admin access required")
-
     normalized_app = app_name.strip().lower()
     if not re.match(r"^[a-z0-9][a-z0-9_-]{2,49}$", normalized_app):
         raise HTTPException(status_code=400, detail="Invalid app name")
@@ -1434,235 +4040,1743 @@ async def admin_delete_app(
     if not app_name_exists(normalized_app):
         raise HTTPException(status_code=404, detail="App not found")
 
-    delete_app_data_and_membership(normalized_app)
-    return {"message": "App deleted successfully"}
+    delete_app_data_and_membership(normalized_app)
+    return {"message": "App deleted successfully"}
+
+
+@app.post("/add_collection", dependencies=[Depends(developer_admission)])
+async def add_collection(
+    app_name: Annotated[str, Form()],
+    collection_name: Annotated[str, Form()],
+    response: Response,
+    capabilities: Capabilities = Depends(developer_app_access),
+    session: SessionData = Depends(require_session),
+):
+    apps = db.get_collection("apps")
+
+    if not apps.find_one({"app_name": app_name}):
+        raise HTTPException(404, "App not found")
+
+    target_db = app_db(app_name, write=True)
+    if collection_name in target_db.list_collection_names():
+        raise HTTPException(400, "Collection already exists")
+
+    target_db.create_collection(collection_name)
+
+    app_users = list(iter_app_members(app_name, {"_id": 0, "email": 1}))
+
+    objects = [{"userId": user["email"]} for user in app_users]
+
+    if objects:
+        collection = target_db[collection_name]
+        collection.insert_many(objects)
+
+    bump_versions(collections_version_key(app_name))
+    return {
+        "message": "Collection added and userId objects created successfully",
+        "objects_created": len(objects),
+    }
+
+
+@app.post("/delete_collection", dependencies=[Depends(developer_admission)])
+async def delete_collection(
+    app_name: Annotated[str, Form()],
+    collection_name: Annotated[str, Form()],
+    response: Response,
+    admin_password: Annotated[str | None, Form()] = None,
+    capabilities: Capabilities = Depends(developer_app_access),
+    session: SessionData = Depends(require_session),
+):
+    apps = db.get_collection("apps")
+
+    await require_admin_password(session, admin_password)
+
+    if not apps.find_one({"app_name": app_name}):
+        raise HTTPException(404, "App not found")
+
+    target_db = app_db(app_name, write=True)
+    if collection_name not in target_db.list_collection_names():
+        raise HTTPException(404, "Collection does not exist")
+
+    target_db[collection_name].drop()
+    drop_collection_versions(app_name, collection_name)
+    return {"message": "Collection deleted successfully"}
+
+
+def read_collection_names(app_name: str, session: SessionData) -> tuple[list[str], bool]:
+    """(collection names, read from the primary) for /list_collections."""
+    with app_reads(app_name, "objects", session) as (target_db, client_session):
+        return target_db.list_collection_names(session=client_session), client_session is None
+
+
+@app.get("/list_collections", dependencies=[Depends(developer_admission)])
+async def list_collections(
+    app_name: str,
+    request: Request,
+    response: Response,
+    capabilities: Capabilities = Depends(developer_app_access),
+    session: SessionData = Depends(require_session),
+):
+    if not await load_app_doc(app_name, {"_id": 1}):
+        raise HTTPException(404, "App not found")
+
+    etag = compute_etag([collections_version_key(app_name)])
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    flight_key = ("collections", app_name, etag)
+    if not isinstance(READ_PREFERENCES["objects"], Primary):
+        flight_key += (str(session.session_id),)
+    collections, from_primary = await single_flight.do(flight_key, read_collection_names, app_name, session)
+    if from_primary:
+        set_etag_headers(response, etag)
+    return {"collections": collections}
+
+
+@app.get("/apps")
+async def list_apps(session: SessionData = Depends(require_session)):
+    apps = db.get_collection("apps")
+
+    logged_in_user = get_logged_in_user(session)
+    if not logged_in_user or logged_in_user.get("type") not in ["developer", "admin"]:
+        raise HTTPException(403, "You must be logged in as an developer")
+
+    app_list = list(apps.find({}, {"_id": 0}))
+    return {"apps": app_list}
+
+
+@app.post("/update_object", dependencies=[Depends(member_admission)])
+async def update_object(
+    app_name: Annotated[str, Form()],
+    collection_name: Annotated[str, Form()],
+    userId: Annotated[str, Form()],
+    obj: Annotated[str, Form()],
+    session: SessionData = Depends(require_session),
+):
+    apps = db.get_collection("apps")
+
+    if not apps.find_one({"app_name": app_name}):
+        raise HTTPException(404, "App not found")
+
+    try:
+        obj_dict = json.loads(obj)
+    except Exception:
+        raise HTTPException(400, "Invalid JSON in obj")
+
+    with app_writes(app_name, session) as (target_db, client_session):
+        if collection_name not in target_db.list_collection_names(session=client_session):
+            raise HTTPException(404, "Collection does not exist")
+
+        collection = target_db[collection_name]
+        existing = collection.find_one({"userId": userId}, session=client_session)
+        if not existing:
+            raise HTTPException(404, "UserId not found in collection")
+
+        collection.update_one({"userId": userId}, {"$set": obj_dict}, session=client_session)
+    bump_versions(
+        object_version_key(app_name, collection_name, userId),
+        collection_version_key(app_name, collection_name),
+    )
+    return {"message": "Object merged into userId successfully"}
+
+
+def read_object(app_name: str, collection_name: str, user_id: str, session: SessionData) -> tuple[dict | None, bool]:
+    """(object without _id, read from the primary) for /fetch_object."""
+    with app_reads(app_name, "objects", session) as (target_db, client_session):
+        if collection_name not in target_db.list_collection_names(session=client_session):
+            raise HTTPException(404, "Collection does not exist")
+
+        doc = target_db[collection_name].find_one({"userId": user_id}, {"_id": 0}, session=client_session)
+    return doc, client_session is None
+
+
+@app.post("/fetch_object", dependencies=[Depends(member_admission)])
+async def fetch_object(
+    app_name: Annotated[str, Form()],
+    collection_name: Annotated[str, Form()],
+    userId: Annotated[str, Form()],
+    request: Request,
+    response: Response,
+    capabilities: Capabilities = Depends(app_member_access),
+    session: SessionData = Depends(require_session),
+):
+    if not await load_app_doc(app_name, {"_id": 1}):
+        raise HTTPException(404, "App not found")
+
+    cache_key = object_version_key(app_name, collection_name, userId)
+    cached = object_cache.get(cache_key)
+    if cached is not None:
+        etag, doc = cached
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        set_etag_headers(response, etag)
+        return dict(doc)
+
+    stamp = object_cache.clock.now()
+    etag = compute_etag([cache_key, collections_version_key(app_name)])
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    # The ETag is part of the key, so a request never joins a read that
+    # started before a write it has already seen the version of.
+    flight_key = ("object", app_name, collection_name, userId, etag)
+    if not isinstance(READ_PREFERENCES["objects"], Primary):
+        # Causal reads depend on the caller's own last write.
+        flight_key += (str(session.session_id),)
+    doc, from_primary = await single_flight.do(flight_key, read_object, app_name, collection_name, userId, session)
+    if not doc:
+        raise HTTPException(404, "UserId not found in collection")
+
+    if from_primary:
+        # A secondary may still return what a just-invalidated entry held, so
+        # only primary reads fill the cache.
+        object_cache.put(cache_key, app_name, etag, doc, stamp)
+        # The tag comes from the primary's versions; don't pair it with a body
+        # that may be older.
+        set_etag_headers(response, etag)
+    return dict(doc)
+
+
+CHANGE_FEED_QUEUE_SIZE = 256
+CHANGE_FEED_KEEPALIVE_SECONDS = 15
+CHANGE_FEED_RETRY_SECONDS = 2
+
+
+class ChangeSubscription:
+    def __init__(self, app_name: str, collection_name: str, user_id: str | None, object_id, loop):
+        self.app_name = app_name
+        self.collection_name = collection_name
+        self.user_id = user_id
+        self.object_id = object_id
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=CHANGE_FEED_QUEUE_SIZE)
+        self.closed = False
+
+    def matches(self, change: dict) -> bool:
+        if change.get("ns", {}).get("coll") != self.collection_name:
+            return False
+        if self.user_id is None:
+            return True
+        full_doc = change.get("fullDocument") or {}
+        if full_doc.get("userId") == self.user_id:
+            self.object_id = change.get("documentKey", {}).get("_id", self.object_id)
+            return True
+        # Deletes (and updates racing a delete) only carry the _id.
+        return self.object_id is not None and change.get("documentKey", {}).get("_id") == self.object_id
+
+    def offer(self, event: dict | None) -> None:
+        # Runs on the event loop. A client that can't keep up is cut off and
+        # expected to reconnect and refetch, rather than buffering without bound.
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.closed = True
+            self.queue.get_nowait()
+            self.queue.put_nowait({"op": "overflow"})
+
+    def push(self, event: dict | None) -> None:
+        self.loop.call_soon_threadsafe(self.offer, event)
+
+
+def change_to_event(change: dict) -> dict:
+    op = change.get("operationType")
+    event: dict = {"op": op, "collection": change.get("ns", {}).get("coll")}
+    full_doc = dict(change.get("fullDocument") or {})
+    full_doc.pop("_id", None)
+    if full_doc.get("userId") is not None:
+        event["userId"] = full_doc["userId"]
+    if op == "update":
+        description = change.get("updateDescription") or {}
+        event["updatedFields"] = description.get("updatedFields", {})
+        event["removedFields"] = description.get("removedFields", [])
+    elif op in {"insert", "replace"}:
+        event["document"] = full_doc
+    return event
+
+
+def untag_shared_change(change: dict) -> dict:
+    """Make a change on app_objects look like one on the app's own collection."""
+    full_doc = shared_object(dict(change.get("fullDocument") or {}))
+    collection = full_doc.pop("_col", None)
+    app_name = full_doc.pop("_app", None)
+    key = (change.get("documentKey") or {}).get("_id")
+    object_id = key
+    if isinstance(key, dict) and key.keys() == {"app", "col", "id"}:
+        app_name, collection, object_id = key["app"], key["col"], key["id"]
+    untagged = {
+        **change,
+        "ns": {"db": app_name, "coll": collection},
+        "documentKey": {"_id": object_id},
+        "fullDocument": full_doc,
+    }
+    description = change.get("updateDescription")
+    if description:
+        untagged["updateDescription"] = {
+            **description,
+            "updatedFields": {
+                k: v for k, v in description.get("updatedFields", {}).items() if k not in SHARED_RESERVED_FIELDS
+            },
+        }
+    return untagged
+
+
+class AppChangeFeed:
+    """One change stream on an app's storage, shared by every subscriber to it.
+
+    Shared-storage apps watch app_objects filtered to the app by the app name
+    in each document's _id, which delete events carry too.
+    """
+
+    def __init__(self, app_name: str):
+        self.app_name = app_name
+        self.subscribers: set[ChangeSubscription] = set()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name=f"change-feed-{app_name}", daemon=True)
+
+    def run(self) -> None:
+        resume_token = None
+        while not self.stopped.is_set():
+            try:
+                mode, cluster, _ = app_placement(self.app_name)
+                shared = mode == "shared"
+                if shared:
+                    target = shared_store(cluster)["app_objects"]
+                    # fullDocument covers documents not yet moved to scoped keys.
+                    pipeline = [
+                        {
+                            "$match": {
+                                "$or": [
+                                    {"documentKey._id.app": self.app_name},
+                                    {"fullDocument._app": self.app_name},
+                                ]
+                            }
+                        }
+                    ]
+                else:
+                    target = cluster_client(cluster)[self.app_name]
+                    pipeline = []
+                with target.watch(
+                    pipeline,
+                    full_document="updateLookup",
+                    resume_after=resume_token,
+                    max_await_time_ms=1000,
+                ) as stream:
+                    while not self.stopped.is_set() and stream.alive:
+                        change = stream.try_next()
+                        resume_token = stream.resume_token
+                        if change is None:
+                            continue
+                        if shared and change.get("operationType") != "invalidate":
+                            change = untag_shared_change(change)
+                        self.dispatch(change)
+                        if change.get("operationType") == "invalidate":
+                            resume_token = None
+            except PyMongoError as e:
+                print(f"Change feed for '{self.app_name}' interrupted:", e)
+                self.stopped.wait(CHANGE_FEED_RETRY_SECONDS)
+
+    def dispatch(self, change: dict) -> None:
+        op = change.get("operationType")
+        with self.lock:
+            subscribers = list(self.subscribers)
+        if op in {"drop", "dropDatabase", "invalidate"}:
+            dropped = change.get("ns", {}).get("coll")
+            for sub in subscribers:
+                if op != "drop" or sub.collection_name == dropped:
+                    sub.push({"op": op, "collection": sub.collection_name})
+                    sub.push(None)
+            return
+        event = change_to_event(change)
+        for sub in subscribers:
+            if sub.matches(change):
+                sub.push(event)
+
+    def stop(self) -> None:
+        self.stopped.set()
+
+
+class ChangeFeedHub:
+    def __init__(self):
+        self.feeds: dict[str, AppChangeFeed] = {}
+        self.lock = threading.Lock()
+
+    def subscribe(self, app_name: str, collection_name: str, user_id: str | None, object_id) -> ChangeSubscription:
+        sub = ChangeSubscription(app_name, collection_name, user_id, object_id, asyncio.get_running_loop())
+        with self.lock:
+            feed = self.feeds.get(app_name)
+            if feed is None:
+                feed = AppChangeFeed(app_name)
+                self.feeds[app_name] = feed
+                feed.thread.start()
+            with feed.lock:
+                feed.subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: ChangeSubscription) -> None:
+        with self.lock:
+            feed = self.feeds.get(sub.app_name)
+            if feed is None:
+                return
+            with feed.lock:
+                feed.subscribers.discard(sub)
+                idle = not feed.subscribers
+            if idle:
+                feed.stop()
+                del self.feeds[sub.app_name]
+
+    def close_all(self) -> None:
+        with self.lock:
+            for feed in self.feeds.values():
+                feed.stop()
+            self.feeds.clear()
+
+
+change_feeds = ChangeFeedHub()
+
+
+@app.get("/subscribe")
+async def subscribe_changes(
+    request: Request,
+    app_name: str,
+    collection_name: str,
+    userId: str | None = None,
+    session: SessionData = Depends(require_session),
+):
+    """Server-Sent Events feed of changes to one object, or (owners) a whole collection."""
+    if userId is None:
+        normalized_app, _ = require_app_owner_or_admin(app_name, session)
+    else:
+        normalized_app = app_name.strip().lower()
+        logged_in_user = get_logged_in_user(session)
+        if not logged_in_user or not user_has_app_access(logged_in_user, normalized_app):
+            raise HTTPException(403, "You must be a developer or user of this app")
+        if userId != session.email and logged_in_user.get("type") not in {"developer", "admin"}:
+            raise HTTPException(403, "You can only subscribe to your own object")
+        if not db.get_collection("apps").find_one({"app_name": normalized_app}):
+            raise HTTPException(404, "App not found")
+
+    target_db = app_db(normalized_app)
+    if collection_name not in target_db.list_collection_names():
+        raise HTTPException(404, "Collection does not exist")
+
+    object_id = None
+    if userId is not None:
+        existing = target_db[collection_name].find_one({"userId": userId}, {"_id": 1})
+        object_id = existing["_id"] if existing else None
+
+    sub = change_feeds.subscribe(normalized_app, collection_name, userId, object_id)
+
+    async def event_stream():
+        try:
+            yield ": subscribed\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(sub.queue.get(), timeout=CHANGE_FEED_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is None:
+                    break
+                yield f"event: {event['op']}\ndata: {json.dumps(event, default=str)}\n\n"
+                if event["op"] == "overflow":
+                    break
+        finally:
+            change_feeds.unsubscribe(sub)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/delete_app")
+async def delete_app(
+    app_name: Annotated[str, Form()],
+    response: Response,
+    admin_password: Annotated[str | None, Form()] = None,
+    session: SessionData = Depends(require_session),
+):
+    logged_in_user = get_logged_in_user(session)
+    if not logged_in_user or logged_in_user.get("type") not in ["developer", "admin"]:
+        raise HTTPException(403, "You must be logged in as an developer")
+
+    await require_admin_password(session, admin_password)
+
+    if not user_has_app_access(logged_in_user, app_name):
+        raise HTTPException(403, "You must be a developer of this app")
+
+    normalized_app = app_name.strip().lower()
+    if normalized_app in RESERVED_DB_NAMES or normalized_app == PORTAL_APP:
+        raise HTTPException(400, "This app cannot be deleted")
+
+    if not app_name_exists(normalized_app):
+        raise HTTPException(404, "App not found")
+
+    delete_app_data_and_membership(normalized_app)
+
+    return {"message": "App and associated data deleted successfully"}
+
+@app.post("/list_objects", dependencies=[Depends(member_admission)])
+async def list_objects(
+    app_name: Annotated[str, Form()],
+    collection_name: Annotated[str, Form()],
+    session: SessionData = Depends(require_session),
+):
+    if not await load_app_doc(app_name, {"_id": 1}):
+        raise HTTPException(404, "App not found")
+
+    with app_reads(app_name, "objects", session) as (target_db, client_session):
+        if collection_name not in target_db.list_collection_names(session=client_session):
+            raise HTTPException(404, "Collection does not exist")
+
+        objects = list(target_db[collection_name].find({}, {"_id": 0}, session=client_session))
+
+    return {"objects": objects}
+
+QUERY_COMPARISON_OPERATORS = {"$eq", "$ne", "$gt", "$gte", "$lt", "$lte", "$in", "$nin", "$exists"}
+QUERY_LOGICAL_OPERATORS = {"$and", "$or", "$nor"}
+QUERY_FIELD_RE = re.compile(r"^[A-Za-z0-9_][A-Za-z0-9_.-]{0,99}$")
+QUERY_MAX_DEPTH = 4
+QUERY_MAX_IN_VALUES = 500
+QUERY_DEFAULT_LIMIT = 100
+QUERY_MAX_LIMIT = 1000
+QUERY_MAX_TIME_MS = int(os.environ.get("QUERY_MAX_TIME_MS", "2000"))
+# Above this many documents, filters and sorts may only use indexed fields.
+QUERY_INDEX_REQUIRED_AFTER = int(os.environ.get("QUERY_INDEX_REQUIRED_AFTER", "10000"))
+
+
+def parse_json_form_field(raw: str | None, label: str, default):
+    if raw is None or not raw.strip():
+        return default
+    try:
+        return json.loads(raw)
+    except Exception:
+        raise HTTPException(400, f"Invalid JSON in {label}")
+
+
+def validate_query_field(name) -> str:
+    if not isinstance(name, str) or not QUERY_FIELD_RE.match(name) or ".." in name:
+        raise HTTPException(400, f"Invalid field name: {name}")
+    return name
+
+
+def validate_query_value(value) -> None:
+    # Literal values must not smuggle operators in nested documents.
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if not isinstance(key, str) or key.startswith("$"):
+                raise HTTPException(400, "Operators are not allowed inside literal values")
+            validate_query_value(item)
+    elif isinstance(value, list):
+        for item in value:
+            validate_query_value(item)
+
+
+def validate_query_filter(filter_doc, fields: set[str], depth: int = 0) -> None:
+    """Reject anything outside the supported operator subset; collect referenced fields."""
+    if not isinstance(filter_doc, dict):
+        raise HTTPException(400, "Filter must be a JSON object")
+    if depth > QUERY_MAX_DEPTH:
+        raise HTTPException(400, "Filter is nested too deeply")
+
+    for key, value in filter_doc.items():
+        if key in QUERY_LOGICAL_OPERATORS:
+            if not isinstance(value, list) or not value:
+                raise HTTPException(400, f"{key} needs a non-empty list of filters")
+            for clause in value:
+                validate_query_filter(clause, fields, depth + 1)
+            continue
+        if key.startswith("$"):
+            raise HTTPException(400, f"Operator {key} is not allowed")
+
+        fields.add(validate_query_field(key))
+        if isinstance(value, dict) and any(str(k).startswith("$") for k in value):
+            for op, operand in value.items():
+                if op not in QUERY_COMPARISON_OPERATORS:
+                    raise HTTPException(400, f"Operator {op} is not allowed")
+                if op in {"$in", "$nin"} and (not isinstance(operand, list) or len(operand) > QUERY_MAX_IN_VALUES):
+                    raise HTTPException(400, f"{op} needs a list of at most {QUERY_MAX_IN_VALUES} values")
+                if op == "$exists" and not isinstance(operand, bool):
+                    raise HTTPException(400, "$exists needs true or false")
+                validate_query_value(operand)
+        else:
+            validate_query_value(value)
+
+
+def parse_query_sort(sort_value, fields: set[str]) -> list[tuple[str, int]]:
+    if isinstance(sort_value, dict):
+        items = list(sort_value.items())
+    elif isinstance(sort_value, list):
+        items = [tuple(item) if isinstance(item, list) else (item, 1) for item in sort_value]
+    else:
+        raise HTTPException(400, "Sort must be an object like {\"field\": -1}")
+    if len(items) > 3:
+        raise HTTPException(400, "Sort on at most 3 fields")
+
+    sort_spec = []
+    for item in items:
+        if len(item) != 2 or item[1] not in (1, -1):
+            raise HTTPException(400, "Sort direction must be 1 or -1")
+        fields.add(validate_query_field(item[0]))
+        sort_spec.append((item[0], item[1]))
+    return sort_spec
+
+
+def parse_query_projection(projection_value) -> dict:
+    if isinstance(projection_value, list):
+        projection = {validate_query_field(name): 1 for name in projection_value}
+    elif isinstance(projection_value, dict):
+        projection = {}
+        for name, flag in projection_value.items():
+            if flag not in (0, 1, True, False):
+                raise HTTPException(400, "Projection values must be 0 or 1")
+            projection[validate_query_field(name)] = int(flag)
+        if len(set(projection.values())) > 1:
+            raise HTTPException(400, "Projection cannot mix included and excluded fields")
+    else:
+        raise HTTPException(400, "Projection must be a list of fields or an object")
+    projection["_id"] = 0
+    return projection
+
+
+def indexed_fields(collection) -> set[str]:
+    return {key for spec in collection.index_information().values() for key, _ in spec.get("key", [])}
+
+
+@app.post("/query_objects", dependencies=[Depends(developer_admission)])
+async def query_objects(
+    app_name: Annotated[str, Form()],
+    collection_name: Annotated[str, Form()],
+    filter_json: Annotated[str | None, Form(alias="filter")] = None,
+    sort: Annotated[str | None, Form()] = None,
+    projection: Annotated[str | None, Form()] = None,
+    limit: Annotated[int, Form()] = QUERY_DEFAULT_LIMIT,
+    capabilities: Capabilities = Depends(developer_app_access),
+    session: SessionData = Depends(require_session),
+):
+    if not await load_app_doc(app_name, {"_id": 1}):
+        raise HTTPException(404, "App not found")
+
+    if limit < 1 or limit > QUERY_MAX_LIMIT:
+        raise HTTPException(400, f"Limit must be between 1 and {QUERY_MAX_LIMIT}")
+
+    fields: set[str] = set()
+    filter_doc = parse_json_form_field(filter_json, "filter", {})
+    validate_query_filter(filter_doc, fields)
+    sort_spec = parse_query_sort(parse_json_form_field(sort, "sort", {}), fields)
+    projection_doc = parse_query_projection(parse_json_form_field(projection, "projection", []))
+
+    with app_reads(app_name, "objects", session) as (target_db, client_session):
+        if collection_name not in target_db.list_collection_names(session=client_session):
+            raise HTTPException(404, "Collection does not exist")
+
+        collection = target_db[collection_name]
+        if fields and collection.estimated_document_count() >= QUERY_INDEX_REQUIRED_AFTER:
+            unindexed = sorted(fields - indexed_fields(collection))
+            if unindexed:
+                raise HTTPException(
+                    400,
+                    f"Collection is large; filter and sort only on indexed fields (not indexed: {', '.join(unindexed)})",
+                )
+
+        cursor = collection.find(
+            filter_doc, projection_doc, limit=limit, max_time_ms=QUERY_MAX_TIME_MS, session=client_session
+        )
+        if sort_spec:
+            cursor = cursor.sort(sort_spec)
+        try:
+            objects = list(cursor)
+        except ExecutionTimeout:
+            raise HTTPException(504, "Query exceeded the time limit; narrow the filter or add an index")
+
+    return {"objects": objects, "count": len(objects)}
+
+
+AGGREGATE_STAGES = {"$match", "$group", "$sort", "$limit", "$project", "$count"}
+AGGREGATE_ACCUMULATORS = {"$sum", "$avg", "$min", "$max", "$first", "$last", "$count"}
+AGGREGATE_MAX_STAGES = 10
+AGGREGATE_MAX_RESULTS = 10_000
+AGGREGATE_CACHE_TTL_SECONDS = int(os.environ.get("AGGREGATE_CACHE_TTL_SECONDS", "30"))
+AGGREGATE_CACHE_MAX_DOCS = 1000
+AGGREGATE_CACHE_MAX_ENTRIES = 256
+# Defaults for apps without an aggregation_policy on their apps document.
+DEFAULT_AGGREGATION_POLICY = {"max_time_ms": QUERY_MAX_TIME_MS, "allow_disk_use": False}
+AGGREGATION_MAX_TIME_MS_CEILING = 60_000
+
+# (app, collection, canonical pipeline, version tokens) -> (expires_at timestamp, results)
+aggregate_cache: dict[tuple[str, str, str, str], tuple[float, list]] = {}
+
+
+def validate_aggregate_expression(expr, depth: int = 0) -> None:
+    # Field paths ("$score"), literals, or documents of those (compound group keys).
+    if depth > 3:
+        raise HTTPException(400, "Expression is nested too deeply")
+    if isinstance(expr, str):
+        if expr.startswith("$"):
+            validate_query_field(expr[1:])
+        return
+    if isinstance(expr, dict):
+        for key, value in expr.items():
+            if str(key).startswith("$"):
+                raise HTTPException(400, f"Operator {key} is not allowed in expressions")
+            validate_aggregate_expression(value, depth + 1)
+        return
+    if isinstance(expr, list):
+        raise HTTPException(400, "Arrays are not allowed in expressions")
+
+
+def validate_aggregate_pipeline(pipeline) -> None:
+    if not isinstance(pipeline, list) or not pipeline:
+        raise HTTPException(400, "Pipeline must be a non-empty JSON array")
+    if len(pipeline) > AGGREGATE_MAX_STAGES:
+        raise HTTPException(400, f"Pipeline may have at most {AGGREGATE_MAX_STAGES} stages")
+
+    for stage in pipeline:
+        if not isinstance(stage, dict) or len(stage) != 1:
+            raise HTTPException(400, "Each stage must be an object with a single operator")
+        (name, spec), = stage.items()
+        if name not in AGGREGATE_STAGES:
+            raise HTTPException(400, f"Stage {name} is not allowed")
+
+        if name == "$match":
+            validate_query_filter(spec, set())
+        elif name == "$group":
+            if not isinstance(spec, dict) or "_id" not in spec:
+                raise HTTPException(400, "$group needs an _id")
+            validate_aggregate_expression(spec["_id"])
+            for field, accumulator in spec.items():
+                if field == "_id":
+                    continue
+                validate_query_field(field)
+                if not isinstance(accumulator, dict) or len(accumulator) != 1:
+                    raise HTTPException(400, f"$group field {field} needs one accumulator")
+                (op, operand), = accumulator.items()
+                if op not in AGGREGATE_ACCUMULATORS:
+                    raise HTTPException(400, f"Accumulator {op} is not allowed")
+                validate_aggregate_expression(operand)
+        elif name == "$sort":
+            parse_query_sort(spec, set())
+        elif name == "$limit":
+            if not isinstance(spec, int) or isinstance(spec, bool) or spec < 1:
+                raise HTTPException(400, "$limit must be a positive integer")
+        elif name == "$project":
+            if not isinstance(spec, dict) or not spec:
+                raise HTTPException(400, "$project must be a non-empty object")
+            for field, value in spec.items():
+                validate_query_field(field)
+                if value not in (0, 1, True, False):
+                    validate_aggregate_expression(value)
+        elif name == "$count":
+            validate_query_field(spec)
+
+
+def app_aggregation_policy(app_doc: dict) -> dict:
+    policy = dict(DEFAULT_AGGREGATION_POLICY)
+    stored = app_doc.get("aggregation_policy")
+    if isinstance(stored, dict):
+        policy.update({k: stored[k] for k in DEFAULT_AGGREGATION_POLICY if k in stored})
+    policy["max_time_ms"] = min(int(policy["max_time_ms"]), AGGREGATION_MAX_TIME_MS_CEILING)
+    policy["allow_disk_use"] = bool(policy["allow_disk_use"])
+    return policy
+
+
+def cached_aggregate(cache_key: tuple[str, str, str, str]) -> list | None:
+    entry = aggregate_cache.get(cache_key)
+    if entry is None:
+        return None
+    expires_at, results = entry
+    if expires_at < utcnow().timestamp():
+        aggregate_cache.pop(cache_key, None)
+        return None
+    return results
+
+
+def store_aggregate(cache_key: tuple[str, str, str, str], results: list) -> None:
+    if len(aggregate_cache) >= AGGREGATE_CACHE_MAX_ENTRIES:
+        now = utcnow().timestamp()
+        for key in [k for k, (exp, _) in aggregate_cache.items() if exp < now]:
+            aggregate_cache.pop(key, None)
+        if len(aggregate_cache) >= AGGREGATE_CACHE_MAX_ENTRIES:
+            aggregate_cache.pop(next(iter(aggregate_cache)))
+    aggregate_cache[cache_key] = (utcnow().timestamp() + AGGREGATE_CACHE_TTL_SECONDS, results)
+
+
+@app.post("/aggregate_objects", dependencies=[Depends(developer_admission)])
+async def aggregate_objects(
+    app_name: Annotated[str, Form()],
+    collection_name: Annotated[str, Form()],
+    pipeline: Annotated[str, Form()],
+    capabilities: Capabilities = Depends(developer_app_access),
+    session: SessionData = Depends(require_session),
+):
+    app_doc = await load_app_doc(app_name)
+    if not app_doc:
+        raise HTTPException(404, "App not found")
+
+    stages = parse_json_form_field(pipeline, "pipeline", None)
+    validate_aggregate_pipeline(stages)
+
+    # Read before the pipeline runs: a write that lands meanwhile moves the
+    # token on, so a result that may predate it is stored under a dead key.
+    versions = read_versions([collection_version_key(app_name, collection_name), collections_version_key(app_name)])
+    cache_key = (app_name, collection_name, json.dumps(stages, sort_keys=True), "|".join(versions))
+    # The read session has to outlive this function: the cursor is drained
+    # while the response streams.
+    reads = ExitStack()
+    try:
+        target_db, client_session = reads.enter_context(app_reads(app_name, "analytics", session))
+        if collection_name not in target_db.list_collection_names(session=client_session):
+            raise HTTPException(404, "Collection does not exist")
+
+        cached = cached_aggregate(cache_key)
+        if cached is not None:
+            reads.close()
+            return JSONResponse(
+                json.loads(json.dumps({"results": cached}, default=str)),
+                headers={"X-Cache": "hit"},
+            )
+
+        policy = app_aggregation_policy(app_doc)
+        cursor = target_db[collection_name].aggregate(
+            [*stages, {"$limit": AGGREGATE_MAX_RESULTS}],
+            maxTimeMS=policy["max_time_ms"],
+            allowDiskUse=policy["allow_disk_use"],
+            batchSize=500,
+            session=client_session,
+        )
+    except ExecutionTimeout:
+        reads.close()
+        raise HTTPException(504, "Aggregation exceeded the time limit")
+    except OperationFailure as e:
+        reads.close()
+        raise HTTPException(400, f"Aggregation failed: {e}")
+    except BaseException:
+        reads.close()
+        raise
+
+    def stream_results():
+        # Sync generator: Starlette iterates it in a worker thread, so cursor
+        # batches are fetched off the event loop and written out as they arrive.
+        kept: list | None = []
+        yield '{"results": ['
+        try:
+            for index, doc in enumerate(cursor):
+                if kept is not None:
+                    kept.append(doc)
+                    if len(kept) > AGGREGATE_CACHE_MAX_DOCS:
+                        kept = None
+                yield ("," if index else "") + json.dumps(doc, default=str)
+        except PyMongoError as e:
+            # Headers are already sent; surface the failure in-band.
+            yield f'], "error": {json.dumps(str(e))}}}'
+            return
+        finally:
+            cursor.close()
+            reads.close()
+        yield "]}"
+        if kept is not None:
+            store_aggregate(cache_key, kept)
+
+    return StreamingResponse(stream_results(), media_type="application/json", headers={"X-Cache": "miss"})
+
+
+@app.post("/admin/apps/{app_name}/aggregation_policy")
+async def admin_set_aggregation_policy(
+    app_name: str,
+    max_time_ms: Annotated[int, Form()],
+    allow_disk_use: Annotated[bool, Form()] = False,
+    capabilities: Capabilities = Depends(admin_access),
+    session: SessionData = Depends(require_session),
+):
+    if max_time_ms < 1 or max_time_ms > AGGREGATION_MAX_TIME_MS_CEILING:
+        raise HTTPException(status_code=400, detail=f"max_time_ms must be 1-{AGGREGATION_MAX_TIME_MS_CEILING}")
+
+    normalized_app = normalize_existing_app_or_404(app_name)
+    result = db.get_collection("apps").update_one(
+        {"app_name": normalized_app},
+        {"$set": {"aggregation_policy": {"max_time_ms": max_time_ms, "allow_disk_use": allow_disk_use}}},
+    )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="App not found")
+    return {"message": "Aggregation policy updated"}
+
 
+APP_INDEX_QUOTA = int(os.environ.get("APP_INDEX_QUOTA", "20"))
+APP_INDEX_MAX_KEYS = 4
+# A build record this old with no outcome belongs to a worker that died mid-build.
+APP_INDEX_BUILD_STALE_AFTER = timedelta(hours=1)
+app_index_builds_col = db.get_collection("app_index_builds")
 
-@app.post("/add_collection")
-async def add_collection(
-    app_name: Annotated[str, Form()],
-    collection_name: Annotated[str, Form()],
-    response: Response,
-    session: SessionData = Depends(require_session),
-):
-    apps = db.get_collection("apps")
 
-    logged_in_user = get_logged_in_user(session)
-    if not logged_in_user or logged_in_user.get("type") not in ["developer", "admin"]:
-        raise HTTPException(403, "You must be logged in as an developer")
+def require_owned_collection(app_name: str, collection_name: str, session: SessionData):
+    normalized_app, actor = require_app_owner_or_admin(app_name, session)
+    target_db = app_db(normalized_app)
+    if collection_name not in target_db.list_collection_names():
+        raise HTTPException(status_code=404, detail="Collection does not exist")
+    return normalized_app, target_db[collection_name]
 
-    if not user_has_app_access(logged_in_user, app_name):
-        raise HTTPException(403, "You must be a developer of this app")
 
-    if not apps.find_one({"app_name": app_name}):
-        raise HTTPException(404, "App not found")
+def count_app_indexes(app_name: str) -> int:
+    """Built indexes plus builds still running, each index counted once."""
+    target_db = app_db(app_name)
+    names = set()
+    for col in target_db.list_collection_names():
+        if col.startswith("system."):
+            continue
+        names.update((col, name) for name in target_db[col].index_information() if name != "_id_")
+    for build in app_index_builds_col.find(
+        {"app_name": app_name, "status": "building", "started_at": {"$gte": utcnow() - APP_INDEX_BUILD_STALE_AFTER}},
+        {"collection": 1, "name": 1},
+    ):
+        names.add((build["collection"], build["name"]))
+    return len(names)
 
-    target_db = client[app_name]
-    if collection_name in target_db.list_collection_names():
-        raise HTTPException(400, "Collection already exists")
 
-    target_db.create_collection(collection_name)
+def reserve_app_index(app_name: str, collection_name: str, index_name: str) -> None:
+    """Claim a quota slot for an index before building it.
 
-    app_users = list(user_col.find(app_membership_filter(app_name)))
+    The build record is inserted first and the quota checked after, so two
+    concurrent requests can both be refused but never both admitted past the
+    quota. Raises 409 when the index is already being built or the quota is full.
+    """
+    scope = {"app_name": app_name, "collection": collection_name, "name": index_name}
+    # A failed or abandoned earlier attempt does not block a retry.
+    app_index_builds_col.delete_one(
+        {**scope, "$or": [{"status": "failed"}, {"started_at": {"$lt": utcnow() - APP_INDEX_BUILD_STALE_AFTER}}]}
+    )
+    try:
+        app_index_builds_col.insert_one({**scope, "status": "building", "started_at": utcnow()})
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="This index is already being built")
+    if count_app_indexes(app_name) > APP_INDEX_QUOTA:
+        app_index_builds_col.delete_one(scope)
+        raise HTTPException(status_code=409, detail=f"App index quota reached ({APP_INDEX_QUOTA})")
 
-    objects = [{"userId": user["email"]} for user in app_users]
 
-    if objects:
-        collection = target_db[collection_name]
-        collection.insert_many(objects)
+def finish_app_index_build(app_name: str, collection_name: str, index_name: str, error: str | None = None) -> None:
+    scope = {"app_name": app_name, "collection": collection_name, "name": index_name}
+    if error is None:
+        app_index_builds_col.delete_one(scope)
+    else:
+        app_index_builds_col.update_one(
+            scope, {"$set": {"status": "failed", "error": error, "finished_at": utcnow()}}
+        )
 
-    return {
-        "message": "Collection added and userId objects created successfully",
-        "objects_created": len(objects),
-    }
 
+def parse_index_keys(raw: str) -> list[tuple[str, int]]:
+    keys_value = parse_json_form_field(raw, "keys", None)
+    if isinstance(keys_value, dict):
+        items = list(keys_value.items())
+    elif isinstance(keys_value, list):
+        items = [tuple(item) if isinstance(item, list) else (item, 1) for item in keys_value]
+    else:
+        raise HTTPException(status_code=400, detail="keys must be an object like {\"score\": -1}")
+    if not items or len(items) > APP_INDEX_MAX_KEYS:
+        raise HTTPException(status_code=400, detail=f"An index needs 1-{APP_INDEX_MAX_KEYS} keys")
 
-@app.post("/delete_collection")
-async def delete_collection(
-    admin_password: Annotated[str, Form()],
-    app_name: Annotated[str, Form()],
-    collection_name: Annotated[str, Form()],
-    response: Response,
-    session: SessionData = Depends(require_session),
-):
-    apps = db.get_collection("apps")
+    keys = []
+    for item in items:
+        if len(item) != 2 or item[1] not in (1, -1):
+            raise HTTPException(status_code=400, detail="Index direction must be 1 or -1")
+        keys.append((validate_query_field(item[0]), item[1]))
+    if len({name for name, _ in keys}) != len(keys):
+        raise HTTPException(status_code=400, detail="Duplicate field in index keys")
+    return keys
 
-    logged_in_user = get_logged_in_user(session)
-    if not logged_in_user or logged_in_user.get("type") not in ["developer", "admin"]:
-        raise HTTPException(403, "You must be logged in as an developer")
 
-    if not user_has_app_access(logged_in_user, app_name):
-        raise HTTPException(403, "You must be a developer of this app")
+def build_app_index(app_name: str, collection_name: str, keys: list[tuple[str, int]], options: dict) -> None:
+    try:
+        app_db(app_name)[collection_name].create_index(keys, **options)
+    except PyMongoError as e:
+        print(f"Index build {options['name']} on {app_name}.{collection_name} failed:", e)
+        finish_app_index_build(app_name, collection_name, options["name"], str(e))
+        return
+    print(f"Index {options['name']} built on {app_name}.{collection_name}")
+    finish_app_index_build(app_name, collection_name, options["name"])
 
-    admin_user = user_col.find_one({"email": "admin"})
-    if not verify_password(admin_password, admin_user["hashed_password"]):
-        raise HTTPException(401, "Incorrect admin password")
 
-    if not apps.find_one({"app_name": app_name}):
-        raise HTTPException(404, "App not found")
+def serialize_index(name: str, spec: dict) -> dict:
+    return {
+        "name": name,
+        "keys": [[field, direction] for field, direction in spec.get("key", [])],
+        "unique": bool(spec.get("unique", False)),
+        "sparse": bool(spec.get("sparse", False)),
+    }
 
-    target_db = client[app_name]
-    if collection_name not in target_db.list_collection_names():
-        raise HTTPException(404, "Collection does not exist")
 
-    target_db[collection_name].drop()
-    return {"message": "Collection deleted successfully"}
+@app.get("/my_owned_apps/{app_name}/collections/{collection_name}/indexes")
+async def owned_app_list_indexes(
+    app_name: str,
+    collection_name: str,
+    session: SessionData = Depends(require_session),
+):
+    normalized_app, collection = require_owned_collection(app_name, collection_name, session)
+    indexes = [serialize_index(name, spec) for name, spec in collection.index_information().items()]
+    indexes.sort(key=lambda x: x["name"])
+    builds = [
+        {k: build.get(k) for k in ("name", "status", "error", "started_at", "finished_at")}
+        for build in app_index_builds_col.find({"app_name": normalized_app, "collection": collection_name}).sort("name", 1)
+    ]
+    return {
+        "indexes": indexes,
+        "builds": builds,
+        "app_index_count": count_app_indexes(normalized_app),
+        "app_index_quota": APP_INDEX_QUOTA,
+    }
 
 
-@app.get("/list_collections")
-async def list_collections(
+@app.post("/my_owned_apps/{app_name}/collections/{collection_name}/indexes", status_code=202)
+async def owned_app_create_index(
     app_name: str,
+    collection_name: str,
+    keys: Annotated[str, Form()],
+    background_tasks: BackgroundTasks,
+    unique: Annotated[bool, Form()] = False,
+    sparse: Annotated[bool, Form()] = False,
     session: SessionData = Depends(require_session),
 ):
-    apps = db.get_collection("apps")
+    normalized_app, collection = require_owned_collection(app_name, collection_name, session)
+    if isinstance(collection, SharedCollection):
+        raise HTTPException(status_code=400, detail="Custom indexes are not available in shared storage")
+    index_keys = parse_index_keys(keys)
 
-    logged_in_user = get_logged_in_user(session)
-    if not logged_in_user or logged_in_user.get("type") not in ["developer", "admin"]:
-        raise HTTPException(403, "You must be logged in as an developer")
+    existing = collection.index_information()
+    if any(spec.get("key") == index_keys for spec in existing.values()):
+        raise HTTPException(status_code=409, detail="An index on these keys already exists")
 
-    if not user_has_app_access(logged_in_user, app_name):
-        raise HTTPException(403, "You must be a developer of this app")
+    index_name = "_".join(f"{field}_{direction}" for field, direction in index_keys)
+    reserve_app_index(normalized_app, collection_name, index_name)
+    options = {"name": index_name, "unique": unique, "sparse": sparse}
+    # Builds can take a while on big collections; don't hold the request open.
+    background_tasks.add_task(build_app_index, normalized_app, collection_name, index_keys, options)
+    return {"message": "Index build started", "name": index_name}
 
-    if not apps.find_one({"app_name": app_name}):
-        raise HTTPException(404, "App not found")
 
-    target_db = client[app_name]
-    collections = target_db.list_collection_names()
-    return {"collections": collections}
+@app.delete("/my_owned_apps/{app_name}/collections/{collection_name}/indexes/{index_name}")
+async def owned_app_drop_index(
+    app_name: str,
+    collection_name: str,
+    index_name: str,
+    session: SessionData = Depends(require_session),
+):
+    normalized_app, collection = require_owned_collection(app_name, collection_name, session)
+    if isinstance(collection, SharedCollection):
+        raise HTTPException(status_code=400, detail="Custom indexes are not available in shared storage")
+    if index_name == "_id_":
+        raise HTTPException(status_code=400, detail="The _id index cannot be dropped")
+    scope = {"app_name": normalized_app, "collection": collection_name, "name": index_name}
+    if index_name not in collection.index_information():
+        # Dropping a failed build just clears its record from the listing.
+        if app_index_builds_col.delete_one({**scope, "status": "failed"}).deleted_count:
+            return {"message": "Failed index build cleared"}
+        raise HTTPException(status_code=404, detail="Index not found")
+    collection.drop_index(index_name)
+    app_index_builds_col.delete_one(scope)
+    return {"message": "Index dropped"}
+
+
+def summarize_explain(explain: dict) -> dict:
+    planner = explain.get("queryPlanner", {})
+    winning = planner.get("winningPlan", {})
+    # Newer servers wrap the classic plan as queryPlan.
+    winning = winning.get("queryPlan", winning)
+
+    stages: list[str] = []
+    index_names: list[str] = []
+    node = winning
+    while isinstance(node, dict) and node:
+        stages.append(node.get("stage", "?"))
+        if node.get("indexName"):
+            index_names.append(node["indexName"])
+        children = node.get("inputStage") or (node.get("inputStages") or [None])[0]
+        node = children
+
+    stats = explain.get("executionStats", {})
+    return {
+        "uses_index": "IXSCAN" in stages or "IDHACK" in stages,
+        "collection_scan": "COLLSCAN" in stages,
+        "indexes": index_names,
+        "stages": stages,
+        "docs_returned": stats.get("nReturned"),
+        "docs_examined": stats.get("totalDocsExamined"),
+        "keys_examined": stats.get("totalKeysExamined"),
+        "execution_ms": stats.get("executionTimeMillis"),
+    }
 
 
-@app.get("/apps")
-async def list_apps(session: SessionData = Depends(require_session)):
-    apps = db.get_collection("apps")
+@app.post("/my_owned_apps/{app_name}/collections/{collection_name}/explain", dependencies=[Depends(manager_admission)])
+async def owned_app_explain_query(
+    app_name: str,
+    collection_name: str,
+    filter_json: Annotated[str | None, Form(alias="filter")] = None,
+    sort: Annotated[str | None, Form()] = None,
+    session: SessionData = Depends(require_session),
+):
+    normalized_app, collection = require_owned_collection(app_name, collection_name, session)
+    fields: set[str] = set()
+    filter_doc = parse_json_form_field(filter_json, "filter", {})
+    validate_query_filter(filter_doc, fields)
+    sort_spec = parse_query_sort(parse_json_form_field(sort, "sort", {}), fields)
+
+    command: dict = {"find": collection_name, "filter": filter_doc, "maxTimeMS": QUERY_MAX_TIME_MS}
+    if sort_spec:
+        command["sort"] = dict(sort_spec)
+    try:
+        explain = app_db(normalized_app).command("explain", command, verbosity="executionStats")
+    except ExecutionTimeout:
+        raise HTTPException(504, "Explain exceeded the time limit")
+    except OperationFailure as e:
+        raise HTTPException(400, f"Explain failed: {e}")
+
+    summary = summarize_explain(explain)
+    summary["unindexed_fields"] = sorted(fields - indexed_fields(collection))
+    return summary
+
+
+USER_IMPORT_BATCH_SIZE = 1000
+USER_IMPORT_MAX_ERRORS = 100
+USER_IMPORT_MAX_RECORD_BYTES = 1024 * 1024
+# Leave half of the password slots free so logins keep working during an import.
+USER_IMPORT_HASH_CONCURRENCY = max(1, PASSWORD_CONCURRENCY // 2)
+USER_EXPORT_CHUNK_BYTES = 64 * 1024
+EMAIL_PATTERN = re.compile(r"^[_a-z0-9-]+(\.[_a-z0-9-]+)*@[a-z0-9-]+(\.[a-z0-9-]+)*(\.[a-z]{2,4})$")
+
+
+def parse_bool_field(value) -> bool:
+    if isinstance(value, bool):
+        return value
+    return str(value or "").strip().lower() in {"1", "true", "yes"}
+
+
+def bulk_format(requested: str | None, content_type: str | None) -> str:
+    fmt = (requested or "").strip().lower()
+    if not fmt:
+        fmt = "csv" if "csv" in (content_type or "") else "ndjson"
+    if fmt not in {"csv", "ndjson"}:
+        raise HTTPException(400, "format must be csv or ndjson")
+    return fmt
+
+
+async def iter_request_lines(request: Request, gzipped: bool = False, max_line_bytes: int | None = None):
+    decompressor = zlib.decompressobj(wbits=31) if gzipped else None
+    buffer = b""
+    async for chunk in request.stream():
+        while chunk:
+            if decompressor is not None:
+                # Inflate in bounded steps so a small upload cannot balloon in memory.
+                data = decompressor.decompress(chunk, 1024 * 1024)
+                chunk = decompressor.unconsumed_tail
+            else:
+                data, chunk = chunk, b""
+            buffer += data
+            *lines, buffer = buffer.split(b"\n")
+            if max_line_bytes is not None and max(len(buffer), *(len(line) for line in lines)) > max_line_bytes:
+                raise HTTPException(400, "Line too long")
+            for line in lines:
+                yield line.decode("utf-8", errors="replace").rstrip("\r")
+    if decompressor is not None:
+        if not decompressor.eof:
+            raise HTTPException(400, "Archive is truncated")
+        buffer += decompressor.flush()
+    if buffer:
+        yield buffer.decode("utf-8", errors="replace").rstrip("\r")
+
+
+async def iter_csv_rows(request: Request):
+    """Yield (line number, row or None) from a CSV request body.
+
+    One csv.reader reads the whole body, so quoted fields may span lines; it
+    runs in a worker thread that pulls lines off the request stream on the
+    event loop. Malformed records come back as None, numbered by the line
+    they start on.
+    """
+    loop = asyncio.get_running_loop()
+    lines = iter_request_lines(request, max_line_bytes=USER_IMPORT_MAX_RECORD_BYTES)
+    record_start = 0
+    record_bytes = 0
+
+    async def read_lines() -> list[str]:
+        batch = []
+        async for line in lines:
+            batch.append(line)
+            if len(batch) >= USER_IMPORT_BATCH_SIZE:
+                break
+        return batch
+
+    def body_lines():
+        nonlocal record_bytes
+        while batch := asyncio.run_coroutine_threadsafe(read_lines(), loop).result():
+            for line in batch:
+                record_bytes += len(line.encode("utf-8")) + 1
+                if record_bytes > USER_IMPORT_MAX_RECORD_BYTES:
+                    raise HTTPException(400, f"Record starting on line {record_start} is too long")
+                yield line + "\n"
+
+    reader = csv.reader(body_lines(), strict=True)
+
+    def read_rows() -> tuple[list[tuple[int, list[str] | None]], bool]:
+        nonlocal record_start, record_bytes
+        rows = []
+        while len(rows) < USER_IMPORT_BATCH_SIZE:
+            record_start, record_bytes = reader.line_num + 1, 0
+            try:
+                row = next(reader)
+            except StopIteration:
+                return rows, True
+            except csv.Error:
+                if record_bytes > csv.field_size_limit():
+                    # The reader gave up partway through an oversized field.
+                    raise HTTPException(400, f"Record starting on line {record_start} is too long")
+                rows.append((record_start, None))
+                continue
+            if row:
+                rows.append((record_start, row))
+        return rows, False
+
+    done = False
+    while not done:
+        rows, done = await asyncio.to_thread(read_rows)
+        for item in rows:
+            yield item
+
+
+async def iter_import_records(request: Request, fmt: str):
+    """Yield (line number, record or None) from a CSV or NDJSON request body."""
+    if fmt == "csv":
+        header = None
+        async for line_no, row in iter_csv_rows(request):
+            if row is None:
+                yield line_no, None
+            elif header is None:
+                header = [name.strip() for name in row]
+            else:
+                yield line_no, dict(zip(header, row))
+        return
 
-    logged_in_user = get_logged_in_user(session)
-    if not logged_in_user or logged_in_user.get("type") not in ["developer", "admin"]:
-        raise HTTPException(403, "You must be logged in as an developer")
+    line_no = 0
+    async for line in iter_request_lines(request, max_line_bytes=USER_IMPORT_MAX_RECORD_BYTES):
+        line_no += 1
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield line_no, record if isinstance(record, dict) else None
 
-    app_list = list(apps.find({}, {"_id": 0}))
-    return {"apps": app_list}
 
+def record_import_error(summary: dict, line_no: int, reason: str) -> None:
+    summary["skipped"] += 1
+    if len(summary["errors"]) < USER_IMPORT_MAX_ERRORS:
+        summary["errors"].append({"line": line_no, "error": reason})
 
-@app.post("/update_object")
-async def update_object(
-    app_name: Annotated[str, Form()],
-    collection_name: Annotated[str, Form()],
-    userId: Annotated[str, Form()],
-    obj: Annotated[str, Form()],
-    session: SessionData = Depends(require_session),
-):
-    apps = db.get_collection("apps")
 
-    if not apps.find_one({"app_name": app_name}):
-        raise HTTPException(404, "App not found")
+def insert_imported_users(app_name: str, docs: list[dict]) -> None:
+    user_col.insert_many(docs, ordered=False)
+    emails = [doc["email"] for doc in docs]
+    object_keys = []
+    target_db = app_db(app_name, write=True)
+    for col in target_db.list_collection_names():
+        if col == "User_Info":
+            continue
+        target_db[col].insert_many([{"userId": email} for email in emails], ordered=False)
+        object_keys.extend(object_version_key(app_name, col, email) for email in emails)
+        object_keys.append(collection_version_key(app_name, col))
+    sync_memberships(*emails)
+    bump_versions(app_version_key(app_name), *(user_version_key(email) for email in emails), *object_keys)
+
+
+async def import_user_batch(app_name: str, rows: list[tuple[int, dict]], summary: dict) -> None:
+    candidates: dict[str, tuple[int, dict]] = {}
+    for line_no, record in rows:
+        email = str(record.get("email") or "").strip()
+        if not EMAIL_PATTERN.match(email):
+            record_import_error(summary, line_no, "Invalid email format")
+            continue
+        if email in candidates:
+            record_import_error(summary, line_no, "Duplicate email in import")
+            continue
+        if (record.get("type") or "user") != "user":
+            record_import_error(summary, line_no, "Only user accounts can be imported")
+            continue
+        hashed = record.get("hashed_password")
+        if hashed and not password_hasher.identify(hashed):
+            record_import_error(summary, line_no, "hashed_password is not an argon2 hash")
+            continue
+        if not hashed and not record.get("password"):
+            record_import_error(summary, line_no, "password or hashed_password is required")
+            continue
+        candidates[email] = (line_no, record)
 
-    target_db = client[app_name]
-    if collection_name not in target_db.list_collection_names():
-        raise HTTPException(404, "Collection does not exist")
+    if not candidates:
+        return
+    existing = await asyncio.to_thread(
+        user_col.distinct, "email", {"email": {"$in": list(candidates)}, "app_name": app_name}
+    )
+    for email in existing:
+        line_no, _ = candidates.pop(email)
+        record_import_error(summary, line_no, "Email already exists")
 
-    collection = target_db[collection_name]
+    hash_slots = asyncio.Semaphore(USER_IMPORT_HASH_CONCURRENCY)
 
-    try:
-        obj_dict = json.loads(obj)
-    except Exception:
-        raise HTTPException(400, "Invalid JSON in obj")
+    async def resolve_hash(record: dict) -> str:
+        if record.get("hashed_password"):
+            return record["hashed_password"]
+        # Share the login path's slots so imports stay inside the argon2 memory budget.
+        async with hash_slots, endpoint_slots["password"]:
+            return await asyncio.to_thread(get_password_hash, str(record["password"]))
 
-    existing = collection.find_one({"userId": userId})
-    if not existing:
-        raise HTTPException(404, "UserId not found in collection")
+    hashes = await asyncio.gather(*(resolve_hash(record) for _, record in candidates.values()))
+    docs = [
+        {
+            "hashed_password": hashed,
+            "email": email,
+            "app_name": app_name,
+            "disabled": parse_bool_field(record.get("disabled")),
+            "apps": [app_name],
+            "type": "user",
+        }
+        for (email, (_, record)), hashed in zip(candidates.items(), hashes)
+    ]
+    if docs:
+        await asyncio.to_thread(insert_imported_users, app_name, docs)
+        summary["imported"] += len(docs)
+
+
+def upsert_imported_objects(app_name: str, rows: list[tuple[int, dict]], summary: dict) -> None:
+    target_db = app_db(app_name, write=True)
+    collections = set(target_db.list_collection_names()) - {"User_Info"}
+    by_collection: dict[str, list[tuple[dict, dict, bool]]] = {}
+    object_keys = []
+    for line_no, record in rows:
+        col = record.get("collection")
+        user_id = record.get("userId")
+        data = record.get("data")
+        if col not in collections:
+            record_import_error(summary, line_no, "Collection does not exist")
+            continue
+        if not isinstance(user_id, str) or not user_id or not isinstance(data, dict):
+            record_import_error(summary, line_no, "Object records need userId and data")
+            continue
+        data = {k: v for k, v in data.items() if k not in {"_id", "userId"}}
+        if not data:
+            continue
+        by_collection.setdefault(col, []).append(({"userId": user_id}, {"$set": data}, True))
+        object_keys.append(object_version_key(app_name, col, user_id))
 
-    collection.update_one({"userId": userId}, {"$set": obj_dict})
-    return {"message": "Object merged into userId successfully"}
+    for col, specs in by_collection.items():
+        bulk_update(target_db[col], specs, ordered=False)
+        summary["objects"] += len(specs)
+        object_keys.append(collection_version_key(app_name, col))
+    bump_versions(*object_keys)
 
 
-@app.post("/fetch_object")
-async def fetch_object(
-    app_name: Annotated[str, Form()],
-    collection_name: Annotated[str, Form()],
-    userId: Annotated[str, Form()],
+@app.post("/my_owned_apps/{app_name}/users/import")
+async def owned_app_import_users(
+    app_name: str,
+    request: Request,
+    format: str | None = None,
     session: SessionData = Depends(require_session),
 ):
-    apps = db.get_collection("apps")
+    normalized_app, _ = require_app_owner_or_admin(app_name, session)
+    if normalized_app == PORTAL_APP:
+        raise HTTPException(400, "Cannot import users into the portal")
+    fmt = bulk_format(format, request.headers.get("content-type"))
+
+    summary = {"imported": 0, "objects": 0, "skipped": 0, "errors": []}
+    users: list[tuple[int, dict]] = []
+    objects: list[tuple[int, dict]] = []
+    async with admission("bulk"):
+        async for line_no, record in iter_import_records(request, fmt):
+            if record is None:
+                record_import_error(summary, line_no, "Invalid record")
+                continue
+            if record.get("kind") == "object":
+                # Stub objects are created with their users, so users go in first.
+                if users:
+                    await import_user_batch(normalized_app, users, summary)
+                    users = []
+                objects.append((line_no, record))
+                if len(objects) >= USER_IMPORT_BATCH_SIZE:
+                    await asyncio.to_thread(upsert_imported_objects, normalized_app, objects, summary)
+                    objects = []
+                continue
+            users.append((line_no, record))
+            if len(users) >= USER_IMPORT_BATCH_SIZE:
+                await import_user_batch(normalized_app, users, summary)
+                users = []
 
-    logged_in_user = get_logged_in_user(session)
-    if not logged_in_user:# or logged_in_user.get("type") not in ["developer", "admin"]:
-        raise HTTPException(403, "You must be logged in")
+        if users:
+            await import_user_batch(normalized_app, users, summary)
+        if objects:
+            await asyncio.to_thread(upsert_imported_objects, normalized_app, objects, summary)
 
-    if not user_has_app_access(logged_in_user, app_name):
-        raise HTTPException(403, "You must be a developer or user of this app")
+    return summary
 
-    if not apps.find_one({"app_name": app_name}):
-        raise HTTPException(404, "App not found")
 
-    target_db = client[app_name]
-    if collection_name not in target_db.list_collection_names():
-        raise HTTPException(404, "Collection does not exist")
+def chunk_lines(lines, size: int = USER_EXPORT_CHUNK_BYTES):
+    buffer: list[str] = []
+    buffered = 0
+    for line in lines:
+        buffer.append(line)
+        buffered += len(line)
+        if buffered >= size:
+            yield "".join(buffer)
+            buffer, buffered = [], 0
+    if buffer:
+        yield "".join(buffer)
 
-    collection = target_db[collection_name]
 
-    doc = collection.find_one({"userId": userId})
-    if not doc:
-        raise HTTPException(404, "UserId not found in collection")
+def export_user_lines(
+    app_name: str,
+    fmt: str,
+    include_objects: bool,
+    include_password_hashes: bool,
+    session: SessionData | None = None,
+):
+    fields = ["email", "type", "disabled"] + (["hashed_password"] if include_password_hashes else [])
+    users = iter_app_members(
+        app_name, {"_id": 0, **{f: 1 for f in fields}}, read_preference=READ_PREFERENCES["analytics"]
+    )
 
-    doc.pop("_id", None)
-    return doc
+    if fmt == "csv":
+        out = io.StringIO()
+        writer = csv.writer(out, lineterminator="\n")
+        writer.writerow(fields)
+        for doc in users:
+            writer.writerow(
+                [str(doc.get(f, False)).lower() if f == "disabled" else doc.get(f, "") for f in fields]
+            )
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate()
+        yield out.getvalue()
+        return
+
+    for doc in users:
+        doc["disabled"] = bool(doc.get("disabled", False))
+        yield json.dumps({f: doc.get(f) for f in fields}, default=str) + "\n"
+    if not include_objects:
+        return
+    with app_reads(app_name, "analytics", session) as (target_db, client_session):
+        for col in sorted(target_db.list_collection_names(session=client_session)):
+            if col == "User_Info":
+                continue
+            for doc in target_db[col].find({}, {"_id": 0}, session=client_session).batch_size(1000):
+                user_id = doc.pop("userId", None)
+                record = {"kind": "object", "collection": col, "userId": user_id, "data": doc}
+                yield json.dumps(record, default=str) + "\n"
 
 
-@app.post("/delete_app")
-async def delete_app(
-    admin_password: Annotated[str, Form()],
-    app_name: Annotated[str, Form()],
-    response: Response,
+@app.post("/my_owned_apps/{app_name}/users/export")
+async def owned_app_export_users(
+    app_name: str,
+    format: Annotated[str, Form()] = "ndjson",
+    include_objects: Annotated[bool | None, Form()] = None,
+    include_password_hashes: Annotated[bool, Form()] = False,
+    admin_password: Annotated[str | None, Form()] = None,
     session: SessionData = Depends(require_session),
 ):
-    logged_in_user = get_logged_in_user(session)
-    if not logged_in_user or logged_in_user.get("type") not in ["developer", "admin"]:
-        raise HTTPException(403, "You must be logged in as an developer")
+    normalized_app, logged_in_user = require_app_owner_or_admin(app_name, session)
+    fmt = bulk_format(format, None)
+    if fmt == "csv" and include_objects:
+        raise HTTPException(400, "include_objects is only supported for NDJSON exports")
+    include_objects = include_objects is not False
+    if include_password_hashes:
+        if logged_in_user.get("type") != "admin":
+            raise HTTPException(403, "Only admins can export password hashes")
+        await require_admin_password(session, admin_password)
+
+    media_type = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        chunk_lines(export_user_lines(normalized_app, fmt, include_objects, include_password_hashes, session)),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{normalized_app}-users.{fmt}"'},
+    )
 
-    admin_user = user_col.find_one({"email": "admin"})
-    if not verify_password(admin_password, admin_user["hashed_password"]):
-        raise HTTPException(status_code=401, detail="Incorrect admin password")
 
-    if not user_has_app_access(logged_in_user, app_name):
-        raise HTTPException(403, "You must be a developer of this app")
+APP_ARCHIVE_FORMAT = 1
+APP_ARCHIVE_BATCH_SIZE = 1000
+APP_ARCHIVE_BATCH_BYTES = 8 * 1024 * 1024
+APP_ARCHIVE_MAX_LINE_BYTES = 20 * 1024 * 1024
+APP_ARCHIVE_INDEX_OPTIONS = {"name", "unique", "sparse", "expireAfterSeconds", "partialFilterExpression"}
+# App settings a metadata restore may carry over. Placement (storage, cluster),
+# migration state and ownership always stay as they are on the live app.
+APP_ARCHIVE_SETTINGS = {"limits", "aggregation_policy"}
 
-    normalized_app = app_name.strip().lower()
-    if normalized_app in RESERVED_DB_NAMES or normalized_app == PORTAL_APP:
-        raise HTTPException(400, "This app cannot be deleted")
 
-    if not app_name_exists(normalized_app):
-        raise HTTPException(404, "App not found")
+def archive_line(record: dict) -> str:
+    # Canonical extended JSON keeps ObjectIds, dates and number types intact.
+    return json_util.dumps(record, json_options=json_util.CANONICAL_JSON_OPTIONS) + "\n"
 
-    delete_app_data_and_membership(normalized_app)
 
-    return {"message": "App and associated data deleted successfully"}
+def gzip_chunks(lines, size: int = USER_EXPORT_CHUNK_BYTES):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    pending: list[bytes] = []
+    pending_bytes = 0
+    for line in lines:
+        data = compressor.compress(line.encode("utf-8"))
+        if data:
+            pending.append(data)
+            pending_bytes += len(data)
+        if pending_bytes >= size:
+            yield b"".join(pending)
+            pending, pending_bytes = [], 0
+    pending.append(compressor.flush())
+    yield b"".join(pending)
 
-@app.post("/list_objects")
-async def list_objects(
-    app_name: Annotated[str, Form()],
-    collection_name: Annotated[str, Form()],
+
+def export_app_archive_lines(app_name: str, include_members: bool, session: SessionData | None = None):
+    yield archive_line(
+        {
+            "kind": "archive",
+            "format": APP_ARCHIVE_FORMAT,
+            "app_name": app_name,
+            "created_at": utcnow(),
+            "members": include_members,
+        }
+    )
+    app_doc = db.get_collection("apps").find_one({"app_name": app_name}, {"_id": 0})
+    yield archive_line({"kind": "app", "doc": app_doc or {}})
+    for domain_doc in db.get_collection("app_domains").find({"app_name": app_name}, {"_id": 0}):
+        yield archive_line({"kind": "domain", "doc": domain_doc})
+    if include_members:
+        for member in iter_app_members(app_name, {"_id": 0}, APP_ARCHIVE_BATCH_SIZE):
+            yield archive_line({"kind": "member", "doc": member})
+
+    with app_reads(app_name, "analytics", session) as (target_db, client_session):
+        for col in sorted(target_db.list_collection_names(session=client_session)):
+            indexes = [
+                {k: v for k, v in index.items() if k == "key" or k in APP_ARCHIVE_INDEX_OPTIONS}
+                for index in target_db[col].list_indexes()
+                if index.get("name") != "_id_"
+            ]
+            yield archive_line({"kind": "collection", "name": col, "indexes": indexes})
+            for doc in target_db[col].find({}, session=client_session).batch_size(APP_ARCHIVE_BATCH_SIZE):
+                yield archive_line({"kind": "document", "collection": col, "doc": doc})
+
+
+@app.post("/my_owned_apps/{app_name}/export")
+async def owned_app_export_archive(
+    app_name: str,
+    include_members: Annotated[bool, Form()] = False,
+    admin_password: Annotated[str | None, Form()] = None,
     session: SessionData = Depends(require_session),
 ):
-    apps = db.get_collection("apps")
+    normalized_app, logged_in_user = require_app_owner_or_admin(app_name, session)
+    if include_members:
+        if logged_in_user.get("type") != "admin":
+            raise HTTPException(403, "Only admins can export members")
+        await require_admin_password(session, admin_password)
+
+    stamp = utcnow().strftime("%Y%m%dT%H%M%SZ")
+    return StreamingResponse(
+        gzip_chunks(export_app_archive_lines(normalized_app, include_members, session)),
+        media_type="application/gzip",
+        headers={"Content-Disposition": f'attachment; filename="{normalized_app}-{stamp}.ndjson.gz"'},
+    )
 
-    if not apps.find_one({"app_name": app_name}):
-        raise HTTPException(404, "App not found")
 
-    target_db = client[app_name]
-    if collection_name not in target_db.list_collection_names():
-        raise HTTPException(404, "Collection does not exist")
+def valid_archive_collection_name(name) -> bool:
+    return isinstance(name, str) and bool(name) and "$" not in name and not name.startswith("system.")
+
+
+class AppArchiveRestore:
+    """Applies archive records to one app, buffering documents into insert_many batches."""
+
+    def __init__(self, app_name: str, replace: bool, restore_metadata: bool):
+        self.app_name = app_name
+        self.replace = replace
+        self.restore_metadata = restore_metadata
+        self.target_db = app_db(app_name, write=True)
+        self.pending: dict[str, list[dict]] = {}
+        self.pending_bytes = 0
+        self.indexes: dict[str, list[dict]] = {}
+        self.summary = {"collections": 0, "documents": 0, "duplicates": 0, "members": 0, "domains": 0, "errors": []}
+
+    def error(self, message: str) -> None:
+        if len(self.summary["errors"]) < USER_IMPORT_MAX_ERRORS:
+            self.summary["errors"].append(message)
+
+    def apply(self, record: dict) -> None:
+        kind = record.get("kind")
+        if kind == "collection":
+            self.start_collection(record)
+        elif kind == "document":
+            self.add_document(record)
+        elif kind in {"app", "domain", "member"} and self.restore_metadata:
+            self.flush()
+            getattr(self, f"restore_{kind}")(record.get("doc") or {})
+
+    def start_collection(self, record: dict) -> None:
+        name = record.get("name")
+        if not valid_archive_collection_name(name):
+            self.error(f"Skipped invalid collection name {name!r}")
+            return
+        self.flush()
+        if self.replace:
+            self.target_db[name].drop()
+            drop_collection_versions(self.app_name, name)
+        if name not in self.target_db.list_collection_names():
+            self.target_db.create_collection(name)
+        self.indexes[name] = [i for i in record.get("indexes", []) if isinstance(i, dict) and i.get("key")]
+        self.summary["collections"] += 1
+
+    def add_document(self, record: dict) -> None:
+        name = record.get("collection")
+        doc = record.get("doc")
+        if name not in self.indexes or not isinstance(doc, dict):
+            self.error(f"Skipped document for unknown collection {name!r}")
+            return
+        self.pending.setdefault(name, []).append(doc)
+        self.pending_bytes += len(bson_encode(doc))
+        if len(self.pending[name]) >= APP_ARCHIVE_BATCH_SIZE or self.pending_bytes >= APP_ARCHIVE_BATCH_BYTES:
+            self.flush()
+
+    def flush(self) -> None:
+        for name, docs in self.pending.items():
+            try:
+                self.target_db[name].insert_many(docs, ordered=False)
+                self.summary["documents"] += len(docs)
+            except BulkWriteError as e:
+                errors = e.details.get("writeErrors", [])
+                duplicates = sum(1 for err in errors if err.get("code") == 11000)
+                self.summary["duplicates"] += duplicates
+                self.summary["documents"] += e.details.get("nInserted", 0)
+                if duplicates < len(errors):
+                    self.error(f"{len(errors) - duplicates} documents in {name} could not be inserted")
+        self.pending.clear()
+        self.pending_bytes = 0
+
+    def restore_app(self, doc: dict) -> None:
+        settings = {k: v for k, v in doc.items() if k in APP_ARCHIVE_SETTINGS and isinstance(v, dict)}
+        if settings:
+            db.get_collection("apps").update_one({"app_name": self.app_name}, {"$set": settings})
+            app_limits_cache.pop(self.app_name, None)
+
+    def restore_domain(self, doc: dict) -> None:
+        url = doc.get("url")
+        app_domains = db.get_collection("app_domains")
+        if not isinstance(url, str) or app_domains.find_one({"url": url}):
+            self.error(f"Skipped domain {url!r}: already assigned")
+            return
+        now = utcnow()
+        app_domains.insert_one({"app_name": self.app_name, "url": url, "created_at": now, "updated_at": now})
+        self.summary["domains"] += 1
 
-    collection = target_db[collection_name]
-    objects = list(collection.find({}, {"_id": 0}))
+    def restore_member(self, doc: dict) -> None:
+        email = doc.get("email")
+        if not isinstance(email, str) or not EMAIL_PATTERN.match(email):
+            return
+        # Existing accounts keep their role: this app's own account first, then
+        # a portal account (developers) that was a member of the archived app.
+        scopes = [{"email": email, "app_name": self.app_name}]
+        if doc.get("app_name") == PORTAL_APP:
+            scopes.append({"email": email, "app_name": PORTAL_APP})
+        existing = next((scope for scope in scopes if user_col.find_one(scope, {"_id": 1})), None)
+        if existing is not None:
+            user_col.update_one(existing, {"$addToSet": {"apps": self.app_name}})
+        else:
+            hashed = doc.get("hashed_password")
+            if not isinstance(hashed, str) or not password_hasher.identify(hashed):
+                self.error(f"Skipped member {email}: no argon2 password hash")
+                return
+            # New accounts are plain users of this app, whatever the archive says.
+            user_col.insert_one(
+                {
+                    "hashed_password": hashed,
+                    "email": email,
+                    "app_name": self.app_name,
+                    "disabled": parse_bool_field(doc.get("disabled")),
+                    "apps": [self.app_name],
+                    "type": "user",
+                }
+            )
+        sync_memberships(email)
+        bump_membership_versions(email, [self.app_name])
+        self.summary["members"] += 1
+
+    def finish(self) -> dict:
+        self.flush()
+        if isinstance(self.target_db, SharedAppDatabase):
+            self.indexes.clear()
+        for name, indexes in self.indexes.items():
+            existing = self.target_db[name].index_information()
+            for index in indexes:
+                options = {k: v for k, v in index.items() if k in APP_ARCHIVE_INDEX_OPTIONS}
+                keys = list(index["key"].items())
+                index_name = options.setdefault("name", "_".join(f"{field}_{direction}" for field, direction in keys))
+                if index_name in existing:
+                    # Same name and spec is a no-op; a different spec still reports below.
+                    try:
+                        self.target_db[name].create_index(keys, **options)
+                    except OperationFailure as e:
+                        self.error(f"Index {index_name} on {name} was not restored: {e}")
+                    continue
+                # Restored indexes count toward APP_INDEX_QUOTA like ones created by hand.
+                try:
+                    reserve_app_index(self.app_name, name, index_name)
+                except HTTPException as e:
+                    self.error(f"Index {index_name} on {name} was not restored: {e.detail}")
+                    continue
+                try:
+                    self.target_db[name].create_index(keys, **options)
+                except OperationFailure as e:
+                    finish_app_index_build(self.app_name, name, index_name, str(e))
+                    self.error(f"Index {index_name} on {name} was not restored: {e}")
+                else:
+                    finish_app_index_build(self.app_name, name, index_name)
+        bump_versions(app_version_key(self.app_name), collections_version_key(self.app_name))
+        if self.summary["domains"]:
+            reload_allowed_origins()
+        return self.summary
+
+
+@app.post("/my_owned_apps/{app_name}/restore")
+async def owned_app_restore_archive(
+    app_name: str,
+    request: Request,
+    replace: bool = False,
+    restore_metadata: bool = False,
+    session: SessionData = Depends(require_session),
+):
+    normalized_app, logged_in_user = require_app_owner_or_admin(app_name, session)
+    if normalized_app == PORTAL_APP:
+        raise HTTPException(400, "Cannot restore into the portal")
+    if restore_metadata and (logged_in_user.get("type") != "admin" or not session_is_elevated(session)):
+        raise HTTPException(403, "Restoring app metadata and members requires an elevated admin session")
+
+    restore = AppArchiveRestore(normalized_app, replace, restore_metadata)
+    header_seen = False
+    async with admission("bulk"):
+        async for line in iter_request_lines(request, gzipped=True, max_line_bytes=APP_ARCHIVE_MAX_LINE_BYTES):
+            if not line.strip():
+                continue
+            try:
+                record = json_util.loads(line)
+            except (ValueError, TypeError):
+                raise HTTPException(400, "Archive contains an invalid record")
+            if not header_seen:
+                if record.get("kind") != "archive" or record.get("format") != APP_ARCHIVE_FORMAT:
+                    raise HTTPException(400, "Not an app archive")
+                header_seen = True
+                continue
+            await asyncio.to_thread(restore.apply, record)
+        if not header_seen:
+            raise HTTPException(400, "Archive is empty")
+        return await asyncio.to_thread(restore.finish)
 
-    return {"objects": objects}
 
 @app.post("/delete_user")
 async def delete_user(
-    admin_password: Annotated[str, Form()],
     email: Annotated[str, Form()],
     app_name: Annotated[str, Form()],
     response: Response,
+    admin_password: Annotated[str | None, Form()] = None,
     session: SessionData = Depends(require_session),
 ):
     apps = db.get_collection("apps")
@@ -1671,9 +5785,7 @@ async def delete_user(
     if not logged_in_user or logged_in_user.get("type") not in ["developer", "admin"]:
         raise HTTPException(403, "You must be logged in as an developer")
 
-    admin_user = user_col.find_one({"email": "admin"})
-    if not verify_password(admin_password, admin_user["hashed_password"]):
-        raise HTTPException(status_code=401, detail="Incorrect admin password")
+    await require_admin_password(session, admin_password)
 
     if not user_has_app_access(logged_in_user, app_name):
         raise HTTPException(403, "You must be a developer of this app")
@@ -1684,38 +5796,77 @@ async def delete_user(
     if not apps.find_one({"app_name": app_name}):
         raise HTTPException(404, "App not found")
 
-    user = user_col.find_one({"email": email, "$or": [{"app_name": app_name}, {"apps": app_name}]})
+    user = find_app_member(email, app_name)
     if not user:
         raise HTTPException(404, "User not found")
 
-    user_col.delete_one({"email": email, "$or": [{"app_name": app_name}, {"apps": app_name}]})
+    user_col.delete_one({"_id": user["_id"]})
+    sync_memberships(email)
 
-    target_db = client[app_name]
+    object_keys = []
+    target_db = app_db(app_name, write=True)
     for col in target_db.list_collection_names():
         if col in ["User_Info"]:
             continue
         target_db[col].delete_many({"userId": email})
+        object_keys.append(object_version_key(app_name, col, email))
+        object_keys.append(collection_version_key(app_name, col))
 
+    bump_membership_versions(email, user_app_names(user))
+    bump_versions(*object_keys)
     return {"message": "User and associated data deleted successfully"}
 
 
-@app.get("/health")
-async def health_check():
-    return {"status": "ok"}
+@app.post("/admin/apps/{app_name}/limits")
+async def admin_set_app_limits(
+    app_name: str,
+    max_concurrency: Annotated[int | None, Form()] = None,
+    max_queue: Annotated[int | None, Form()] = None,
+    weight: Annotated[int | None, Form()] = None,
+    capabilities: Capabilities = Depends(admin_access),
+    session: SessionData = Depends(require_session),
+):
+    values = {"max_concurrency": max_concurrency, "max_queue": max_queue, "weight": weight}
+    updates = {}
+    for key, value in values.items():
+        if value is None:
+            continue
+        if value < 1 or value > APP_LIMITS_CEILING[key]:
+            raise HTTPException(status_code=400, detail=f"{key} must be 1-{APP_LIMITS_CEILING[key]}")
+        updates[f"limits.{key}"] = value
+    if not updates:
+        raise HTTPException(status_code=400, detail="Nothing to update")
+
+    normalized_app = normalize_existing_app_or_404(app_name)
+    result = db.get_collection("apps").update_one({"app_name": normalized_app}, {"$set": updates})
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="App not found")
+    app_limits_cache.pop(normalized_app, None)
+    return {"message": "App limits updated", "limits": app_limits(normalized_app)}
 
 
-@app.on_event("startup")
-async def startup_event():
-    print("FastAPI app has started.")
+@app.get("/admin/app_metrics")
+async def admin_app_metrics(capabilities: Capabilities = Depends(admin_access)):
+    return {"worker": os.getpid(), "scheduler": app_scheduler.snapshot()}
 
 
-@app.on_event("shutdown")
-async def shutdown_event():
-    print("FastAPI app is shutting down.")
+@app.get("/admin/cache_stats")
+async def admin_cache_stats(capabilities: Capabilities = Depends(admin_access)):
+    return {
+        "object_cache": object_cache.snapshot(),
+        "single_flight": single_flight.snapshot(),
+        "capabilities": capability_cache.snapshot(),
+    }
+
+
+@app.get("/health")
+async def health_check():
+    return {"status": "ok"}
 
 
 @app.post("/reset_password")
-async def reset_password(email: Annotated[str, Form()]):
+async def reset_password(email: Annotated[str, Form()], request: Request):
+    await enforce_rate_limit("reset_password", request, email=email)
     user = user_col.find_one({"email": email})
     if not user:
         raise HTTPException(404, "User not found")
@@ -1742,10 +5893,8 @@ async def reset_password(email: Annotated[str, Form()]):
     msg.attach(MIMEText(text_content, "plain"))
     msg.attach(MIMEText(html_content, "html"))
 
-    context = ssl.create_default_context()
-    with smtplib.SMTP_SSL("smtp.gmail.com", 465, context=context) as server:
-        server.login(sender_email, smtp_password)
-        server.sendmail(sender_email, receiver_email, msg.as_string())
+    async with admission("smtp"):
+        await asyncio.to_thread(send_smtp_message, sender_email, smtp_password, receiver_email, msg)
 
     verification_col.insert_one(
         {"email": email, "auth_code": str(auth_code), "created_at": utcnow()}
@@ -1776,10 +5925,10 @@ async def confirm_reset_password(
 
 @app.post("/transfer_app_ownership")
 async def transfer_app_ownership(
-    admin_password: Annotated[str, Form()],
     app_name: Annotated[str, Form()],
     new_developer_email: Annotated[str, Form()],
     response: Response,
+    admin_password: Annotated[str | None, Form()] = None,
     session: SessionData = Depends(require_session),
 ):
     apps = db.get_collection("apps")
@@ -1788,9 +5937,7 @@ async def transfer_app_ownership(
     if not logged_in_user or logged_in_user.get("type") not in ["developer", "admin"]:
         raise HTTPException(403, "You must be logged in as an developer")
 
-    admin_user = user_col.find_one({"email": "admin"})
-    if not verify_password(admin_password, admin_user["hashed_password"]):
-        raise HTTPException(status_code=401, detail="Incorrect admin password")
+    await require_admin_password(session, admin_password)
 
     if not user_has_app_access(logged_in_user, app_name):
         raise HTTPException(403, "You must be a developer of this app")
@@ -1798,9 +5945,7 @@ async def transfer_app_ownership(
     if not apps.find_one({"app_name": app_name}):
         raise HTTPException(404, "App not found")
 
-    new_developer = user_col.find_one(
-        {"email": new_developer_email, "$or": [{"app_name": app_name}, {"apps": app_name}]}
-    )
+    new_developer = find_app_member(new_developer_email, app_name)
     if not new_developer:
         raise HTTPException(404, "New developer user not found in this app")
 
@@ -1809,9 +5954,23 @@ async def transfer_app_ownership(
         {"$pull": {"apps": app_name}, "$set": {"app_name": PORTAL_APP}},
     )
     user_col.update_one(
-        {"email": new_developer_email, "$or": [{"app_name": app_name}, {"apps": app_name}]},
+        {"_id": new_developer["_id"]},
         {"$addToSet": {"apps": app_name}, "$set": {"app_name": app_name}},
     )
+    sync_memberships(session.email, new_developer_email)
+    apps.update_one(
+        {"app_name": app_name},
+        {
+            "$set": {
+                "created_by": new_developer_email,
+                "owner_email": new_developer_email,
+                "ownership_transferred_at": utcnow(),
+            }
+        },
+    )
+    bump_versions(app_version_key(app_name))
+    bump_membership_versions(session.email, [app_name, *user_app_names(logged_in_user)])
+    bump_membership_versions(new_developer_email, [app_name])
 
     return {"message": "App ownership transferred successfully"}
 
@@ -1830,8 +5989,8 @@ async def admin_dashboard(
     app_stats = []
     for app_doc in apps:
         app_name = app_doc["app_name"]
-        users_count = user_col.count_documents(app_membership_filter(app_name))
-        collections_count = len(client[app_name].list_collection_names())
+        users_count = count_app_members(app_name)
+        collections_count = len(app_db(app_name).list_collection_names())
         app_stats.append(
             {"app_name": app_name, "users": users_count, "collections": collections_count}
         )
@@ -1850,35 +6009,29 @@ async def debug_db():
 
 @app.post("/change_user_type")
 async def change_user_type(
-    admin_password: Annotated[str, Form()],
     target_email: Annotated[str, Form()],
     new_type: Annotated[str, Form()],
     app_name: Annotated[str, Form()],
     response: Response,
+    admin_password: Annotated[str | None, Form()] = None,
     session: SessionData = Depends(require_session),
 ):
     logged_in_user = get_logged_in_user(session)
     if not logged_in_user or logged_in_user.get("type") != "admin":
         raise HTTPException(403, "You must be logged in as an admin")
 
-    admin_user = user_col.find_one({"email": "admin"})
-    if not verify_password(admin_password, admin_user["hashed_password"]):
-        raise HTTPException(status_code=401, detail="Incorrect admin password")
+    await require_admin_password(session, admin_password)
 
     if new_type not in ["admin", "user", "developer"]:
         raise HTTPException(400, "Invalid user type")
 
-    # Original used {"email": target_email, "app": app_name}; use apps list:
-    target_user = user_col.find_one(
-        {"email": target_email, "$or": [{"app_name": app_name}, {"apps": app_name}]}
-    )
+    target_user = find_app_member(target_email, app_name)
     if not target_user:
         raise HTTPException(404, "Target user not found in this app")
 
-    user_col.update_one(
-        {"email": target_email, "$or": [{"app_name": app_name}, {"apps": app_name}]},
-        {"$set": {"type": new_type}},
-    )
+    user_col.update_one({"_id": target_user["_id"]}, {"$set": {"type": new_type}})
+    sync_memberships(target_email)
+    bump_membership_versions(target_email, user_app_names(target_user))
 
     return {"message": "User type updated successfully"}
 
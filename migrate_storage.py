@@ -0,0 +1,40 @@
+"""Move an app between storage modes and/or MongoDB clusters.
+
+Usage:
+    python migrate_storage.py my_app --to shared
+    python migrate_storage.py my_app --to database
+    python migrate_storage.py my_app --cluster east
+    python migrate_storage.py my_app --to shared --cluster default
+
+Writes to the app are refused (503) while its collections are copied; reads
+keep working. Run it with the same MONGODB_URL and MONGODB_CLUSTERS as the API.
+"""
+import argparse
+
+from main import APP_STORAGE_MODES, client, close_cluster_clients, cluster_names, migrate_app_storage
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("app_name")
+    parser.add_argument("--to", choices=sorted(APP_STORAGE_MODES), dest="target_mode")
+    parser.add_argument("--cluster", choices=cluster_names(), dest="target_cluster")
+    parser.add_argument("--batch-size", type=int, default=1000, help="documents per insert_many")
+    args = parser.parse_args()
+    if not args.target_mode and not args.target_cluster:
+        parser.error("pass --to and/or --cluster")
+
+    try:
+        migrate_app_storage(
+            args.app_name.strip().lower(),
+            args.target_mode,
+            args.target_cluster,
+            batch_size=args.batch_size,
+        )
+    finally:
+        close_cluster_clients()
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Run main:app under gunicorn with the settings in gunicorn.conf.py.
+
+Usage:
+    python serve.py                  # start the server
+    python serve.py --print-config   # show the computed settings and exit
+    python serve.py -- --workers 2   # pass extra options through to gunicorn
+
+Send SIGHUP to the master process for a graceful reload. It re-reads
+gunicorn.conf.py and replaces workers one generation at a time, without
+dropping connections.
+"""
+import argparse
+import runpy
+import sys
+from pathlib import Path
+
+CONFIG_PATH = Path(__file__).with_name("gunicorn.conf.py")
+SHOWN_SETTINGS = [
+    "bind",
+    "workers",
+    "worker_class",
+    "backlog",
+    "keepalive",
+    "timeout",
+    "graceful_timeout",
+    "max_requests",
+    "max_requests_jitter",
+    "preload_app",
+    "reload",
+]
+
+
+def print_config() -> None:
+    config = runpy.run_path(str(CONFIG_PATH))
+    print(f"Detected {config['CPUS']:g} CPUs and {config['MEMORY_MB']} MiB of memory.")
+    for name in SHOWN_SETTINGS:
+        print(f"{name} = {config[name]!r}")
+    loop, http = config["event_loop_implementations"]()
+    print(f"loop = {loop!r}")
+    print(f"http = {http!r}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--print-config", action="store_true", help="show the computed settings and exit")
+    parser.add_argument("gunicorn_args", nargs="*", help="extra gunicorn options, after --")
+    args = parser.parse_args()
+
+    if args.print_config:
+        print_config()
+        return
+
+    from gunicorn.app.wsgiapp import WSGIApplication
+
+    sys.argv = ["gunicorn", "--config", str(CONFIG_PATH), *args.gunicorn_args, "main:app"]
+    WSGIApplication("%(prog)s [OPTIONS] [APP_MODULE]").run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""Shared setup for tests that run against real MongoDB deployments.
+
+main.py connects at import time, so the environment is set before it is
+imported. Tests that need a deployment skip when its URL isn't set:
+
+    TEST_MONGODB_URL          the default cluster (a replica set for causal reads)
+    TEST_MONGODB_SECOND_URL   another deployment, registered as cluster "second"
+"""
+import json
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture(scope="session")
+def main():
+    url = os.environ.get("TEST_MONGODB_URL")
+    if not url:
+        pytest.skip("TEST_MONGODB_URL is not set")
+    os.environ["MONGODB_URL"] = url
+    os.environ["RATE_LIMIT_STORE"] = "memory"
+    second = os.environ.get("TEST_MONGODB_SECOND_URL")
+    os.environ["MONGODB_CLUSTERS"] = json.dumps({"second": second} if second else {})
+    import main as main_module
+
+    return main_module
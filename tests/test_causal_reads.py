@@ -0,0 +1,60 @@
+"""Read-your-writes through app_writes/app_reads on a replica set.
+
+Start a replica set with a secondary, e.g. the one in the README's "Read
+preferences" section, then
+
+    TEST_MONGODB_URL="mongodb://localhost:27017,localhost:27018/?replicaSet=rs0" \
+    pytest tests/test_causal_reads.py
+"""
+from datetime import timedelta
+from uuid import uuid4
+
+import pytest
+from pymongo.read_preferences import SecondaryPreferred
+
+
+@pytest.fixture
+def replica_set(main):
+    if not main.client.admin.command("hello").get("setName"):
+        pytest.skip("TEST_MONGODB_URL is not a replica set")
+
+
+@pytest.fixture
+def app_name(main, replica_set, monkeypatch):
+    monkeypatch.setattr(main, "CAUSAL_READS", True)
+    monkeypatch.setitem(main.READ_PREFERENCES, "objects", SecondaryPreferred())
+    name = f"test_{uuid4().hex[:12]}"
+    main.db.get_collection("apps").insert_one({"app_name": name, "created_by": "tests@example.com"})
+    main.app_db(name, write=True)["scores"].insert_one({"userId": "u@example.com", "score": 0})
+    yield name
+    main.db.get_collection("apps").delete_many({"app_name": name})
+    main.drop_app_storage(name)
+
+
+@pytest.fixture
+def session(main):
+    session = main.SessionData(
+        email="u@example.com", session_id=uuid4(), expires_at=main.utcnow() + timedelta(hours=1)
+    )
+    main.session_collection.insert_one({"_id": str(session.session_id)})
+    yield session
+    main.session_collection.delete_one({"_id": str(session.session_id)})
+
+
+def test_secondary_preferred_read_sees_the_users_own_write(main, app_name, session):
+    for score in range(1, 21):
+        with main.app_writes(app_name, session) as (target, client_session):
+            assert client_session is not None
+            target["scores"].update_one({"userId": "u@example.com"}, {"$set": {"score": score}}, session=client_session)
+
+        # The login session carries the write's causal token to the next request.
+        stored = main.session_collection.find_one({"_id": str(session.session_id)})
+        token = stored["causal"]["default"]
+        assert token["operation_time"] is not None
+        session.causal = stored["causal"]
+
+        with main.app_reads(app_name, "objects", session) as (target, client_session):
+            assert client_session is not None
+            assert client_session.operation_time >= token["operation_time"]
+            doc = target["scores"].find_one({"userId": "u@example.com"}, session=client_session)
+        assert doc["score"] == score
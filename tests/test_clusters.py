@@ -0,0 +1,83 @@
+"""App placement across two clusters: routing, migration and name checks.
+
+Start two mongod processes, e.g.
+
+    mongod --port 27018 --dbpath /tmp/mongo-a
+    mongod --port 27019 --dbpath /tmp/mongo-b
+    TEST_MONGODB_URL=mongodb://localhost:27018 \
+    TEST_MONGODB_SECOND_URL=mongodb://localhost:27019 pytest tests/test_clusters.py
+"""
+from uuid import uuid4
+
+import pytest
+
+
+@pytest.fixture
+def second(main):
+    if "second" not in main.MONGODB_CLUSTERS:
+        pytest.skip("TEST_MONGODB_SECOND_URL is not set")
+    return main.cluster_client("second")
+
+
+@pytest.fixture
+def app_name(main, monkeypatch):
+    # Migrations wait out the placement cache; don't make the tests wait too.
+    monkeypatch.setattr(main, "STORAGE_MODE_CACHE_SECONDS", 0)
+    name = f"test_{uuid4().hex[:12]}"
+    yield name
+    main.db.get_collection("apps").delete_many({"app_name": name})
+    main.drop_app_storage(name)
+
+
+def create_app(main, name: str, mode: str = "database", cluster: str = "default") -> None:
+    main.db.get_collection("apps").insert_one(
+        {"app_name": name, "storage": mode, "cluster": cluster, "created_by": "tests@example.com"}
+    )
+    target = main.app_db(name, write=True)
+    target["scores"].insert_many([{"userId": f"u{i}@example.com", "score": i} for i in range(5)])
+    if mode == "database":
+        target["scores"].create_index([("score", -1)], name="score_-1")
+
+
+def test_app_db_routes_to_the_apps_cluster(main, second, app_name):
+    create_app(main, app_name, cluster="second")
+
+    assert main.app_db(app_name).client is second
+    assert app_name in second.list_database_names()
+    assert app_name not in main.client.list_database_names()
+    assert main.app_db(app_name)["scores"].count_documents({}) == 5
+
+
+def test_migrate_database_to_another_cluster(main, second, app_name):
+    create_app(main, app_name)
+
+    main.migrate_app_storage(app_name, target_cluster="second", log=lambda message: None)
+
+    assert main.app_placement(app_name) == ("database", "second", False)
+    target = main.app_db(app_name)
+    assert target.client is second
+    assert target["scores"].count_documents({}) == 5
+    assert "score_-1" in target["scores"].index_information()
+    assert app_name not in main.client.list_database_names()
+
+
+def test_migrate_to_shared_storage_on_another_cluster(main, second, app_name):
+    create_app(main, app_name)
+
+    main.migrate_app_storage(app_name, target_mode="shared", target_cluster="second", log=lambda message: None)
+
+    target = main.app_db(app_name)
+    assert isinstance(target, main.SharedAppDatabase)
+    assert target.list_collection_names() == ["scores"]
+    assert sorted(doc["score"] for doc in target["scores"].find({})) == [0, 1, 2, 3, 4]
+    assert second[main.db.name]["app_objects"].count_documents({"_app": app_name}) == 5
+    assert app_name not in main.client.list_database_names()
+
+
+def test_databases_on_other_clusters_count_as_taken(main, second, app_name):
+    # A legacy database with no apps document, only on the second cluster.
+    second[app_name]["scores"].insert_one({"userId": "u@example.com"})
+
+    assert main.app_name_exists(app_name)
+    assert main.database_exists(app_name)
+    assert app_name in [row["app_name"] for row in main.admin_app_rows()]
@@ -0,0 +1,63 @@
+"""Pick argon2 parameters that hit a target verification latency on this machine.
+
+Usage:
+    python tune_argon2.py --target-ms 250 --max-memory-mb 64 --parallelism 1
+
+Prints the ARGON2_* environment variables to set for main.py.
+"""
+import argparse
+import statistics
+import time
+
+from argon2 import PasswordHasher
+
+MEMORY_STEPS_MB = [19, 32, 46, 64, 96, 128, 192, 256]
+
+
+def measure_verify_ms(time_cost: int, memory_mb: int, parallelism: int, rounds: int) -> float:
+    hasher = PasswordHasher(time_cost=time_cost, memory_cost=memory_mb * 1024, parallelism=parallelism)
+    stored = hasher.hash("benchmark-password")
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        hasher.verify(stored, "benchmark-password")
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def tune(target_ms: float, max_memory_mb: int, parallelism: int, rounds: int, max_time_cost: int):
+    best = None
+    for memory_mb in [m for m in MEMORY_STEPS_MB if m <= max_memory_mb]:
+        for time_cost in range(1, max_time_cost + 1):
+            elapsed = measure_verify_ms(time_cost, memory_mb, parallelism, rounds)
+            print(f"  t={time_cost:<2} m={memory_mb:>3} MiB p={parallelism}: {elapsed:7.1f} ms")
+            if elapsed > target_ms:
+                break
+            # Prefer more memory (harder to attack on GPUs), then more passes.
+            best = (time_cost, memory_mb, elapsed)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target-ms", type=float, default=250.0, help="verification latency budget")
+    parser.add_argument("--max-memory-mb", type=int, default=64, help="memory per hash")
+    parser.add_argument("--parallelism", type=int, default=1)
+    parser.add_argument("--rounds", type=int, default=5, help="verifications per measurement")
+    parser.add_argument("--max-time-cost", type=int, default=10)
+    args = parser.parse_args()
+
+    best = tune(args.target_ms, args.max_memory_mb, args.parallelism, args.rounds, args.max_time_cost)
+    if best is None:
+        print(f"No parameters verify within {args.target_ms} ms; raise --target-ms or lower --max-memory-mb.")
+        return
+
+    time_cost, memory_mb, elapsed = best
+    print(f"\nBest fit ({elapsed:.1f} ms per verification):")
+    print(f"ARGON2_TIME_COST={time_cost}")
+    print(f"ARGON2_MEMORY_COST={memory_mb * 1024}")
+    print(f"ARGON2_PARALLELISM={args.parallelism}")
+
+
+if __name__ == "__main__":
+    main()